@@ -0,0 +1,787 @@
+"""
+Benchmark cho các bước xử lý của Whisper M3U8 Transcriber.
+
+Media dùng để đo được sinh cục bộ bằng FFmpeg (lavfi), không cần mạng.
+
+Ví dụ:
+    python benchmark.py thumbnails --duration 600 --interval 5
+    python benchmark.py hls --duration 300 --latency 0.1
+    python benchmark.py hls --duration 120 --single-file
+    python benchmark.py startup --repeat 5
+    python benchmark.py parallel --duration 1800 --workers 1 2 4 8
+    python benchmark.py memory --durations 1800 7200 21600
+    python benchmark.py live --duration 120 --segment-time 2 --window 10
+    python benchmark.py suite --durations 60 300 --bitrates 500k 2000k -o current.json
+    python benchmark.py compare baseline.json current.json --threshold 10
+"""
+import os
+import re
+import sys
+import json
+import time
+import platform
+import statistics
+import shutil
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+import http.server
+from typing import List, Optional
+
+from rich.console import Console
+from rich.table import Table
+from rich import box
+
+console = Console()
+
+
+def make_test_video(path: str, duration: int, size: str = "1280x720", fps: float = 25) -> str:
+    """Sinh video test (testsrc + sine) bằng lavfi."""
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps:g}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(int(fps * 2)),
+        "-c:a", "aac", "-shortest",
+        path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+# Tín hiệu "giống giọng nói": cao độ dao động, 5s có tiếng + 2s im lặng
+_SPEECH_LIKE_EXPR = "0.3*sin(2*PI*(220+110*sin(2*PI*0.5*t))*t)*lt(mod(t\\,7)\\,5)"
+
+
+def make_test_hls(out_dir: str, duration: int, segment_time: int = 4, size: str = "1280x720",
+                  encrypt: bool = False, source: Optional[str] = None, bitrate: Optional[str] = None,
+                  audio: str = "sine", single_file: bool = False) -> str:
+    """
+    Sinh VOD HLS (testsrc + sine/giống giọng nói, hoặc từ file source) vào out_dir,
+    trả về đường dẫn playlist. bitrate (vd "1000k") cố định bitrate video;
+    single_file: mọi segment nằm trong 1 file, playlist dùng EXT-X-BYTERANGE.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    playlist = os.path.join(out_dir, "index.m3u8")
+    if source:
+        inputs = ["-t", str(duration), "-i", source]
+    else:
+        audio_src = (f"aevalsrc={_SPEECH_LIKE_EXPR}:s=44100:d={duration}" if audio == "speech"
+                     else f"sine=frequency=440:sample_rate=44100:duration={duration}")
+        inputs = [
+            "-f", "lavfi", "-i", f"testsrc=size={size}:rate=25:duration={duration}",
+            "-f", "lavfi", "-i", audio_src,
+        ]
+    rate_args = ["-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate] if bitrate else []
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+    ] + inputs + [
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "50",
+    ] + rate_args + [
+        "-c:a", "aac", "-shortest",
+        "-f", "hls", "-hls_time", str(segment_time), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "segments.ts" if single_file else "seg%05d.ts"),
+    ]
+    if single_file:
+        cmd.extend(["-hls_flags", "single_file"])
+    if encrypt:
+        key_path = os.path.join(out_dir, "enc.key")
+        with open(key_path, "wb") as f:
+            f.write(os.urandom(16))
+        info_path = os.path.join(out_dir, "enc.keyinfo")
+        with open(info_path, "w") as f:
+            f.write(f"enc.key\n{key_path}\n")
+        cmd.extend(["-hls_key_info_file", info_path])
+    cmd.append(playlist)
+    subprocess.run(cmd, check=True)
+    return playlist
+
+
+class _LatencyHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler có keep-alive, hỗ trợ Range (206) và độ trễ giả lập mỗi request."""
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        if start > end:
+            self.send_error(416)
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _LivePlaylistHandler(_LatencyHandler):
+    """
+    Giả lập HLS live từ 1 VOD playlist: /live.m3u8 chỉ chứa các segment đã
+    "phát" (thêm 1 segment mỗi EXTINF giây), có ENDLIST khi đã phát hết.
+    """
+    vod_playlist = "index.m3u8"
+    initial_segments = 3
+    started = 0.0
+
+    def do_GET(self):
+        if not self.path.startswith("/live.m3u8"):
+            return super().do_GET()
+        with open(os.path.join(self.directory, self.vod_playlist), encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        header, segments, pending = [], [], []
+        for line in lines:
+            if line.startswith("#EXTINF") or (not line.startswith("#") and pending):
+                pending.append(line)
+                if not line.startswith("#"):
+                    segments.append(pending)
+                    pending = []
+            elif line.startswith("#EXT-X-KEY"):
+                pending.append(line)
+            elif line not in ("#EXT-X-ENDLIST",) and not line.startswith("#EXT-X-PLAYLIST-TYPE"):
+                header.append(line)
+
+        elapsed = time.time() - self.started
+        available, clock = self.initial_segments, 0.0
+        for seg in segments[self.initial_segments:]:
+            clock += float(seg[-2].split(":")[1].split(",")[0]) if len(seg) >= 2 else 0
+            if clock > elapsed:
+                break
+            available += 1
+        available = min(available, len(segments))
+        body = header + [line for seg in segments[:available] for line in seg]
+        if available == len(segments):
+            body.append("#EXT-X-ENDLIST")
+        data = ("\n".join(body) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_directory(directory: str, latency: float = 0.0):
+    """Chạy HTTP server cục bộ phục vụ directory, trả về (server, base_url)."""
+    handler = type("Handler", (_LatencyHandler,), {"latency": latency})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def _time_call(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+_SHOWINFO_PTS = re.compile(r"pts_time:\s*([-\d.]+)")
+
+
+def _showinfo_times(cmd: List[str]) -> List[float]:
+    """Chạy ffmpeg có filter showinfo, trả về pts_time của các frame đi qua filter."""
+    proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return [float(m.group(1)) for line in proc.stderr.splitlines()
+            if "Parsed_showinfo" in line and (m := _SHOWINFO_PTS.search(line))]
+
+
+def sprite_frame_times(video_path: str, interval: int, count: int) -> tuple:
+    """
+    Timestamp frame được chọn cho từng thumbnail: (single-pass, seek).
+
+    single-pass dùng đúng filter select của main; seek dùng -ss chính xác
+    (giữ timestamp gốc bằng -copyts) như _build_sprite_per_seek.
+    """
+    import main
+    single = _showinfo_times([
+        "ffmpeg", "-v", "info", "-copyts", "-an", "-i", video_path,
+        "-vf", f"{main._sprite_select_filter(interval)},showinfo", "-fps_mode", "vfr",
+        "-frames:v", str(count), "-f", "null", "-",
+    ])
+    seek = []
+    for i in range(count):
+        times = _showinfo_times([
+            "ffmpeg", "-v", "info", "-copyts", "-ss", str(i * interval), "-an", "-i", video_path,
+            "-vf", "showinfo", "-vframes", "1", "-f", "null", "-",
+        ])
+        seek.extend(times[:1])
+    return single, seek
+
+
+def bench_thumbnails(args) -> None:
+    """So sánh tạo sprite sheet: single-pass vs seek từng thumbnail (thời gian + frame được chọn)."""
+    import main
+
+    work_dir = tempfile.mkdtemp(prefix="wmt_bench_")
+    try:
+        video_path = os.path.join(work_dir, "video.mp4")
+        with console.status(f"[bold cyan]Đang sinh video test ({args.duration}s, {args.fps:g} fps)..."):
+            make_test_video(video_path, args.duration, fps=args.fps)
+
+        # Kiểm tra đúng đắn: 2 cách phải chọn cùng frame cho mỗi ô (không trôi theo thời gian)
+        count = args.duration // args.interval
+        with console.status(f"[bold cyan]Đang so sánh timestamp {count} thumbnails..."):
+            single, seek = sprite_frame_times(video_path, args.interval, count)
+        tolerance = 0.5 / args.fps
+        drift = max((abs(a - b) for a, b in zip(single, seek)), default=0.0)
+        if len(single) != len(seek) or drift > tolerance:
+            console.print(f"[bold red]✗ Frame khác nhau giữa single-pass và seek:[/bold red] "
+                          f"{len(single)} / {len(seek)} frames, lệch tối đa {drift * 1000:.1f} ms")
+            sys.exit(1)
+        console.print(f"[green]✓ single-pass và seek chọn cùng frame cho {count} thumbnails[/green] "
+                      f"[dim](lệch tối đa {drift * 1000:.1f} ms)[/dim]")
+
+        results = []
+        for mode in args.modes:
+            timings: List[float] = []
+            for _ in range(args.repeat):
+                out_dir = os.path.join(work_dir, mode)
+                shutil.rmtree(out_dir, ignore_errors=True)
+                timings.append(_time_call(
+                    main.extract_thumbnails, video_path, out_dir,
+                    args.interval, 160, 90, 10, args.format, mode
+                ))
+            results.append((mode, min(timings), sum(timings) / len(timings)))
+
+        table = Table(title=f"[bold cyan]Sprite sheet ({args.duration}s, mỗi {args.interval}s)[/bold cyan]", box=box.ROUNDED)
+        table.add_column("Mode", style="cyan")
+        table.add_column("Tốt nhất (s)", style="green", justify="right")
+        table.add_column("Trung bình (s)", style="yellow", justify="right")
+        table.add_column("So với nhanh nhất", style="magenta", justify="right")
+        fastest = min(r[1] for r in results)
+        for mode, best, avg in results:
+            table.add_row(mode, f"{best:.2f}", f"{avg:.2f}", f"x{best / fastest:.1f}")
+        console.print(table)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def stream_hashes(path: str) -> List[str]:
+    """MD5 dữ liệu packet của từng stream (không decode), vd ['0,v,MD5=...', '1,a,MD5=...']."""
+    proc = subprocess.run([
+        "ffmpeg", "-v", "error", "-i", path, "-map", "0", "-c", "copy",
+        "-f", "streamhash", "-hash", "md5", "-",
+    ], capture_output=True, text=True, check=True)
+    return proc.stdout.split()
+
+
+def _media_duration(path: str) -> float:
+    proc = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+    ], capture_output=True, text=True, check=True)
+    return float(proc.stdout.strip() or 0)
+
+
+def bench_hls(args) -> None:
+    """So sánh tải HLS: ffmpeg tuần tự vs native fetcher song song (kèm kiểm tra output giống nhau)."""
+    import main
+
+    work_dir = tempfile.mkdtemp(prefix="wmt_bench_")
+    server = None
+    try:
+        hls_dir = os.path.join(work_dir, "hls")
+        with console.status(f"[bold cyan]Đang sinh HLS test ({args.duration}s)..."):
+            make_test_hls(hls_dir, args.duration, args.segment_time, encrypt=args.encrypt,
+                          single_file=args.single_file)
+        server, base_url = serve_directory(hls_dir, args.latency)
+        url = base_url + "index.m3u8"
+
+        results = []
+        for downloader in args.downloaders:
+            out_path = os.path.join(work_dir, f"{downloader}.mp4")
+            elapsed = _time_call(main.download_from_m3u8, url, out_path, downloader, args.workers)
+            size = os.path.getsize(out_path) if os.path.exists(out_path) else 0
+            results.append((downloader, elapsed, size))
+
+        # Kiểm tra đúng đắn: cùng là copy stream nên packet của native và ffmpeg phải trùng khớp
+        if {"ffmpeg", "native"} <= set(args.downloaders):
+            ffmpeg_path = os.path.join(work_dir, "ffmpeg.mp4")
+            native_path = os.path.join(work_dir, "native.mp4")
+            ffmpeg_dur, native_dur = _media_duration(ffmpeg_path), _media_duration(native_path)
+            ffmpeg_hash, native_hash = stream_hashes(ffmpeg_path), stream_hashes(native_path)
+            if ffmpeg_hash != native_hash or abs(ffmpeg_dur - native_dur) > 0.1:
+                console.print(f"[bold red]✗ Output native khác ffmpeg:[/bold red] "
+                              f"duration {native_dur:.2f}s / {ffmpeg_dur:.2f}s")
+                for ffmpeg_line, native_line in zip(ffmpeg_hash, native_hash):
+                    mark = "✓" if ffmpeg_line == native_line else "✗"
+                    console.print(f"   {mark} ffmpeg {ffmpeg_line}\n     native {native_line}")
+                sys.exit(1)
+            console.print(f"[green]✓ native và ffmpeg cho cùng stream hash[/green] "
+                          f"[dim](duration {native_dur:.2f}s)[/dim]")
+
+        table = Table(title=f"[bold cyan]Tải HLS ({args.duration}s, latency {args.latency * 1000:.0f}ms)[/bold cyan]", box=box.ROUNDED)
+        table.add_column("Downloader", style="cyan")
+        table.add_column("Thời gian (s)", style="green", justify="right")
+        table.add_column("Kích thước (MB)", style="yellow", justify="right")
+        for downloader, elapsed, size in results:
+            table.add_row(downloader, f"{elapsed:.2f}", f"{size / 1024 / 1024:.1f}")
+        console.print(table)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def make_test_speech_audio(path: str, duration: int) -> str:
+    """Sinh audio 16kHz mono: 5s tín hiệu + 2s im lặng lặp lại (có khoảng lặng để chia chunk)."""
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"aevalsrc={_SPEECH_LIKE_EXPR}:s=16000:d={duration}",
+        "-ac", "1", "-acodec", "pcm_s16le", path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+_MAIN_DIR = os.path.dirname(os.path.abspath(__file__))
+_HEAVY_MODULES = ("torch", "whisper", "numpy")
+
+# Mỗi entry path: đoạn code chạy trong 1 process Python mới
+_STARTUP_PATHS = {
+    "import": "import main",
+    "help": "import sys, main; sys.argv = ['main.py', '--help']\ntry:\n    main._main()\nexcept SystemExit:\n    pass",
+    "checkpoint": "import main; main.list_checkpoints()",
+    "thumbnails": "import main; main.plan_item; main.extract_thumbnails; main.create_thumbnail_vtt",
+    "transcribe": "import main, whisper",
+}
+
+
+def _run_startup_path(code: str) -> tuple:
+    """Chạy code trong process mới, trả về (thời gian, các module nặng đã được import)."""
+    probe = code + f"\nimport sys, json\nprint(json.dumps([m for m in {_HEAVY_MODULES!r} if m in sys.modules]), file=sys.stderr)"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_MAIN_DIR, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory(prefix="wmt_bench_") as work_dir:  # Không tạo checkpoint DB trong thư mục hiện tại
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", probe], cwd=work_dir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return elapsed, json.loads(proc.stderr.strip().splitlines()[-1])
+
+
+def bench_startup(args) -> None:
+    """Đo thời gian khởi động (import) của từng entry path."""
+    baseline = min(_run_startup_path("pass")[0] for _ in range(args.repeat))
+
+    table = Table(title="[bold cyan]Thời gian khởi động[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Entry path", style="cyan")
+    table.add_column("Tốt nhất (s)", style="green", justify="right")
+    table.add_column("Trừ Python (s)", style="yellow", justify="right")
+    table.add_column("Module nặng", style="magenta")
+    for name in args.paths:
+        try:
+            runs = [_run_startup_path(_STARTUP_PATHS[name]) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            table.add_row(name, "-", "-", f"[red]{e}[/red]")
+            continue
+        best = min(r[0] for r in runs)
+        table.add_row(name, f"{best:.3f}", f"{best - baseline:.3f}", ", ".join(runs[0][1]) or "[dim]-[/dim]")
+    console.print(table)
+    console.print(f"[dim]Python trống: {baseline:.3f}s[/dim]")
+
+
+def bench_live(args) -> None:
+    """Đo độ trễ end-to-end của chế độ live trên luồng HLS giả lập."""
+    import main
+
+    work_dir = tempfile.mkdtemp(prefix="wmt_bench_")
+    server = None
+    try:
+        hls_dir = os.path.join(work_dir, "hls")
+        with console.status(f"[bold cyan]Đang sinh HLS test ({args.duration}s)..."):
+            make_test_hls(hls_dir, args.duration, args.segment_time, size="320x180", source=args.input)
+        handler = type("Handler", (_LivePlaylistHandler,), {"started": time.time()})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=hls_dir))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/live.m3u8"
+
+        vtt_path = os.path.join(work_dir, "live.vtt")
+        stats = main.transcribe_live(url, vtt_path, args.model, args.language, args.profile,
+                                     not args.no_gpu, args.window)
+
+        table = Table(title=f"[bold cyan]Live ({args.duration}s, segment {args.segment_time}s, "
+                            f"cửa sổ {args.window:.0f}s)[/bold cyan]", box=box.ROUNDED)
+        table.add_column("Chỉ số", style="cyan")
+        table.add_column("Giá trị", style="green", justify="right")
+        table.add_row("Cửa sổ", str(stats["windows"]))
+        table.add_row("Cues", str(stats["cues"]))
+        for key in ("latency_p50", "latency_p95", "latency_max"):
+            if key in stats:
+                table.add_row(key.replace("latency_", "Độ trễ "), f"{stats[key]:.2f}s")
+        console.print(table)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def bench_parallel(args) -> None:
+    """Đo tốc độ nhận dạng song song trên CPU theo số process."""
+    import main
+    import whisper
+
+    work_dir = tempfile.mkdtemp(prefix="wmt_bench_")
+    try:
+        audio_path = args.input
+        if not audio_path:
+            audio_path = os.path.join(work_dir, "audio.wav")
+            with console.status(f"[bold cyan]Đang sinh audio test ({args.duration}s)..."):
+                make_test_speech_audio(audio_path, args.duration)
+        audio = whisper.load_audio(audio_path)
+        main.get_model(args.model, "cpu", "float32")  # Tải model trước, không tính vào thời gian đo
+
+        results = []
+        for workers in args.workers:
+            elapsed = _time_call(main.transcribe_audio, audio, args.model, args.language,
+                                 use_gpu=False, cpu_workers=workers)
+            main.shutdown_cpu_pools()
+            results.append((workers, elapsed))
+
+        baseline = next((t for w, t in results if w == 1), results[0][1])
+        table = Table(title=f"[bold cyan]Nhận dạng song song trên CPU ({len(audio) // 16000}s audio, "
+                            f"{os.cpu_count()} cores, model {args.model})[/bold cyan]", box=box.ROUNDED)
+        table.add_column("Process", style="cyan", justify="right")
+        table.add_column("Thời gian (s)", style="green", justify="right")
+        table.add_column("Tăng tốc", style="yellow", justify="right")
+        table.add_column("Hiệu suất/process", style="magenta", justify="right")
+        for workers, elapsed in results:
+            speedup = baseline / elapsed
+            table.add_row(str(workers), f"{elapsed:.1f}", f"x{speedup:.2f}", f"{speedup / workers * 100:.0f}%")
+        console.print(table)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def write_spilled_pcm(path: str, duration: int) -> None:
+    """Ghi PCM float32 16kHz dạng file spill của PcmBuffer: 5s tín hiệu + 2s im lặng lặp lại."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    pattern = np.concatenate([np.ones(5 * 16000, dtype=np.float32), np.zeros(2 * 16000, dtype=np.float32)])
+    with open(path, "wb") as f:
+        for start in range(0, duration, 70):
+            seconds = min(70, duration - start)
+            envelope = np.tile(pattern, 10)[:seconds * 16000]
+            (rng.standard_normal(len(envelope), dtype=np.float32) * 0.1 * envelope).tofile(f)
+
+
+# Chạy trong process riêng: peak RSS (ru_maxrss) chỉ tính cho lần đo này.
+# Model rỗng (không decode) để chỉ đo đường dữ liệu: hash cache + đọc PCM + chia cửa sổ
+_MEMORY_PROBE = """
+import json, resource, sys
+import numpy as np
+import main
+
+class _NullModel:
+    def decode(self, *args, **kwargs):
+        pass
+
+    def transcribe(self, audio, **kwargs):
+        seconds = len(audio) / 16000
+        return {{"text": " x", "language": "en", "segments": [{{"start": 0.0, "end": seconds, "text": " x"}}]}}
+
+if {model!r} == "null":
+    main.get_model = lambda *args, **kwargs: _NullModel()
+    main.resolve_device = lambda use_gpu: "cpu"
+main.console.quiet = True
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+audio = np.memmap({path!r}, dtype=np.float32, mode="c")
+main.transcribe_audio(audio, {model!r}, "en", use_gpu=False, window_seconds={window!r})
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"baseline_kb": baseline, "peak_kb": peak}}), file=sys.stderr)
+"""
+
+
+def bench_memory(args) -> None:
+    """Peak RSS khi nhận dạng PCM đã spill theo cửa sổ, theo độ dài audio (cache kết quả bật)."""
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        console.print("[bold red]LỖI:[/bold red] Benchmark memory cần module resource (Linux/macOS)")
+        sys.exit(1)
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_MAIN_DIR, os.environ.get("PYTHONPATH")])))
+    # macOS báo ru_maxrss theo bytes, Linux theo KB
+    unit = 1 if sys.platform == "darwin" else 1024
+    results = []
+    for duration in args.durations:
+        with tempfile.TemporaryDirectory(prefix="wmt_bench_") as work_dir:  # Cache kết quả ghi vào đây
+            pcm_path = os.path.join(work_dir, "audio.pcm.spill")
+            with console.status(f"[bold cyan]Đang sinh PCM {duration}s..."):
+                write_spilled_pcm(pcm_path, duration)
+            code = _MEMORY_PROBE.format(model=args.model, path=pcm_path, window=args.window_seconds)
+            with console.status(f"[bold cyan]Đang đo {duration}s..."):
+                proc = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                console.print(f"[bold red]LỖI ({duration}s):[/bold red] {proc.stderr.strip()[-500:]}")
+                sys.exit(1)
+            usage = json.loads(proc.stderr.strip().splitlines()[-1])
+            results.append((duration, os.path.getsize(pcm_path),
+                            usage["baseline_kb"] * unit, usage["peak_kb"] * unit))
+
+    table = Table(title=f"[bold cyan]Peak RSS theo độ dài audio (cửa sổ {args.window_seconds:g}s, model {args.model})[/bold cyan]",
+                  box=box.ROUNDED)
+    table.add_column("Audio", style="cyan", justify="right")
+    table.add_column("PCM (MB)", style="yellow", justify="right")
+    table.add_column("Peak RSS (MB)", style="green", justify="right")
+    table.add_column("Tăng sau import (MB)", style="magenta", justify="right")
+    for duration, pcm_bytes, baseline, peak in results:
+        table.add_row(f"{duration / 3600:.2f} h", f"{pcm_bytes / 1024 / 1024:.0f}",
+                      f"{peak / 1024 / 1024:.0f}", f"{(peak - baseline) / 1024 / 1024:.0f}")
+    console.print(table)
+
+    if len(results) > 1:
+        (d0, _, b0, p0), (d1, _, b1, p1) = results[0], results[-1]
+        slope = ((p1 - b1) - (p0 - b0)) / 1024 / 1024 / ((d1 - d0) / 3600)
+        console.print(f"[dim]RSS tăng thêm ~{slope:.0f} MB cho mỗi giờ audio "
+                      f"(PCM: {16000 * 4 * 3600 / 1024 / 1024:.0f} MB/giờ)[/dim]")
+
+
+SUITE_STAGES = ["download", "extract_audio", "transcribe", "thumbnails", "thumbnail_vtt"]
+_SUITE_DEPENDS = {"download": None, "extract_audio": "download", "transcribe": "extract_audio",
+                  "thumbnails": "download", "thumbnail_vtt": "thumbnails"}
+
+
+def _suite_meta(args) -> dict:
+    """Thông tin môi trường để biết 2 file kết quả có so sánh được với nhau không."""
+    def output(cmd: List[str]) -> str:
+        try:
+            out = subprocess.run(cmd, capture_output=True, text=True, cwd=_MAIN_DIR).stdout
+        except OSError:
+            return ""
+        return out.strip().splitlines()[0] if out.strip() else ""
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": output(["git", "rev-parse", "--short", "HEAD"]),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": output(["ffmpeg", "-version"]),
+        "args": {k: v for k, v in vars(args).items() if k != "func"},
+    }
+
+
+def bench_suite(args) -> None:
+    """
+    Đo các bước chính trên ma trận media sinh cục bộ (độ dài x bitrate), phục vụ qua
+    HTTP cục bộ, rồi ghi kết quả ra JSON để so sánh bằng lệnh compare.
+    """
+    import main
+
+    main.set_result_cache_limit(0)  # Luôn đo nhận dạng thật
+    if "transcribe" in args.stages:
+        with console.status(f"[bold cyan]Đang tải model {args.model}..."):
+            main.get_model(args.model, "cpu", "float32")  # Không tính thời gian tải model
+
+    # Các bước không được chọn nhưng là đầu vào của bước được chọn vẫn phải chạy
+    needed = set()
+    for stage in args.stages:
+        while stage and stage not in needed:
+            needed.add(stage)
+            stage = _SUITE_DEPENDS[stage]
+
+    work_dir = tempfile.mkdtemp(prefix="wmt_bench_")
+    server = None
+    results = []
+    try:
+        server, base_url = serve_directory(work_dir, args.latency)
+        for duration in args.durations:
+            for bitrate in args.bitrates:
+                case = f"{duration}s_{bitrate}"
+                case_dir = os.path.join(work_dir, case)
+                with console.status(f"[bold cyan]Đang sinh HLS test {case}..."):
+                    make_test_hls(os.path.join(case_dir, "hls"), duration, args.segment_time,
+                                  bitrate=bitrate, audio=args.audio)
+                url = f"{base_url}{case}/hls/index.m3u8"
+                video_path = os.path.join(case_dir, "video.mp4")
+                audio_path = os.path.join(case_dir, "audio.wav")
+                thumbs_dir = os.path.join(case_dir, "thumbs")
+                state = {}
+
+                # Thứ tự cố định: bước sau dùng kết quả của bước trước
+                calls = {
+                    "download": lambda: main.download_from_m3u8(url, video_path, args.downloader, args.workers, 3, False),
+                    "extract_audio": lambda: main.extract_audio(video_path, audio_path),
+                    "transcribe": lambda: main.transcribe_audio(audio_path, args.model, args.language, use_gpu=False),
+                    "thumbnails": lambda: state.update(sprite=main.extract_thumbnails(
+                        video_path, thumbs_dir, args.interval, 160, 90, 10, "webp", "single-pass")),
+                    "thumbnail_vtt": lambda: main.create_thumbnail_vtt(
+                        state.get("sprite") or {}, os.path.join(thumbs_dir, "thumbnails.vtt"), args.interval),
+                }
+                for stage in SUITE_STAGES:
+                    if stage not in needed:
+                        continue
+                    if stage not in args.stages:
+                        calls[stage]()  # Chỉ chạy để có đầu vào cho bước được đo
+                        continue
+                    runs = [_time_call(calls[stage]) for _ in range(args.repeat)]
+                    results.append({
+                        "case": case, "stage": stage, "duration": duration, "bitrate": bitrate,
+                        "best_s": round(min(runs), 4), "median_s": round(statistics.median(runs), 4),
+                        "runs": [round(r, 4) for r in runs],
+                    })
+                shutil.rmtree(case_dir, ignore_errors=True)
+    finally:
+        if server:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": _suite_meta(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    table = Table(title="[bold cyan]Benchmark suite[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Case", style="cyan")
+    table.add_column("Bước", style="yellow")
+    table.add_column("Tốt nhất (s)", style="green", justify="right")
+    table.add_column("Trung vị (s)", justify="right")
+    for r in results:
+        table.add_row(r["case"], r["stage"], f"{r['best_s']:.3f}", f"{r['median_s']:.3f}")
+    console.print(table)
+    console.print(f"[green]✓ Đã ghi kết quả:[/green] [cyan]{args.output}[/cyan]")
+
+
+def bench_compare(args) -> None:
+    """So sánh 2 file kết quả của suite; exit 1 nếu có bước chậm hơn baseline quá threshold %."""
+    def load(path: str) -> dict:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    baseline, current = load(args.baseline), load(args.current)
+    base = {(r["case"], r["stage"]): r for r in baseline["results"]}
+    for key in ("cpu_count", "platform", "ffmpeg"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            console.print(f"[yellow]Cảnh báo: {key} khác nhau "
+                          f"({baseline['meta'].get(key)} → {current['meta'].get(key)})[/yellow]")
+
+    table = Table(title=f"[bold cyan]{baseline['meta'].get('git_commit') or args.baseline} → "
+                        f"{current['meta'].get('git_commit') or args.current}[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Case", style="cyan")
+    table.add_column("Bước", style="yellow")
+    table.add_column("Baseline (s)", justify="right")
+    table.add_column("Hiện tại (s)", justify="right")
+    table.add_column("Thay đổi", justify="right")
+    regressions = 0
+    for r in current["results"]:
+        old = base.get((r["case"], r["stage"]))
+        if not old:
+            table.add_row(r["case"], r["stage"], "-", f"{r[args.metric]:.3f}", "[dim]mới[/dim]")
+            continue
+        change = (r[args.metric] - old[args.metric]) / old[args.metric] * 100 if old[args.metric] else 0.0
+        if change > args.threshold:
+            regressions += 1
+            style = "red"
+        elif change < -args.threshold:
+            style = "green"
+        else:
+            style = "dim"
+        table.add_row(r["case"], r["stage"], f"{old[args.metric]:.3f}", f"{r[args.metric]:.3f}",
+                      f"[{style}]{change:+.1f}%[/{style}]")
+    console.print(table)
+    if regressions:
+        console.print(f"[bold red]{regressions} bước chậm hơn baseline quá {args.threshold:.0f}%[/bold red]")
+        sys.exit(1)
+    console.print(f"[green]✓ Không có bước nào chậm hơn baseline quá {args.threshold:.0f}%[/green]")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Whisper M3U8 Transcriber")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("thumbnails", help="So sánh các cách tạo sprite sheet")
+    p.add_argument("--duration", type=int, default=600, help="Độ dài video test (giây, mặc định: 600)")
+    p.add_argument("--interval", type=int, default=5, help="Khoảng thời gian giữa các thumbnail (giây, mặc định: 5)")
+    p.add_argument("--format", choices=["webp", "jpg"], default="webp", help="Định dạng sprite (mặc định: webp)")
+    p.add_argument("--fps", type=float, default=29.97, help="Frame rate của video test, lẻ để phát hiện trôi timestamp (mặc định: 29.97)")
+    p.add_argument("--modes", nargs="+", choices=["single-pass", "seek"], default=["single-pass", "seek"])
+    p.add_argument("--repeat", type=int, default=1, help="Số lần lặp mỗi mode (mặc định: 1)")
+    p.set_defaults(func=bench_thumbnails)
+
+    p = sub.add_parser("hls", help="So sánh tải HLS qua ffmpeg và native fetcher")
+    p.add_argument("--duration", type=int, default=300, help="Độ dài video test (giây, mặc định: 300)")
+    p.add_argument("--segment-time", type=int, default=4, help="Độ dài mỗi segment (giây, mặc định: 4)")
+    p.add_argument("--latency", type=float, default=0.1, help="Độ trễ giả lập mỗi request (giây, mặc định: 0.1)")
+    p.add_argument("--workers", type=int, default=8, help="Số luồng cho native fetcher (mặc định: 8)")
+    p.add_argument("--encrypt", action="store_true", help="Mã hóa segment bằng AES-128")
+    p.add_argument("--single-file", action="store_true", help="Gom segment vào 1 file, playlist dùng EXT-X-BYTERANGE")
+    p.add_argument("--downloaders", nargs="+", choices=["ffmpeg", "native"], default=["ffmpeg", "native"])
+    p.set_defaults(func=bench_hls)
+
+    p = sub.add_parser("live", help="Đo độ trễ end-to-end của chế độ live (HLS giả lập)")
+    p.add_argument("--duration", type=int, default=120, help="Độ dài luồng test (giây, mặc định: 120)")
+    p.add_argument("--segment-time", type=int, default=2, help="Độ dài mỗi segment (giây, mặc định: 2)")
+    p.add_argument("--window", type=float, default=10.0, help="Cửa sổ nhận dạng (giây, mặc định: 10)")
+    p.add_argument("--input", help="Dùng file audio/video có sẵn (có giọng nói) thay cho tín hiệu test")
+    p.add_argument("--model", default="tiny", help="Model Whisper (mặc định: tiny)")
+    p.add_argument("--language", default="en", help="Ngôn ngữ (mặc định: en)")
+    p.add_argument("--profile", default="fast", help="Decoding profile (mặc định: fast)")
+    p.add_argument("--no-gpu", action="store_true", help="Bắt buộc dùng CPU")
+    p.set_defaults(func=bench_live)
+
+    p = sub.add_parser("startup", help="Đo thời gian import của từng entry path")
+    p.add_argument("--paths", nargs="+", choices=list(_STARTUP_PATHS), default=list(_STARTUP_PATHS))
+    p.add_argument("--repeat", type=int, default=3, help="Số lần chạy mỗi entry path (mặc định: 3)")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("parallel", help="Đo tăng tốc nhận dạng song song trên CPU theo số process")
+    p.add_argument("--duration", type=int, default=1800, help="Độ dài audio test (giây, mặc định: 1800)")
+    p.add_argument("--input", help="Dùng file audio/video có sẵn thay cho audio sinh tự động")
+    p.add_argument("--model", default="tiny", help="Model Whisper (mặc định: tiny)")
+    p.add_argument("--language", default="en", help="Ngôn ngữ (mặc định: en)")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Các số process cần đo (mặc định: 1 2 4)")
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser("memory", help="Đo peak RSS khi nhận dạng PCM đã spill theo cửa sổ, theo độ dài audio")
+    p.add_argument("--durations", type=int, nargs="+", default=[1800, 7200], help="Các độ dài audio cần đo (giây, mặc định: 1800 7200)")
+    p.add_argument("--window-seconds", type=float, default=120, help="Độ dài cửa sổ nhận dạng (mặc định: 120)")
+    p.add_argument("--model", default="null", help="Model Whisper, 'null' = không decode, chỉ đo đường dữ liệu (mặc định: null)")
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser("suite", help="Đo download / tách audio / nhận dạng / thumbnails trên media sinh cục bộ, ghi JSON")
+    p.add_argument("--durations", type=int, nargs="+", default=[60, 300], help="Các độ dài media test (giây, mặc định: 60 300)")
+    p.add_argument("--bitrates", nargs="+", default=["500k", "2000k"], help="Các bitrate video (mặc định: 500k 2000k)")
+    p.add_argument("--audio", choices=["sine", "speech"], default="speech", help="Tín hiệu audio: sine hoặc giống giọng nói (mặc định: speech)")
+    p.add_argument("--stages", nargs="+", choices=SUITE_STAGES, default=SUITE_STAGES)
+    p.add_argument("--segment-time", type=int, default=4, help="Độ dài mỗi segment HLS (giây, mặc định: 4)")
+    p.add_argument("--latency", type=float, default=0.0, help="Độ trễ giả lập mỗi request (giây, mặc định: 0)")
+    p.add_argument("--downloader", choices=["ffmpeg", "native"], default="native", help="Downloader (mặc định: native)")
+    p.add_argument("--workers", type=int, default=8, help="Số luồng cho native fetcher (mặc định: 8)")
+    p.add_argument("--interval", type=int, default=5, help="Khoảng thời gian giữa các thumbnail (giây, mặc định: 5)")
+    p.add_argument("--model", default="tiny", help="Model Whisper, chạy trên CPU (mặc định: tiny)")
+    p.add_argument("--language", default="en", help="Ngôn ngữ (mặc định: en)")
+    p.add_argument("--repeat", type=int, default=3, help="Số lần lặp mỗi bước (mặc định: 3)")
+    p.add_argument("-o", "--output", default="benchmark_results.json", help="File JSON kết quả (mặc định: benchmark_results.json)")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("compare", help="So sánh kết quả suite với baseline")
+    p.add_argument("baseline", help="File JSON baseline")
+    p.add_argument("current", help="File JSON cần so sánh")
+    p.add_argument("--metric", choices=["best_s", "median_s"], default="best_s", help="Chỉ số so sánh (mặc định: best_s)")
+    p.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng regression (%%, mặc định: 10)")
+    p.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -1,16 +1,26 @@
 import os
 import subprocess
 import argparse
-import whisper
 import datetime
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 import sys
 import threading
 import time
-import torch
 import json
-from typing import List
+from typing import List, Union
 import warnings
+import gc
+import queue
+import bisect
+import contextlib
+import re
+import shutil
+import http.server
+import urllib.request
+import urllib.error
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
@@ -21,8 +31,51 @@ from rich.style import Style
 from rich.live import Live
 from rich.status import Status
 
+# torch / whisper / numpy chỉ được import khi thật sự cần (bước nhận dạng, PCM trong bộ nhớ),
+# để --help, menu, quản lý checkpoint và các lượt chỉ tạo thumbnails/tải video khởi động nhanh
+if TYPE_CHECKING:
+    import numpy as np
+
+# Trạng thái UI theo thread: worker của pipeline chạy ở chế độ quiet
+# (Rich chỉ cho phép 1 live display - progress/status - tại một thời điểm)
+_UI_STATE = threading.local()
+
+
+class _ThreadConsole(Console):
+    """
+    Console cho phép thread item của --jobs chuyển output vào live view (_UI_STATE.sink).
+    Khi stdin đang dùng cho manifest (stdin_busy), input() trả về "" = lựa chọn mặc định.
+    """
+
+    stdin_busy = False
+
+    def input(self, prompt="", **kwargs) -> str:
+        if self.stdin_busy:
+            self.print(f"{prompt}[dim](stdin dùng cho manifest: mặc định)[/dim]")
+            return ""
+        return super().input(prompt, **kwargs)
+
+    def print(self, *objects, **kwargs):
+        sink = getattr(_UI_STATE, "sink", None)
+        if sink is not None:
+            sink(objects)
+            return
+        super().print(*objects, **kwargs)
+
+
 # Initialize Rich console
-console = Console()
+console = _ThreadConsole()
+
+
+def _ui_quiet() -> bool:
+    return getattr(_UI_STATE, "quiet", False)
+
+
+def _status(message: str):
+    """console.status, hoặc no-op khi đang chạy ở chế độ quiet."""
+    if _ui_quiet():
+        return contextlib.nullcontext()
+    return console.status(message, spinner="dots")
 
 # Tắt warning về Flash Attention (không ảnh hưởng đến chức năng)
 warnings.filterwarnings("ignore", message=".*Torch was not compiled with flash attention.*")
@@ -47,6 +100,7 @@ def check_ffmpeg():
 def check_gpu():
     """Kiểm tra GPU và CUDA"""
     try:
+        import torch
         if torch.cuda.is_available():
             gpu_name = torch.cuda.get_device_name(0)
             gpu_count = torch.cuda.device_count()
@@ -60,6 +114,19 @@ def check_gpu():
         return False
 
 
+_GPU_AVAILABLE: Optional[bool] = None
+
+
+def resolve_device(use_gpu: bool = True) -> str:
+    """Chọn device cho Whisper; lần đầu gọi mới import torch và kiểm tra GPU."""
+    global _GPU_AVAILABLE
+    if not use_gpu:
+        return "cpu"
+    if _GPU_AVAILABLE is None:
+        _GPU_AVAILABLE = check_gpu()
+    return "cuda" if _GPU_AVAILABLE else "cpu"
+
+
 def _get_config_path() -> str:
     """Return path to config file in current directory."""
     return ".whisper_m3u8_transcriber_config.json"
@@ -92,44 +159,214 @@ def save_recent_paths(paths: List[str]) -> None:
 
 
 def _get_checkpoint_path() -> str:
-    """Return path to checkpoint file in current directory."""
+    """Return path to legacy JSON checkpoint file in current directory."""
     return ".whisper_m3u8_transcriber_checkpoint.json"
 
 
-def load_checkpoint() -> dict:
-    """Load checkpoint data from file. Returns dict with last_json_path, last_index, etc."""
-    cfg = _get_checkpoint_path()
+def _get_checkpoint_db_path() -> str:
+    """Return path to checkpoint database in current directory."""
+    return ".whisper_m3u8_transcriber_checkpoint.db"
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint store (SQLite): trạng thái từng bước của từng item trong batch
+# ---------------------------------------------------------------------------
+
+CHECKPOINT_STAGES = ("download", "extract", "transcribe")
+
+_CHECKPOINT_CONN = None
+_CHECKPOINT_LOCK = threading.RLock()
+
+
+def _checkpoint_db():
+    """Connection dùng chung (có lock) tới checkpoint DB, tạo bảng nếu chưa có."""
+    global _CHECKPOINT_CONN
+    import sqlite3
+    with _CHECKPOINT_LOCK:
+        if _CHECKPOINT_CONN is None:
+            conn = sqlite3.connect(_get_checkpoint_db_path(), check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS batches ("
+                    " json_path TEXT PRIMARY KEY,"
+                    " total INTEGER NOT NULL,"
+                    " updated_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS item_stages ("
+                    " json_path TEXT NOT NULL,"
+                    " item_index INTEGER NOT NULL,"
+                    " stage TEXT NOT NULL,"
+                    " status TEXT NOT NULL,"
+                    " artifacts TEXT NOT NULL DEFAULT '[]',"
+                    " error TEXT,"
+                    " updated_at REAL NOT NULL,"
+                    " PRIMARY KEY (json_path, item_index, stage))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sources ("
+                    " key TEXT PRIMARY KEY,"
+                    " output_dir TEXT NOT NULL,"
+                    " artifacts TEXT NOT NULL DEFAULT '[]',"
+                    " updated_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS stage_history ("
+                    " stage TEXT NOT NULL,"
+                    " variant TEXT NOT NULL,"
+                    " rtf REAL NOT NULL,"
+                    " updated_at REAL NOT NULL)"
+                )
+            _CHECKPOINT_CONN = conn
+            _migrate_legacy_checkpoint(conn)
+        return _CHECKPOINT_CONN
+
+
+def _file_fingerprint(path: str) -> Optional[dict]:
+    """
+    Fingerprint nhanh của file: size + sha256 của 1MB đầu và 1MB cuối.
+    Đủ để phát hiện file bị thiếu/ghi dở mà không phải đọc lại cả file nhiều GB.
+    """
+    import hashlib
     try:
-        if os.path.exists(cfg):
-            with open(cfg, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
+        size = os.path.getsize(path)
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            h.update(f.read(1024 * 1024))
+            if size > 2 * 1024 * 1024:
+                f.seek(-1024 * 1024, os.SEEK_END)
+                h.update(f.read(1024 * 1024))
+        return {"path": os.path.abspath(path), "size": size, "sha256": h.hexdigest()}
+    except OSError:
+        return None
+
+
+def _artifacts_valid(artifacts: List[dict]) -> bool:
+    """True nếu mọi artifact còn tồn tại và đúng fingerprint đã lưu."""
+    for art in artifacts:
+        current = _file_fingerprint(art.get("path", ""))
+        if current is None or current["size"] != art.get("size") or current["sha256"] != art.get("sha256"):
+            return False
+    return True
+
+
+def register_batch(json_path: str, total: int) -> None:
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK, conn:
+        conn.execute(
+            "INSERT INTO batches (json_path, total, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(json_path) DO UPDATE SET total = excluded.total, updated_at = excluded.updated_at",
+            (json_path, total, time.time())
+        )
+
+
+def record_item_stage(json_path: str, index: int, stage: str, status: str,
+                      artifact_paths: Optional[List[str]] = None, error: Optional[str] = None) -> None:
+    """
+    Ghi trạng thái 1 bước của item, kèm fingerprint các file đầu ra.
+
+    status: 'done' | 'failed' (lần sau chạy lại) | 'skipped' (item không hợp lệ, không bao giờ chạy lại).
+    """
+    artifacts = [fp for fp in (_file_fingerprint(p) for p in (artifact_paths or []) if p) if fp]
+    conn = _checkpoint_db()
+    now = time.time()
+    with _CHECKPOINT_LOCK, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO item_stages (json_path, item_index, stage, status, artifacts, error, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (json_path, index, stage, status, json.dumps(artifacts, ensure_ascii=False), error, now)
+        )
+        conn.execute("UPDATE batches SET updated_at = ? WHERE json_path = ?", (now, json_path))
+
+
+def load_item_state(json_path: str, index: int) -> dict:
+    """Trả về {stage: {"status", "artifacts", "error", "updated_at"}} của 1 item."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK:
+        rows = conn.execute(
+            "SELECT stage, status, artifacts, error, updated_at FROM item_stages WHERE json_path = ? AND item_index = ?",
+            (json_path, index)
+        ).fetchall()
+    return {row["stage"]: {
+        "status": row["status"],
+        "artifacts": json.loads(row["artifacts"] or "[]"),
+        "error": row["error"],
+        "updated_at": row["updated_at"],
+    } for row in rows}
+
+
+def completed_items(json_path: str) -> set:
+    """Tập index các item đã kết thúc: hoàn tất (done) hoặc bị bỏ qua vĩnh viễn (skipped)."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK:
+        rows = conn.execute(
+            "SELECT item_index FROM item_stages WHERE json_path = ? AND stage = 'item' AND status IN ('done', 'skipped')",
+            (json_path,)
+        ).fetchall()
+    return {row["item_index"] for row in rows}
+
+
+def list_checkpoints() -> List[dict]:
+    """Danh sách batch có checkpoint: json_path, total, done, skipped, failed, updated_at."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK:
+        rows = conn.execute(
+            "SELECT b.json_path, b.total, b.updated_at,"
+            " SUM(CASE WHEN s.stage = 'item' AND s.status = 'done' THEN 1 ELSE 0 END) AS done,"
+            " SUM(CASE WHEN s.stage = 'item' AND s.status = 'skipped' THEN 1 ELSE 0 END) AS skipped,"
+            " COUNT(DISTINCT CASE WHEN s.status = 'failed' THEN s.item_index END) AS failed"
+            " FROM batches b LEFT JOIN item_stages s ON s.json_path = b.json_path"
+            " GROUP BY b.json_path ORDER BY b.updated_at DESC"
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def load_checkpoint(json_path: Optional[str] = None) -> dict:
+    """Checkpoint của json_path (hoặc batch gần nhất). Returns dict rỗng nếu không có."""
+    for cp in list_checkpoints():
+        if json_path is None or cp["json_path"] == json_path:
+            return cp
     return {}
 
 
-def save_checkpoint(json_path: str, last_index: int, total: int) -> None:
-    """Save checkpoint data to file."""
-    cfg = _get_checkpoint_path()
+def clear_checkpoint(json_path: Optional[str] = None) -> None:
+    """Xóa checkpoint của json_path, hoặc toàn bộ nếu json_path=None."""
     try:
-        data = {
-            "json_path": json_path,
-            "last_index": last_index,
-            "total": total,
-            "timestamp": time.time()
-        }
-        with open(cfg, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        conn = _checkpoint_db()
+        with _CHECKPOINT_LOCK, conn:
+            if json_path is None:
+                conn.execute("DELETE FROM item_stages")
+                conn.execute("DELETE FROM batches")
+            else:
+                conn.execute("DELETE FROM item_stages WHERE json_path = ?", (json_path,))
+                conn.execute("DELETE FROM batches WHERE json_path = ?", (json_path,))
     except Exception:
         pass
 
 
-def clear_checkpoint() -> None:
-    """Clear checkpoint file."""
+def _migrate_legacy_checkpoint(conn) -> None:
+    """Chuyển checkpoint JSON cũ (last_index) sang DB: các item < last_index coi như đã xong."""
     cfg = _get_checkpoint_path()
+    if not os.path.exists(cfg):
+        return
     try:
-        if os.path.exists(cfg):
-            os.remove(cfg)
+        with open(cfg, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        json_path = data.get("json_path")
+        last_index = int(data.get("last_index", 0))
+        if json_path:
+            now = data.get("timestamp", time.time())
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO batches (json_path, total, updated_at) VALUES (?, ?, ?)",
+                             (json_path, int(data.get("total", last_index)), now))
+                conn.executemany(
+                    "INSERT OR IGNORE INTO item_stages (json_path, item_index, stage, status, updated_at)"
+                    " VALUES (?, ?, 'item', 'done', ?)",
+                    [(json_path, i, now) for i in range(last_index)]
+                )
+        os.remove(cfg)
     except Exception:
         pass
 
@@ -160,13 +397,231 @@ def validate_url(url: str) -> bool:
     """Kiểm tra URL hợp lệ"""
     return url.startswith(("http://", "https://")) and ".m3u8" in url.lower()
 
-def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4") -> str:
-    console.print("\n[bold cyan]Đang tải video từ m3u8...[/bold cyan]")
+# ---------------------------------------------------------------------------
+# Media probe: chạy ffprobe 1 lần cho mỗi file, cache trong RAM và trên đĩa
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MediaInfo:
+    """Thông tin media lấy từ ffprobe."""
+    path: str
+    duration: float = 0.0
+    format_name: str = ""
+    size: int = 0
+    bit_rate: int = 0
+    streams: List[dict] = field(default_factory=list)
+    keyframes: Optional[List[float]] = None
+
+    @property
+    def has_video(self) -> bool:
+        return any(s.get("codec_type") == "video" for s in self.streams)
+
+    @property
+    def has_audio(self) -> bool:
+        return any(s.get("codec_type") == "audio" for s in self.streams)
+
+    def codecs(self, codec_type: Optional[str] = None) -> List[str]:
+        return [s.get("codec_name", "") for s in self.streams
+                if codec_type is None or s.get("codec_type") == codec_type]
+
+
+_PROBE_CACHE: dict = {}
+_PROBE_CACHE_LOCK = threading.Lock()
+_PROBE_DISK_LOCK = threading.Lock()  # Đọc-sửa-ghi file cache trên đĩa
+_PROBE_CACHE_MAX_ENTRIES = 500
+
+
+def _get_probe_cache_path() -> str:
+    """Return path to probe cache file in current directory."""
+    return ".whisper_m3u8_transcriber_probe_cache.json"
+
+
+def _probe_cache_key(path: str) -> Optional[str]:
+    """Key = path + size + mtime, None nếu không phải file cục bộ (URL)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def _load_probe_disk_cache() -> dict:
+    cfg = _get_probe_cache_path()
+    try:
+        if os.path.exists(cfg):
+            with open(cfg, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                return data if isinstance(data, dict) else {}
+    except Exception:
+        pass
+    return {}
+
+
+def _save_probe_disk_cache(key: str, info: MediaInfo) -> None:
+    """
+    Thêm 1 entry vào cache trên đĩa: đọc-sửa-ghi dưới lock (worker của --jobs /
+    pipeline không ghi đè cập nhật của nhau), ghi file tạm rồi rename để người
+    đọc không bao giờ thấy file ghi dở.
+    """
+    cfg = _get_probe_cache_path()
+    tmp_path = f"{cfg}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _PROBE_DISK_LOCK:
+        try:
+            data = _load_probe_disk_cache()
+            data.pop(key, None)
+            data[key] = asdict(info)
+            # Giữ tối đa _PROBE_CACHE_MAX_ENTRIES entries mới nhất
+            while len(data) > _PROBE_CACHE_MAX_ENTRIES:
+                data.pop(next(iter(data)))
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, cfg)
+        except Exception:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+def _parse_ffmpeg_duration(stderr: str) -> float:
+    """Parse 'Duration: HH:MM:SS.xx' từ stderr của ffmpeg. Trả về 0 nếu không có."""
+    for line in stderr.split('\n'):
+        if "Duration:" in line:
+            try:
+                time_str = line.split("Duration:")[1].split(",")[0].strip()
+                h, m, s = time_str.split(":")
+                return int(h) * 3600 + int(m) * 60 + float(s)
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+def _run_ffprobe(path: str, timeout: int = 30) -> Optional[MediaInfo]:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-print_format", "json",
+        "-show_format", "-show_streams",
+        path
+    ]
     try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        if result.returncode == 0 and result.stdout.strip():
+            data = json.loads(result.stdout)
+            fmt = data.get("format", {})
+            return MediaInfo(
+                path=path,
+                duration=float(fmt.get("duration") or 0),
+                format_name=fmt.get("format_name", ""),
+                size=int(fmt.get("size") or 0),
+                bit_rate=int(fmt.get("bit_rate") or 0),
+                streams=[{
+                    "index": s.get("index"),
+                    "codec_type": s.get("codec_type"),
+                    "codec_name": s.get("codec_name"),
+                    "width": s.get("width"),
+                    "height": s.get("height"),
+                    "sample_rate": s.get("sample_rate"),
+                    "channels": s.get("channels"),
+                    "bit_rate": s.get("bit_rate"),
+                } for s in data.get("streams", [])],
+            )
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
+        pass
+
+    # Fallback: ffmpeg -i (chỉ đọc header, không decode)
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], capture_output=True, text=True, timeout=timeout)
+        duration = _parse_ffmpeg_duration(result.stderr or "")
+        if duration > 0:
+            return MediaInfo(path=path, duration=duration)
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        pass
+    return None
+
+
+def _probe_keyframes(path: str) -> List[float]:
+    """Danh sách thời điểm keyframe của video stream đầu tiên (chỉ decode keyframe)."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-skip_frame", "nokey",
+        "-show_entries", "frame=pts_time",
+        "-of", "csv=p=0",
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        return [float(x) for x in result.stdout.split() if x.strip() and x.strip() != "N/A"]
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def probe_media(path: str, with_keyframes: bool = False) -> Optional[MediaInfo]:
+    """
+    Lấy MediaInfo của file/URL, dùng cache nếu có.
+
+    File cục bộ được cache theo (path, size, mtime) trong RAM và trên đĩa;
+    URL chỉ được cache trong RAM.
+    """
+    disk_key = _probe_cache_key(path)
+    key = disk_key or path
+    with _PROBE_CACHE_LOCK:
+        info = _PROBE_CACHE.get(key)
+    dirty = False
+
+    if info is None and disk_key:
+        cached = _load_probe_disk_cache().get(disk_key)
+        if cached:
+            try:
+                info = MediaInfo(**cached)
+            except TypeError:
+                info = None
+
+    if info is None:
+        info = _run_ffprobe(path)
+        if info is None:
+            return None
+        dirty = True
+
+    if with_keyframes and info.keyframes is None:
+        info.keyframes = _probe_keyframes(path)
+        dirty = True
+
+    with _PROBE_CACHE_LOCK:
+        _PROBE_CACHE[key] = info
+    if disk_key and dirty:
+        _save_probe_disk_cache(disk_key, info)
+    return info
+
+
+def get_media_duration(path: str) -> float:
+    """Độ dài media (giây) qua probe_media, 0 nếu không xác định được."""
+    info = probe_media(path)
+    return info.duration if info else 0.0
+
+
+def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4", downloader: str = "native",
+                       workers: int = 8, retries: int = 3, resume: bool = True, with_audio: bool = True) -> str:
+    """Tải video (copy stream, không encode lại). with_audio=False: chỉ lấy hình (-an), ví dụ khi chỉ tạo thumbnails."""
+    console.print("\n[bold cyan]Đang tải video từ m3u8...[/bold cyan]" + ("" if with_audio else " [dim](không audio)[/dim]"))
+    copy_args = ["-c", "copy"] if with_audio else ["-an", "-c", "copy"]
+    try:
+        if downloader == "native":
+            native = native_download_supported(m3u8_url, need_audio=with_audio)
+            if native:
+                media_url, playlist, _ = native
+                _download_native(m3u8_url, output_path, media_url, playlist, copy_args + [output_path],
+                                 "Đang tải video", workers, retries, resume)
+                console.print(f"[bold green]✓ Tải video thành công[/bold green]")
+                probe_media(output_path)
+                return output_path
+            console.print("   [dim]Playlist không hỗ trợ tải native (live/SAMPLE-AES/AES-128 chưa cài cryptography/audio tách riêng), dùng ffmpeg[/dim]")
+        
         cmd = [
             "ffmpeg", "-y",
             "-i", m3u8_url,
-            "-c", "copy",
+        ] + copy_args + [
             "-progress", "pipe:1",
             output_path
         ]
@@ -183,13 +638,8 @@ def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4") -> str:
             try:
                 for line in process.stderr:
                     if "Duration:" in line and not duration_found:
-                        try:
-                            time_str = line.split("Duration:")[1].split(",")[0].strip()
-                            h, m, s = time_str.split(":")
-                            duration = int(h) * 3600 + int(m) * 60 + float(s)
-                            duration_found = True
-                        except:
-                            pass
+                        duration = _parse_ffmpeg_duration(line)
+                        duration_found = duration > 0
             except:
                 pass
         
@@ -203,7 +653,8 @@ def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4") -> str:
             BarColumn(complete_style="cyan", finished_style="green"),
             TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
             TimeElapsedColumn(),
-            console=console
+            console=console,
+            disable=_ui_quiet()
         ) as progress:
             task = progress.add_task("Đang tải video...", total=100)
             
@@ -242,6 +693,8 @@ def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4") -> str:
             raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr_output)
         
         console.print(f"[bold green]✓ Tải video thành công[/bold green]")
+        # Probe file vừa tải để các bước sau dùng lại kết quả từ cache
+        probe_media(output_path)
         return output_path
     except KeyboardInterrupt:
         console.print("\n[yellow]Đã hủy tiến trình tải video[/yellow]")
@@ -267,169 +720,1022 @@ def download_from_m3u8(m3u8_url: str, output_path: str = "video.mp4") -> str:
         sys.exit(1)
 
 
-def extract_audio(video_path: str, audio_path: str = "audio.wav") -> str:
-    console.print("\n[bold magenta]Đang tách audio...[/bold magenta]")
-    try:
-        # Get duration từ ffprobe (chính xác và nhanh hơn)
-        probe_cmd = [
-            "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            video_path
-        ]
-        
-        duration = 0
-        try:
-            probe_result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=5)
-            if probe_result.returncode == 0 and probe_result.stdout.strip():
-                duration = float(probe_result.stdout.strip())
-            else:
-                # Fallback: dùng ffmpeg -i
-                probe_cmd_fallback = ["ffmpeg", "-i", video_path, "-f", "null", "-"]
-                probe_result = subprocess.run(probe_cmd_fallback, capture_output=True, text=True, timeout=5)
-                output = probe_result.stderr if probe_result.stderr else ""
-                for line in output.split('\n'):
-                    if "Duration:" in line:
-                        time_str = line.split("Duration:")[1].split(",")[0].strip()
-                        h, m, s = time_str.split(":")
-                        duration = int(h) * 3600 + int(m) * 60 + float(s)
-                        break
-        except subprocess.TimeoutExpired:
-            console.print("   [yellow]Không thể lấy duration, sẽ hiển thị tiến độ ước lượng[/yellow]")
-            duration = 0
-        except Exception as e:
-            console.print(f"   [dim]Probe error: {e}[/dim]")
-            duration = 0
-        
-        # Extract audio with progress
-        cmd = [
-            "ffmpeg", "-y", "-i", video_path, "-vn", "-acodec", "pcm_s16le",
-            "-ar", "16000", "-ac", "1", "-progress", "pipe:1", audio_path
-        ]
-        
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                   text=True, bufsize=1)
-        
-        last_time = 0
-        
-        # Sử dụng Rich Progress (giống download video)
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[bold magenta]{task.description}"),
-            BarColumn(complete_style="magenta", finished_style="green"),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            TimeElapsedColumn(),
-            console=console
-        ) as progress:
-            if duration > 0:
-                task = progress.add_task(f"Đang tách audio (0s / {int(duration)}s)", total=100)
-            else:
-                task = progress.add_task("Đang tách audio...", total=100)
-            
-            try:
-                while True:
-                    line = process.stdout.readline()
-                    if not line:
-                        break
-                    
-                    line = line.strip()
-                    
-                    if line.startswith("out_time_ms="):
-                        try:
-                            time_ms = int(line.split("=")[1])
-                            current_time = time_ms / 1_000_000
-                            
-                            if current_time > last_time:
-                                last_time = current_time
-                                
-                                if duration > 0:
-                                    percent = (current_time / duration) * 100
-                                    progress.update(task, completed=percent, description=f"Đang tách audio ({int(current_time)}s / {int(duration)}s)")
-                                else:
-                                    progress.update(task, description=f"Đang tách audio ({int(current_time)}s)")
-                        except:
-                            pass
-            except KeyboardInterrupt:
-                progress.stop()
-                raise
-        
-        return_code = process.wait(timeout=300)
-        
-        if return_code != 0:
-            try:
-                stderr = process.stderr.read()
-            except:
-                stderr = ""
-            raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr)
-        
-        console.print(f"[bold green]✓ Tách audio thành công[/bold green]")
-        return audio_path
-    except KeyboardInterrupt:
-        console.print("\n[yellow]Đã hủy tiến trình tách audio[/yellow]")
-        if os.path.exists(audio_path):
-            try:
-                os.remove(audio_path)
-                console.print("[dim]Đã xóa file tạm[/dim]")
-            except:
-                pass
-        sys.exit(0)
-    except subprocess.TimeoutExpired:
-        console.print(Panel(
-            "[bold red]LỖI:[/bold red] Timeout khi tách audio (quá 5 phút)",
-            title="[bold red]Timeout Error[/bold red]",
-            border_style="red"
-        ))
-        sys.exit(1)
-    except subprocess.CalledProcessError as e:
-        console.print(Panel(
-            "[bold red]LỖI:[/bold red] Không thể tách audio từ video\n\n"
-            "[yellow]Gợi ý:[/yellow] Kiểm tra file video có lỗi không",
-            title="[bold red]Audio Extraction Error[/bold red]",
-            border_style="red"
-        ))
-        sys.exit(1)
-    except Exception as e:
-        console.print(f"\n[bold red]LỖI:[/bold red] [red]{str(e)}[/red]")
-        sys.exit(1)
+# ---------------------------------------------------------------------------
+# HLS playlist: đọc master playlist để chọn rendition phù hợp
+# ---------------------------------------------------------------------------
 
+_HTTP_USER_AGENT = "Mozilla/5.0 (whisper-m3u8-transcriber)"
 
-def _format_timestamp(seconds: float) -> str:
-    hrs = int(seconds // 3600)
-    mins = int((seconds % 3600) // 60)
-    secs = seconds % 60
-    return f"{hrs:02d}:{mins:02d}:{secs:06.3f}"
 
+def _fetch_text(url: str, timeout: int = 15) -> str:
+    """Tải nội dung text (playlist) từ URL."""
+    req = urllib.request.Request(url, headers={"User-Agent": _HTTP_USER_AGENT})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.read().decode("utf-8", errors="replace")
 
-def result_to_vtt(result: dict) -> str:
-    if isinstance(result.get("vtt"), str):
-        return result["vtt"]
 
-    segments = result.get("segments") or []
-    lines = ["WEBVTT", ""]
-    for seg in segments:
-        start = _format_timestamp(seg.get("start", 0.0))
-        end = _format_timestamp(seg.get("end", 0.0))
-        text = seg.get("text", "").strip()
-        lines.append(f"{start} --> {end}")
-        lines.append(text)
-        lines.append("")
-    return "\n".join(lines)
+def _parse_hls_attributes(line: str) -> dict:
+    """Parse danh sách thuộc tính dạng KEY=VALUE,KEY="VALUE" của 1 tag HLS."""
+    attrs = {}
+    _, _, attr_str = line.partition(":")
+    for m in re.finditer(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', attr_str):
+        attrs[m.group(1)] = m.group(2).strip('"')
+    return attrs
 
 
+def parse_master_playlist(text: str, base_url: str) -> dict:
+    """
+    Parse master playlist.
 
+    Returns:
+        {"variants": [{"uri", "bandwidth", "codecs", "resolution", "audio"}],
+         "audio": [{"uri", "group_id", "name", "language", "default"}]}
+        Cả 2 list đều rỗng nếu text là media playlist.
+    """
+    variants = []
+    audio = []
+    pending = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF"):
+            attrs = _parse_hls_attributes(line)
+            pending = {
+                "bandwidth": int(attrs.get("BANDWIDTH", "0") or 0),
+                "codecs": attrs.get("CODECS", ""),
+                "resolution": attrs.get("RESOLUTION", ""),
+                "audio": attrs.get("AUDIO", ""),
+            }
+        elif line.startswith("#EXT-X-MEDIA") and "TYPE=AUDIO" in line:
+            attrs = _parse_hls_attributes(line)
+            if attrs.get("URI"):
+                audio.append({
+                    "uri": urljoin(base_url, attrs["URI"]),
+                    "group_id": attrs.get("GROUP-ID", ""),
+                    "name": attrs.get("NAME", ""),
+                    "language": attrs.get("LANGUAGE", ""),
+                    "default": attrs.get("DEFAULT", "NO") == "YES",
+                })
+        elif not line.startswith("#") and pending is not None:
+            pending["uri"] = urljoin(base_url, line)
+            variants.append(pending)
+            pending = None
+    return {"variants": variants, "audio": audio}
 
 
-def display_usage():
-    """Hiển thị hướng dẫn sử dụng chi tiết"""
-    console.print("\n")
-    
-    # Tiêu đề hướng dẫn
-    title = Text("HƯỚNG DẪN SỬ DỤNG", style="bold cyan")
-    console.print(Panel(title, box=box.DOUBLE, border_style="cyan", padding=(0, 2)))
-    console.print()
-    
-    # Phần 1: Giới thiệu
-    console.print(Panel(
+def _is_audio_only_codecs(codecs: str) -> bool:
+    """True nếu CODECS chỉ chứa codec audio (mp4a, ac-3, ec-3, opus...)."""
+    if not codecs:
+        return False
+    audio_prefixes = ("mp4a", "ac-3", "ec-3", "opus", "flac", "mp3")
+    return all(c.strip().lower().startswith(audio_prefixes) for c in codecs.split(","))
+
+
+def select_audio_source(m3u8_url: str) -> str:
+    """
+    Chọn URL nhẹ nhất chứa audio từ master playlist:
+    rendition audio riêng (ưu tiên DEFAULT) > variant chỉ có audio > variant bitrate thấp nhất.
+    Trả về m3u8_url gốc nếu không phải master playlist hoặc không đọc được.
+    """
+    try:
+        playlist = parse_master_playlist(_fetch_text(m3u8_url), m3u8_url)
+    except (urllib.error.URLError, OSError, ValueError):
+        return m3u8_url
+
+    renditions = playlist["audio"]
+    if renditions:
+        chosen = next((r for r in renditions if r["default"]), renditions[0])
+        return chosen["uri"]
+
+    variants = playlist["variants"]
+    if not variants:
+        return m3u8_url
+
+    audio_only = [v for v in variants if _is_audio_only_codecs(v["codecs"])]
+    candidates = audio_only or variants
+    return min(candidates, key=lambda v: v["bandwidth"] or float("inf"))["uri"]
+
+
+# ---------------------------------------------------------------------------
+# Native HLS fetcher: tải segment song song, giữ kết nối keep-alive,
+# retry từng segment và ghi theo đúng thứ tự vào stdin của ffmpeg
+# ---------------------------------------------------------------------------
+
+@dataclass
+class HlsKey:
+    """Khóa mã hóa của segment (#EXT-X-KEY)."""
+    method: str
+    uri: str = ""
+    iv: Optional[bytes] = None
+
+
+@dataclass
+class HlsSegment:
+    """Một segment trong media playlist."""
+    uri: str
+    duration: float
+    sequence: int
+    key: Optional[HlsKey] = None
+    byterange: Optional[tuple] = None  # (length, offset)
+    init_uri: Optional[str] = None
+    init_byterange: Optional[tuple] = None
+
+
+def _parse_byterange(value: str, last_end: int) -> tuple:
+    """Parse 'length[@offset]' -> (length, offset)."""
+    length, _, offset = value.partition("@")
+    return int(length), int(offset) if offset else last_end
+
+
+def parse_media_playlist(text: str, base_url: str) -> dict:
+    """
+    Parse media playlist.
+
+    Returns:
+        {"segments": [HlsSegment], "target_duration": float,
+         "media_sequence": int, "endlist": bool, "total_duration": float}
+    """
+    segments = []
+    target_duration = 0.0
+    media_sequence = 0
+    endlist = False
+    key = None
+    init_uri = None
+    init_byterange = None
+    duration = None
+    byterange = None
+    last_end = 0
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            endlist = True
+        elif line.startswith("#EXT-X-KEY:"):
+            attrs = _parse_hls_attributes(line)
+            method = attrs.get("METHOD", "NONE")
+            if method == "NONE":
+                key = None
+            else:
+                iv = attrs.get("IV")
+                key = HlsKey(
+                    method=method,
+                    uri=urljoin(base_url, attrs.get("URI", "")),
+                    iv=bytes.fromhex(iv[2:] if iv.lower().startswith("0x") else iv) if iv else None,
+                )
+        elif line.startswith("#EXT-X-MAP:"):
+            attrs = _parse_hls_attributes(line)
+            init_uri = urljoin(base_url, attrs.get("URI", ""))
+            init_byterange = _parse_byterange(attrs["BYTERANGE"], 0) if attrs.get("BYTERANGE") else None
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0] or 0)
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            byterange = _parse_byterange(line.split(":", 1)[1], last_end)
+        elif not line.startswith("#") and duration is not None:
+            segments.append(HlsSegment(
+                uri=urljoin(base_url, line),
+                duration=duration,
+                sequence=media_sequence + len(segments),
+                key=key,
+                byterange=byterange,
+                init_uri=init_uri,
+                init_byterange=init_byterange,
+            ))
+            last_end = byterange[0] + byterange[1] if byterange else 0
+            duration = None
+            byterange = None
+
+    return {
+        "segments": segments,
+        "target_duration": target_duration,
+        "media_sequence": media_sequence,
+        "endlist": endlist,
+        "total_duration": sum(seg.duration for seg in segments),
+    }
+
+
+class HlsHttpError(Exception):
+    """HTTP status lỗi khi tải playlist/segment."""
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f"HTTP {status}: {url}")
+        self.url = url
+        self.status = status
+
+
+class HlsRangeError(Exception):
+    """Server trả sai byterange (bỏ qua header Range, hoặc độ dài/offset không khớp)."""
+
+    def __init__(self, url: str, status: int, detail: str):
+        super().__init__(f"Byterange không hợp lệ (HTTP {status}, {detail}): {url}")
+        self.url = url
+        self.status = status
+
+
+# Mỗi worker thread giữ connection riêng theo (scheme, host, port) để tái sử dụng keep-alive
+_HTTP_LOCAL = threading.local()
+
+
+def _http_get(url: str, byterange: Optional[tuple] = None, timeout: int = 20, max_redirects: int = 5) -> bytes:
+    """GET qua http.client với connection keep-alive tái sử dụng theo thread."""
+    import http.client
+    from urllib.parse import urlsplit
+
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        host_key = (parts.scheme, parts.hostname, parts.port)
+        pool = getattr(_HTTP_LOCAL, "conns", None)
+        if pool is None:
+            pool = _HTTP_LOCAL.conns = {}
+        conn = pool.get(host_key)
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = conn_cls(parts.hostname, parts.port, timeout=timeout)
+            pool[host_key] = conn
+
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = {"User-Agent": _HTTP_USER_AGENT, "Connection": "keep-alive"}
+        if byterange:
+            length, offset = byterange
+            headers["Range"] = f"bytes={offset}-{offset + length - 1}"
+
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            # Connection hỏng (server đóng keep-alive...), bỏ để lần sau tạo mới
+            conn.close()
+            pool.pop(host_key, None)
+            raise
+
+        if resp.will_close:
+            conn.close()
+            pool.pop(host_key, None)
+        if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+            url = urljoin(url, resp.getheader("Location"))
+            continue
+        if resp.status >= 400:
+            raise HlsHttpError(url, resp.status)
+        if byterange:
+            # Server bỏ qua Range sẽ trả 200 cả file: ghép vào sẽ hỏng output, không được nhận
+            if resp.status != 206:
+                raise HlsRangeError(url, resp.status, "server không hỗ trợ Range")
+            content_range = resp.getheader("Content-Range") or ""
+            range_match = re.match(r"bytes\s+(\d+)-", content_range)
+            if range_match and int(range_match.group(1)) != offset:
+                raise HlsRangeError(url, resp.status, f"Content-Range '{content_range}', cần offset {offset}")
+            if len(body) != length:
+                raise HlsRangeError(url, resp.status, f"nhận {len(body)} bytes, cần {length}")
+        return body
+    raise HlsHttpError(url, 310)
+
+
+def _http_get_with_retry(url: str, byterange: Optional[tuple] = None, retries: int = 3, backoff: float = 0.5) -> bytes:
+    """_http_get với retry + exponential backoff (không retry lỗi 4xx trừ 408/429)."""
+    import http.client
+    import random
+
+    for attempt in range(retries + 1):
+        try:
+            return _http_get(url, byterange)
+        except HlsHttpError as e:
+            if attempt >= retries or (400 <= e.status < 500 and e.status not in (408, 429)):
+                raise
+        except HlsRangeError as e:
+            # 206 thiếu bytes có thể do đứt giữa chừng; server bỏ qua Range thì retry vô ích
+            if attempt >= retries or e.status != 206:
+                raise
+        except (OSError, http.client.HTTPException):
+            if attempt >= retries:
+                raise
+        time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+    raise RuntimeError("unreachable")
+
+
+_AES_KEY_CACHE: dict = {}
+_AES_KEY_LOCK = threading.Lock()
+
+
+def _get_aes_key(uri: str, retries: int) -> bytes:
+    with _AES_KEY_LOCK:
+        if uri in _AES_KEY_CACHE:
+            return _AES_KEY_CACHE[uri]
+    key = _http_get_with_retry(uri, retries=retries)
+    with _AES_KEY_LOCK:
+        _AES_KEY_CACHE[uri] = key
+    return key
+
+
+def _aes128_available() -> bool:
+    """True nếu có gói `cryptography` (tùy chọn) để downloader native giải mã AES-128."""
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _decrypt_aes128(data: bytes, key: bytes, iv: bytes) -> bytes:
+    """Giải mã AES-128-CBC + bỏ padding PKCS7 (cần gói `cryptography`)."""
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        raise RuntimeError("Playlist dùng AES-128, vui lòng cài: pip install cryptography")
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    plain = decryptor.update(data) + decryptor.finalize()
+    pad = plain[-1] if plain else 0
+    if 1 <= pad <= 16 and plain.endswith(bytes([pad]) * pad):
+        plain = plain[:-pad]
+    return plain
+
+
+class SegmentStore:
+    """
+    Lưu segment đã tải vào thư mục sidecar `<output>.parts/` kèm manifest
+    (manifest.jsonl: sequence, URI, số bytes, sha256) để lần chạy sau chỉ
+    tải lại những segment còn thiếu.
+    """
+
+    def __init__(self, output_path: str):
+        self.dir = output_path + ".parts"
+        self.manifest_path = os.path.join(self.dir, "manifest.jsonl")
+        self._lock = threading.Lock()
+        self._entries = {}
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _key(seg: HlsSegment) -> str:
+        # Bỏ query string vì token CDN thường đổi giữa các lần chạy
+        from urllib.parse import urlsplit
+        return f"{seg.sequence}:{urlsplit(seg.uri).path}"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+                except (ValueError, KeyError):
+                    continue  # dòng cuối có thể bị ghi dở khi crash
+
+    def _segment_path(self, seg: HlsSegment) -> str:
+        return os.path.join(self.dir, f"{seg.sequence:08d}.seg")
+
+    def read(self, seg: HlsSegment) -> Optional[bytes]:
+        """Trả về dữ liệu segment đã lưu nếu còn hợp lệ (đúng size + hash)."""
+        import hashlib
+        entry = self._entries.get(self._key(seg))
+        if not entry:
+            return None
+        try:
+            with open(self._segment_path(seg), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != entry["bytes"] or hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            return None
+        return data
+
+    def write(self, seg: HlsSegment, data: bytes) -> None:
+        import hashlib
+        path = self._segment_path(seg)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        entry = {
+            "key": self._key(seg),
+            "uri": seg.uri,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def completed_count(self) -> int:
+        return len(self._entries)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def fetch_hls_segment(segment: HlsSegment, retries: int = 3, store: Optional[SegmentStore] = None) -> bytes:
+    """Tải (và giải mã nếu cần) 1 segment, dùng lại bản đã lưu trong store nếu có."""
+    if store is not None:
+        data = store.read(segment)
+        if data is not None:
+            return data
+    data = _http_get_with_retry(segment.uri, segment.byterange, retries=retries)
+    if segment.key and segment.key.method == "AES-128":
+        key = _get_aes_key(segment.key.uri, retries)
+        iv = segment.key.iv or segment.sequence.to_bytes(16, "big")
+        data = _decrypt_aes128(data, key, iv)
+    if store is not None:
+        store.write(segment, data)
+    return data
+
+
+def native_download_supported(m3u8_url: str, prefer: str = "best", need_audio: bool = True) -> Optional[tuple]:
+    """
+    Kiểm tra playlist có tải native được không.
+
+    prefer: chọn variant 'best' (bandwidth cao nhất) hoặc 'lowest' từ master playlist.
+    need_audio=False: audio ở rendition riêng không cản tải native (chỉ cần hình).
+    Trả về (media_url, media_playlist, variant), hoặc None nếu cần dùng ffmpeg
+    (playlist live, SAMPLE-AES, AES-128 khi chưa cài `cryptography`, audio
+    tách riêng trong rendition khác...).
+    """
+    try:
+        text = _fetch_text(m3u8_url)
+        master = parse_master_playlist(text, m3u8_url)
+        if master["variants"]:
+            pick = max if prefer == "best" else min
+            best = pick(master["variants"], key=lambda v: v["bandwidth"])
+            # Audio nằm ở rendition riêng -> cần ghép 2 luồng, để ffmpeg xử lý
+            if need_audio and best.get("audio") and any(a["group_id"] == best["audio"] for a in master["audio"]):
+                return None
+            media_url = best["uri"]
+            playlist = parse_media_playlist(_fetch_text(media_url), media_url)
+        else:
+            best = None
+            media_url = m3u8_url
+            playlist = parse_media_playlist(text, media_url)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+    if not playlist["segments"] or not playlist["endlist"]:
+        return None
+    if any(seg.key and seg.key.method != "AES-128" for seg in playlist["segments"]):
+        return None
+    if any(seg.key for seg in playlist["segments"]) and not _aes128_available():
+        return None
+    return media_url, playlist, best
+
+
+def stream_hls_segments(segments: List[HlsSegment], write, workers: int = 8, retries: int = 3,
+                        on_segment=None, store: Optional[SegmentStore] = None) -> int:
+    """
+    Tải các segment song song (tối đa `workers` request cùng lúc) và gọi
+    write(bytes) theo đúng thứ tự. Init segment (#EXT-X-MAP) được ghi trước
+    mỗi khi thay đổi. Nếu có store, segment đã tải ở lần chạy trước được
+    đọc lại từ đĩa thay vì tải lại. Trả về tổng số bytes đã ghi.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    total_bytes = 0
+    last_init = None
+    window = max(1, workers) * 2  # giới hạn số segment nằm trong RAM
+    pending = []
+    seg_iter = iter(segments)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="hls")
+    try:
+        for seg in seg_iter:
+            pending.append((seg, executor.submit(fetch_hls_segment, seg, retries, store)))
+            if len(pending) >= window:
+                break
+
+        while pending:
+            seg, future = pending.pop(0)
+            data = future.result()
+            if seg.init_uri and (seg.init_uri, seg.init_byterange) != last_init:
+                init_data = _http_get_with_retry(seg.init_uri, seg.init_byterange, retries=retries)
+                write(init_data)
+                total_bytes += len(init_data)
+                last_init = (seg.init_uri, seg.init_byterange)
+            write(data)
+            total_bytes += len(data)
+            if on_segment:
+                on_segment(seg, len(data))
+
+            nxt = next(seg_iter, None)
+            if nxt is not None:
+                pending.append((nxt, executor.submit(fetch_hls_segment, nxt, retries, store)))
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return total_bytes
+
+
+def _download_native(m3u8_url: str, output_path: str, media_url: str, playlist: dict,
+                     ffmpeg_output_args: List[str], label: str, workers: int, retries: int,
+                     resume: bool = True, pcm: Optional["PcmBuffer"] = None) -> str:
+    """
+    Tải segment bằng native fetcher và đẩy qua stdin cho ffmpeg.
+
+    ffmpeg_output_args chứa cả (các) output của ffmpeg. Nếu có pcm, stdout của
+    ffmpeg (pipe:1) được đọc vào pcm song song với việc ghi stdin.
+
+    Với resume=True, segment được lưu kèm manifest trong `<output_path>.parts/`;
+    nếu bị gián đoạn, lần chạy sau chỉ tải các segment còn thiếu rồi ghép lại.
+    """
+    segments = playlist["segments"]
+    total_duration = playlist["total_duration"]
+
+    store = SegmentStore(output_path) if resume else None
+    if store is not None and store.completed_count():
+        console.print(f"   [cyan]Tiếp tục tải:[/cyan] [green]đã có {store.completed_count()}/{len(segments)} segments[/green]")
+
+    cmd = ["ffmpeg", "-y", "-v", "error", "-i", "pipe:0"] + ffmpeg_output_args
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE if pcm is not None else subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    pcm_thread = None
+    if pcm is not None:
+        pcm_thread = threading.Thread(target=pcm.consume, args=(process.stdout,), daemon=True)
+        pcm_thread.start()
+
+    done_duration = 0.0
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(complete_style="cyan", finished_style="green"),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TextColumn("({task.completed}/{task.total} segments)"),
+        TimeElapsedColumn(),
+        console=console,
+        disable=_ui_quiet()
+    ) as progress:
+        task = progress.add_task(f"{label} ({workers} luồng)", total=len(segments))
+
+        def on_segment(seg, size):
+            nonlocal done_duration
+            done_duration += seg.duration
+            progress.update(task, advance=1,
+                            description=f"{label} ({int(done_duration)}s / {int(total_duration)}s)")
+
+        try:
+            stream_hls_segments(segments, process.stdin.write, workers=workers, retries=retries,
+                                on_segment=on_segment, store=store)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        except BaseException:
+            process.kill()
+            process.wait()
+            if store is not None and store.completed_count():
+                console.print(f"   [dim]Đã giữ {store.completed_count()} segments trong {store.dir}, chạy lại để tiếp tục[/dim]")
+            raise
+
+    return_code = process.wait()
+    stderr_thread.join(timeout=1)
+    if pcm_thread is not None:
+        pcm_thread.join()
+    if return_code != 0:
+        stderr = b"".join(c for c in stderr_chunks if c).decode("utf-8", errors="replace")
+        raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr)
+    if store is not None:
+        store.cleanup()
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# PCM trong bộ nhớ: ffmpeg decode 1 lần, Whisper nhận thẳng mảng float32
+# ---------------------------------------------------------------------------
+
+PCM_SAMPLE_RATE = 16000
+_PCM_BYTES_PER_SECOND = PCM_SAMPLE_RATE * 4  # float32 mono
+_PCM_SPILL_SECONDS = 3600  # Audio dài hơn ngưỡng này được ghi tràn ra file và memory-map
+
+
+class PcmBuffer:
+    """
+    Gom PCM float32 16kHz mono từ stdout của ffmpeg.
+
+    Dữ liệu nằm trong RAM; khi vượt quá _PCM_SPILL_SECONDS thì được ghi tràn
+    ra spill_path và trả về dưới dạng memory-mapped array.
+    """
+
+    def __init__(self, spill_path: str):
+        self.spill_path = spill_path
+        self.nbytes = 0
+        self._buf = bytearray()
+        self._file = None
+
+    @property
+    def seconds(self) -> float:
+        return self.nbytes / _PCM_BYTES_PER_SECOND
+
+    def write(self, data: bytes) -> None:
+        if self._file is None and len(self._buf) + len(data) > _PCM_SPILL_SECONDS * _PCM_BYTES_PER_SECOND:
+            self._file = open(self.spill_path, "wb")
+            self._file.write(self._buf)
+            self._buf = bytearray()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buf += data
+        self.nbytes += len(data)
+
+    def consume(self, stream, on_progress=None, chunk_size: int = 1 << 20) -> None:
+        """Đọc hết stream (stdout của ffmpeg) vào buffer."""
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            self.write(data)
+            if on_progress:
+                on_progress(self.seconds)
+
+    def array(self) -> "np.ndarray":
+        """Trả về mảng float32 (np.memmap nếu đã ghi tràn ra file)."""
+        import numpy as np
+        usable = self.nbytes - self.nbytes % 4
+        if self._file is None:
+            return np.frombuffer(self._buf, dtype=np.float32, count=usable // 4)
+        self._file.close()
+        if not usable:
+            return np.zeros(0, dtype=np.float32)
+        # mode="c": copy-on-write, mảng ghi được nên torch.from_numpy không cảnh báo
+        return np.memmap(self.spill_path, dtype=np.float32, mode="c", shape=(usable // 4,))
+
+    def discard(self) -> None:
+        self._buf = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+
+def _pcm_output_args(select_args: List[str], wav_path: Optional[str] = None) -> List[str]:
+    """
+    Output ffmpeg: PCM float32 ra stdout, kèm WAV 16-bit cùng lượt decode nếu có wav_path.
+    """
+    resample = ["-ar", str(PCM_SAMPLE_RATE), "-ac", "1"]
+    args = select_args + resample + ["-acodec", "pcm_f32le", "-f", "f32le", "pipe:1"]
+    if wav_path:
+        args += select_args + resample + ["-acodec", "pcm_s16le", wav_path]
+    return args
+
+
+def _pcm_spill_path(audio_path: str) -> str:
+    return audio_path + ".pcm"
+
+
+def remove_pcm_spill(audio_path: str) -> None:
+    """Xóa file spill của PCM (gọi sau khi đã bỏ mọi tham chiếu tới mảng)."""
+    spill_path = _pcm_spill_path(audio_path)
+    if os.path.exists(spill_path):
+        gc.collect()  # Đóng memmap còn treo trước khi xóa (Windows không xóa được file đang map)
+        try:
+            os.remove(spill_path)
+        except OSError:
+            pass
+
+
+def _decode_pcm(input_args: List[str], select_args: List[str], wav_path: Optional[str],
+                spill_path: str, duration: float, label: str) -> "np.ndarray":
+    """
+    Chạy ffmpeg 1 lần, đọc PCM float32 từ stdout vào PcmBuffer (tùy chọn ghi thêm WAV).
+
+    Tiến độ tính theo số mẫu đã nhận, nên không cần `-progress`.
+    """
+    cmd = ["ffmpeg", "-y", "-v", "info"] + input_args + _pcm_output_args(select_args, wav_path)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    stderr_lines = []
+
+    def read_stderr():
+        nonlocal duration
+        for raw in process.stderr:
+            line = raw.decode("utf-8", errors="replace")
+            stderr_lines.append(line)
+            if not duration and "Duration:" in line:
+                duration = _parse_ffmpeg_duration(line)
+
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+
+    pcm = PcmBuffer(spill_path)
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[bold magenta]{task.description}"),
+        BarColumn(complete_style="magenta", finished_style="green"),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TimeElapsedColumn(),
+        console=console,
+        disable=_ui_quiet()
+    ) as progress:
+        task = progress.add_task(f"{label}...", total=100)
+
+        def on_progress(seconds: float) -> None:
+            if duration > 0:
+                progress.update(task, completed=min(seconds / duration * 100, 100),
+                                description=f"{label} ({int(seconds)}s / {int(duration)}s)")
+            else:
+                progress.update(task, description=f"{label} ({int(seconds)}s)")
+
+        try:
+            pcm.consume(process.stdout, on_progress)
+        except BaseException:
+            process.kill()
+            process.wait()
+            pcm.discard()
+            raise
+
+    return_code = process.wait()
+    stderr_thread.join(timeout=1)
+    if return_code != 0:
+        pcm.discard()
+        raise subprocess.CalledProcessError(return_code, cmd, stderr="".join(stderr_lines[-20:]))
+    return pcm.array()
+
+
+def download_audio_from_m3u8(m3u8_url: str, audio_path: str = "audio.wav", downloader: str = "native",
+                             workers: int = 8, retries: int = 3, resume: bool = True,
+                             in_memory: bool = False, keep_wav: bool = True) -> Union[str, "np.ndarray"]:
+    """
+    Chỉ tải audio từ m3u8 và decode thẳng sang WAV 16kHz mono (không tải video).
+
+    Với in_memory=True, PCM float32 được trả về dưới dạng mảng NumPy để đưa thẳng
+    vào Whisper; WAV chỉ được ghi (cùng lượt decode) khi keep_wav=True.
+    """
+    console.print("\n[bold magenta]Đang tải audio từ m3u8 (không tải video)...[/bold magenta]")
+    wav_path = audio_path if keep_wav or not in_memory else None
+    try:
+        source_url = select_audio_source(m3u8_url)
+        if source_url != m3u8_url:
+            console.print(f"   [dim]Dùng rendition: {source_url}[/dim]")
+
+        select_args = ["-map", "0:a:0", "-vn", "-sn", "-dn"]
+        pcm_args = select_args + ["-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1"]
+        if downloader == "native":
+            native = native_download_supported(source_url, prefer="lowest")
+            if native:
+                media_url, playlist, _ = native
+                if in_memory:
+                    pcm = PcmBuffer(_pcm_spill_path(audio_path))
+                    try:
+                        _download_native(source_url, audio_path, media_url, playlist,
+                                         _pcm_output_args(select_args, wav_path),
+                                         "Đang tải audio", workers, retries, resume, pcm)
+                    except BaseException:
+                        pcm.discard()
+                        raise
+                    console.print(f"[bold green]✓ Tải audio thành công[/bold green] [dim]({int(pcm.seconds)}s PCM trong bộ nhớ)[/dim]")
+                    return pcm.array()
+                _download_native(source_url, audio_path, media_url, playlist, pcm_args + [audio_path],
+                                 "Đang tải audio", workers, retries, resume)
+                console.print(f"[bold green]✓ Tải audio thành công[/bold green]")
+                return audio_path
+
+        if in_memory:
+            audio = _decode_pcm(["-i", source_url], select_args, wav_path,
+                                _pcm_spill_path(audio_path), 0, "Đang tải audio")
+            console.print(f"[bold green]✓ Tải audio thành công[/bold green] [dim]({len(audio) // PCM_SAMPLE_RATE}s PCM trong bộ nhớ)[/dim]")
+            return audio
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", source_url,
+        ] + pcm_args + [
+            "-progress", "pipe:1",
+            audio_path
+        ]
+        
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        
+        duration = 0
+        stderr_lines = []
+        
+        # Thread để đọc stderr và tìm duration
+        def read_stderr():
+            nonlocal duration
+            for line in process.stderr:
+                stderr_lines.append(line)
+                if not duration and "Duration:" in line:
+                    duration = _parse_ffmpeg_duration(line)
+        
+        stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+        stderr_thread.start()
+        
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[bold magenta]{task.description}"),
+            BarColumn(complete_style="magenta", finished_style="green"),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console,
+            disable=_ui_quiet()
+        ) as progress:
+            task = progress.add_task("Đang tải audio...", total=100)
+            for line in process.stdout:
+                line = line.strip()
+                if line.startswith("out_time_ms="):
+                    try:
+                        current_time = int(line.split("=")[1]) / 1_000_000
+                    except ValueError:
+                        continue
+                    if duration > 0:
+                        progress.update(task, completed=current_time / duration * 100,
+                                        description=f"Đang tải audio ({int(current_time)}s / {int(duration)}s)")
+                    else:
+                        progress.update(task, description=f"Đang tải audio ({int(current_time)}s)")
+        
+        return_code = process.wait()
+        stderr_thread.join(timeout=1)
+        
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, cmd, stderr="".join(stderr_lines[-20:]))
+        
+        console.print(f"[bold green]✓ Tải audio thành công[/bold green]")
+        return audio_path
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Đã hủy tiến trình tải audio[/yellow]")
+        if os.path.exists(audio_path):
+            try:
+                os.remove(audio_path)
+                console.print("[dim]Đã xóa file tạm[/dim]")
+            except:
+                pass
+        sys.exit(0)
+    except subprocess.CalledProcessError as e:
+        console.print(Panel(
+            f"[bold red]LỖI:[/bold red] Không thể tải audio từ URL\n"
+            f"[dim]{m3u8_url}[/dim]\n\n"
+            f"[yellow]Gợi ý:[/yellow] Kiểm tra URL m3u8 và kết nối internet"
+            + (f"\n\n[red]Chi tiết:[/red] {str(e.stderr)[-200:]}" if e.stderr else ""),
+            title="[bold red]Download Error[/bold red]",
+            border_style="red"
+        ))
+        sys.exit(1)
+    except Exception as e:
+        console.print(f"\n[bold red]LỖI:[/bold red] [red]{str(e)}[/red]")
+        sys.exit(1)
+
+
+def extract_audio(video_path: str, audio_path: str = "audio.wav", in_memory: bool = False,
+                  keep_wav: bool = True) -> Union[str, "np.ndarray"]:
+    """
+    Tách audio 16kHz mono từ video.
+
+    Mặc định ghi ra audio_path (WAV). Với in_memory=True, trả về mảng PCM float32
+    từ cùng 1 lượt decode (Whisper không phải decode lại file); WAV chỉ được ghi
+    thêm khi keep_wav=True.
+    """
+    console.print("\n[bold magenta]Đang tách audio...[/bold magenta]")
+    try:
+        # Lấy duration qua probe layer (dùng lại kết quả đã cache sau bước tải video)
+        duration = get_media_duration(video_path)
+        if duration <= 0:
+            console.print("   [yellow]Không thể lấy duration, sẽ hiển thị tiến độ ước lượng[/yellow]")
+        
+        if in_memory:
+            audio = _decode_pcm(["-i", video_path], ["-vn"], audio_path if keep_wav else None,
+                                _pcm_spill_path(audio_path), duration, "Đang tách audio")
+            console.print(f"[bold green]✓ Tách audio thành công[/bold green] [dim]({len(audio) // PCM_SAMPLE_RATE}s PCM trong bộ nhớ)[/dim]")
+            return audio
+        
+        # Extract audio with progress
+        cmd = [
+            "ffmpeg", "-y", "-i", video_path, "-vn", "-acodec", "pcm_s16le",
+            "-ar", "16000", "-ac", "1", "-progress", "pipe:1", audio_path
+        ]
+        
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+                                   text=True, bufsize=1)
+        
+        last_time = 0
+        
+        # Sử dụng Rich Progress (giống download video)
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[bold magenta]{task.description}"),
+            BarColumn(complete_style="magenta", finished_style="green"),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console,
+            disable=_ui_quiet()
+        ) as progress:
+            if duration > 0:
+                task = progress.add_task(f"Đang tách audio (0s / {int(duration)}s)", total=100)
+            else:
+                task = progress.add_task("Đang tách audio...", total=100)
+            
+            try:
+                while True:
+                    line = process.stdout.readline()
+                    if not line:
+                        break
+                    
+                    line = line.strip()
+                    
+                    if line.startswith("out_time_ms="):
+                        try:
+                            time_ms = int(line.split("=")[1])
+                            current_time = time_ms / 1_000_000
+                            
+                            if current_time > last_time:
+                                last_time = current_time
+                                
+                                if duration > 0:
+                                    percent = (current_time / duration) * 100
+                                    progress.update(task, completed=percent, description=f"Đang tách audio ({int(current_time)}s / {int(duration)}s)")
+                                else:
+                                    progress.update(task, description=f"Đang tách audio ({int(current_time)}s)")
+                        except:
+                            pass
+            except KeyboardInterrupt:
+                progress.stop()
+                raise
+        
+        return_code = process.wait(timeout=300)
+        
+        if return_code != 0:
+            try:
+                stderr = process.stderr.read()
+            except:
+                stderr = ""
+            raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr)
+        
+        console.print(f"[bold green]✓ Tách audio thành công[/bold green]")
+        return audio_path
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Đã hủy tiến trình tách audio[/yellow]")
+        if os.path.exists(audio_path):
+            try:
+                os.remove(audio_path)
+                console.print("[dim]Đã xóa file tạm[/dim]")
+            except:
+                pass
+        sys.exit(0)
+    except subprocess.TimeoutExpired:
+        console.print(Panel(
+            "[bold red]LỖI:[/bold red] Timeout khi tách audio (quá 5 phút)",
+            title="[bold red]Timeout Error[/bold red]",
+            border_style="red"
+        ))
+        sys.exit(1)
+    except subprocess.CalledProcessError as e:
+        console.print(Panel(
+            "[bold red]LỖI:[/bold red] Không thể tách audio từ video\n\n"
+            "[yellow]Gợi ý:[/yellow] Kiểm tra file video có lỗi không",
+            title="[bold red]Audio Extraction Error[/bold red]",
+            border_style="red"
+        ))
+        sys.exit(1)
+    except Exception as e:
+        console.print(f"\n[bold red]LỖI:[/bold red] [red]{str(e)}[/red]")
+        sys.exit(1)
+
+
+def _format_timestamp(seconds: float) -> str:
+    hrs = int(seconds // 3600)
+    mins = int((seconds % 3600) // 60)
+    secs = seconds % 60
+    return f"{hrs:02d}:{mins:02d}:{secs:06.3f}"
+
+
+def result_to_vtt(result: dict) -> str:
+    if isinstance(result.get("vtt"), str):
+        return result["vtt"]
+
+    segments = result.get("segments") or []
+    lines = ["WEBVTT", ""]
+    for seg in segments:
+        start = _format_timestamp(seg.get("start", 0.0))
+        end = _format_timestamp(seg.get("end", 0.0))
+        text = seg.get("text", "").strip()
+        lines.append(f"{start} --> {end}")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines)
+
+
+
+
+
+def display_usage():
+    """Hiển thị hướng dẫn sử dụng chi tiết"""
+    console.print("\n")
+    
+    # Tiêu đề hướng dẫn
+    title = Text("HƯỚNG DẪN SỬ DỤNG", style="bold cyan")
+    console.print(Panel(title, box=box.DOUBLE, border_style="cyan", padding=(0, 2)))
+    console.print()
+    
+    # Phần 1: Giới thiệu
+    console.print(Panel(
         "[bold yellow]Whisper M3U8 Transcriber[/bold yellow]\n\n"
         "Công cụ tải video từ URL m3u8, tách âm thanh và nhận dạng giọng nói bằng OpenAI Whisper.\n"
         "Hỗ trợ 2 chế độ xử lý: Direct (1 video) và Batch (nhiều video từ JSON).",
@@ -490,7 +1796,8 @@ def display_usage():
         '[dim]• root_path: Thư mục gốc\n'
         '• slug: Tên thư mục con\n'
         '• m3u8_url: URL video m3u8\n'
-        '• folder_name: Tên nhóm file[/dim]',
+        '• folder_name: Tên nhóm file\n'
+        '• profile: (tùy chọn) Decoding profile cho item: fast/balanced/accurate[/dim]',
         title="[bold]Cấu trúc file JSON (Batch Mode)[/bold]",
         border_style="yellow"
     ))
@@ -528,88 +1835,949 @@ def display_usage():
     console.input("[dim]Nhấn Enter để quay lại menu chính...[/dim]")
 
 
-def display_menu():
-    """Hiển thị menu chính với Rich styling"""
-    console = Console()
-    
-    # ASCII Art Logo với gradient màu
-    logo = Text()
-    logo_text = r"""
-██╗      ██████╗ ██╗  ██╗ ██████╗ ██╗  ██╗ ██████╗  ██████╗ ██████╗ ██████╗ ██████╗ ███████╗
-╚██╗     ██╔══██╗██║  ██║██╔═══██╗██║  ██║██╔═══██╗██╔════╝██╔════╝██╔═══██╗██╔══██╗██╔════╝
- ╚██╗    ██████╔╝███████║██║   ██║███████║██║   ██║██║     ██║     ██║   ██║██║  ██║█████╗  
- ██╔╝    ██╔═══╝ ██╔══██║██║   ██║██╔══██║██║   ██║██║     ██║     ██║   ██║██║  ██║██╔══╝  
-██╔╝     ██║     ██║  ██║╚██████╔╝██║  ██║╚██████╔╝╚██████╗╚██████╗╚██████╔╝██████╔╝███████╗
-╚═╝      ╚═╝     ╚═╝  ╚═╝ ╚═════╝ ╚═╝  ╚═╝ ╚═════╝  ╚═════╝ ╚═════╝ ╚═════╝ ╚═════╝ ╚══════╝
+def display_menu():
+    """Hiển thị menu chính với Rich styling"""
+    console = Console()
+    
+    # ASCII Art Logo với gradient màu
+    logo = Text()
+    logo_text = r"""
+██╗      ██████╗ ██╗  ██╗ ██████╗ ██╗  ██╗ ██████╗  ██████╗ ██████╗ ██████╗ ██████╗ ███████╗
+╚██╗     ██╔══██╗██║  ██║██╔═══██╗██║  ██║██╔═══██╗██╔════╝██╔════╝██╔═══██╗██╔══██╗██╔════╝
+ ╚██╗    ██████╔╝███████║██║   ██║███████║██║   ██║██║     ██║     ██║   ██║██║  ██║█████╗  
+ ██╔╝    ██╔═══╝ ██╔══██║██║   ██║██╔══██║██║   ██║██║     ██║     ██║   ██║██║  ██║██╔══╝  
+██╔╝     ██║     ██║  ██║╚██████╔╝██║  ██║╚██████╔╝╚██████╗╚██████╗╚██████╔╝██████╔╝███████╗
+╚═╝      ╚═╝     ╚═╝  ╚═╝ ╚═════╝ ╚═╝  ╚═╝ ╚═════╝  ╚═════╝ ╚═════╝ ╚═════╝ ╚═════╝ ╚══════╝
+    """
+
+
+    
+    # Tạo gradient từ cyan sang magenta
+    lines = logo_text.strip().split('\n')
+    for i, line in enumerate(lines):
+        # Tạo màu gradient từ cyan -> blue -> magenta
+        color_progress = i / (len(lines) - 1)
+        if color_progress < 0.5:
+            color = f"rgb({int(0 + color_progress * 2 * 100)},{int(255 - color_progress * 2 * 100)},{255})"
+        else:
+            progress = (color_progress - 0.5) * 2
+            color = f"rgb({int(100 + progress * 155)},{int(155 - progress * 155)},{255})"
+        logo.append(line + "\n", style=color)
+    
+    console.print(logo)
+    
+    # Subtitle
+    subtitle = Text("WHISPER M3U8 TRANSCRIBER BY PHOHOCCODE", style="bold bright_white")
+    console.print(Panel(subtitle, box=box.DOUBLE, border_style="bright_cyan"))
+    
+    console.print()
+
+# ---------------------------------------------------------------------------
+# Model registry: giữ model Whisper trong bộ nhớ giữa các item (LRU + giới hạn)
+# ---------------------------------------------------------------------------
+
+# key (model_name, device, dtype) -> (model, size_bytes), thứ tự = LRU
+_MODEL_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_MODEL_CACHE_LOCK = threading.RLock()
+_MODEL_CACHE_MAX_BYTES = 4096 * 1024 * 1024
+
+
+def set_model_cache_limit(max_mb: int) -> None:
+    """Set memory cap (MB) for resident models. 0 = unlimited."""
+    global _MODEL_CACHE_MAX_BYTES
+    _MODEL_CACHE_MAX_BYTES = max(0, int(max_mb)) * 1024 * 1024
+    with _MODEL_CACHE_LOCK:
+        _evict_models(0)
+
+
+def _estimate_model_bytes(model) -> int:
+    """Approximate memory used by model parameters and buffers."""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    except Exception:
+        return 0
+
+
+def _free_model(model, device: str) -> None:
+    del model
+    gc.collect()
+    if device == "cuda":
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def _evict_models(incoming_bytes: int) -> None:
+    """Evict least recently used models until incoming_bytes fits under the cap."""
+    if _MODEL_CACHE_MAX_BYTES <= 0:
+        return
+    used = sum(size for _, size in _MODEL_CACHE.values())
+    while _MODEL_CACHE and used + incoming_bytes > _MODEL_CACHE_MAX_BYTES:
+        key, (model, size) = _MODEL_CACHE.popitem(last=False)
+        used -= size
+        console.print(f"   [dim]Giải phóng model {key[0]} ({key[1]}) khỏi bộ nhớ[/dim]")
+        shutdown_cpu_pools(key[0])
+        _free_model(model, key[1])
+
+
+def get_model(model_name: str, device: str, dtype: str = "float32"):
+    """Return a resident Whisper model, loading it on first use.
+
+    Models are keyed by (model_name, device, dtype) and kept in LRU order;
+    older models are evicted when the memory cap would be exceeded.
+    """
+    key = (model_name, device, dtype)
+    with _MODEL_CACHE_LOCK:
+        if key in _MODEL_CACHE:
+            _MODEL_CACHE.move_to_end(key)
+            console.print(f"   [dim]Dùng lại model đã tải: {model_name}[/dim]")
+            return _MODEL_CACHE[key][0]
+
+        with _status(f"[bold blue]Đang tải model {model_name}..."):
+            import whisper
+            model = whisper.load_model(model_name, device=device)
+        size = _estimate_model_bytes(model)
+        _evict_models(size)
+        _MODEL_CACHE[key] = (model, size)
+        return model
+
+
+_MODEL_RUN_LOCKS: dict = {}
+
+
+def model_run_lock(model_name: str, device: str, dtype: str = "float32") -> threading.Lock:
+    """Lock để tuần tự hóa inference trên cùng 1 model (kv-cache hooks của Whisper không thread-safe)."""
+    key = (model_name, device, dtype)
+    with _MODEL_CACHE_LOCK:
+        if key not in _MODEL_RUN_LOCKS:
+            _MODEL_RUN_LOCKS[key] = threading.Lock()
+        return _MODEL_RUN_LOCKS[key]
+
+
+def release_models(model_name: Optional[str] = None) -> int:
+    """Release resident models (all, or only those named model_name). Returns count released."""
+    shutdown_cpu_pools(model_name)
+    released = 0
+    with _MODEL_CACHE_LOCK:
+        for key in list(_MODEL_CACHE.keys()):
+            if model_name is None or key[0] == model_name:
+                model, _ = _MODEL_CACHE.pop(key)
+                _free_model(model, key[1])
+                released += 1
+    return released
+
+
+# ---------------------------------------------------------------------------
+# Decoding profiles và thống kê temperature fallback
+# ---------------------------------------------------------------------------
+
+# Các tham số decode của Whisper theo profile (task/fp16/language/prompt được thêm khi chạy)
+DECODING_PROFILES = {
+    # Greedy, không fallback: nhanh nhất, có thể lặp/sai trên audio khó
+    "fast": {
+        "condition_on_previous_text": False,
+        "temperature": (0.0,),
+        "compression_ratio_threshold": None,
+        "logprob_threshold": None,
+        "no_speech_threshold": 0.6,
+    },
+    # Cấu hình mặc định trước đây: fallback 6 mức temperature, best_of 5
+    "balanced": {
+        "condition_on_previous_text": False,  # Tắt để tránh lặp lại context
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),  # Fallback temperatures để giảm lặp
+        "compression_ratio_threshold": 2.4,  # Phát hiện lỗi tốt hơn
+        "logprob_threshold": -1.0,  # Lọc kết quả không chắc chắn
+        "no_speech_threshold": 0.6,  # Tăng ngưỡng để lọc nhạc/noise
+        "best_of": 5,  # Lấy kết quả tốt nhất trong 5 lần decode (giảm lặp)
+    },
+    # Beam search ở temperature 0 + fallback như balanced
+    "accurate": {
+        "condition_on_previous_text": False,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "compression_ratio_threshold": 2.4,
+        "logprob_threshold": -1.0,
+        "no_speech_threshold": 0.6,
+        "best_of": 5,
+        "beam_size": 5,
+    },
+}
+
+
+@contextlib.contextmanager
+def decode_stats(model):
+    """
+    Đếm số window phải fallback temperature và thời gian của các lần decode fallback.
+
+    Bọc model.decode (transcribe gọi 1 lần mỗi window ở temperature 0, và thêm
+    1 lần cho mỗi mức temperature fallback). Gọi trong model_run_lock.
+    """
+    stats = {"windows": 0, "fallback_windows": 0, "fallback_decodes": 0,
+             "decode_seconds": 0.0, "fallback_seconds": 0.0}
+    original = model.decode
+    last_temperature = [None]
+
+    def decode(segment, options):
+        start = time.perf_counter()
+        result = original(segment, options)
+        elapsed = time.perf_counter() - start
+        stats["decode_seconds"] += elapsed
+        if options.temperature > 0:
+            if last_temperature[0] == 0:
+                stats["fallback_windows"] += 1
+            stats["fallback_decodes"] += 1
+            stats["fallback_seconds"] += elapsed
+        else:
+            stats["windows"] += 1
+        last_temperature[0] = options.temperature
+        return result
+
+    model.decode = decode
+    try:
+        yield stats
+    finally:
+        del model.decode  # Trở lại phương thức của class
+
+
+def merge_decode_stats(items: List[dict]) -> dict:
+    merged = {"windows": 0, "fallback_windows": 0, "fallback_decodes": 0,
+              "decode_seconds": 0.0, "fallback_seconds": 0.0}
+    for stats in items:
+        for key in merged:
+            merged[key] += stats.get(key, 0)
+    return merged
+
+
+def format_decode_stats(stats: dict) -> str:
+    share = stats["fallback_seconds"] / stats["decode_seconds"] * 100 if stats["decode_seconds"] else 0
+    return (f"{stats['fallback_windows']}/{stats['windows']} windows fallback, "
+            f"{stats['fallback_seconds']:.1f}s / {stats['decode_seconds']:.1f}s decode ({share:.0f}%)")
+
+
+# ---------------------------------------------------------------------------
+# VAD: chỉ đưa các vùng có giọng nói vào Whisper, rồi map timestamp về timeline gốc
+# ---------------------------------------------------------------------------
+
+_VAD_FRAME_SAMPLES = 480  # 30ms @ 16kHz
+_VAD_MIN_SPEECH = 0.25  # Bỏ vùng ngắn hơn (giây)
+_VAD_MIN_SILENCE = 0.5  # Gộp các vùng cách nhau ít hơn (giây)
+_VAD_PAD = 0.2  # Nới mỗi vùng ra 2 phía (giây)
+
+_SILERO_MODEL = None
+_SILERO_LOCK = threading.Lock()
+
+
+def _merge_regions(regions: List[tuple], total: int) -> List[tuple]:
+    """Nới, gộp và lọc các vùng (start, end) tính theo sample."""
+    pad = int(_VAD_PAD * PCM_SAMPLE_RATE)
+    min_gap = int(_VAD_MIN_SILENCE * PCM_SAMPLE_RATE)
+    min_len = int(_VAD_MIN_SPEECH * PCM_SAMPLE_RATE)
+    merged = []
+    for start, end in regions:
+        if end - start < min_len:
+            continue
+        start, end = max(0, start - pad), min(total, end + pad)
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _energy_speech_regions(audio: "np.ndarray", margin_db: float = 10.0, floor_db: float = -55.0) -> List[tuple]:
+    """VAD theo năng lượng: frame 30ms có RMS vượt noise floor + margin_db được coi là giọng nói."""
+    import numpy as np
+
+    n_frames = len(audio) // _VAD_FRAME_SAMPLES
+    if not n_frames:
+        return []
+    # Tính theo khối để không nhân đôi bộ nhớ với audio dài (memmap)
+    db = np.empty(n_frames, dtype=np.float32)
+    block = 10000
+    for i in range(0, n_frames, block):
+        j = min(i + block, n_frames)
+        frames = np.asarray(audio[i * _VAD_FRAME_SAMPLES:j * _VAD_FRAME_SAMPLES]).reshape(j - i, _VAD_FRAME_SAMPLES)
+        rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+        db[i:j] = 20 * np.log10(rms + 1e-10)
+    threshold = max(float(np.percentile(db, 10)) + margin_db, floor_db)
+
+    voiced = np.concatenate(([False], db > threshold, [False]))
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8)))
+    return [(int(s) * _VAD_FRAME_SAMPLES, int(e) * _VAD_FRAME_SAMPLES) for s, e in zip(edges[::2], edges[1::2])]
+
+
+def _silero_speech_regions(audio: "np.ndarray") -> List[tuple]:
+    """VAD bằng model Silero (CPU, cần gói `silero-vad`); lọc được cả nhạc nền."""
+    global _SILERO_MODEL
+    try:
+        from silero_vad import load_silero_vad, get_speech_timestamps
+    except ImportError:
+        raise RuntimeError("VAD 'silero' cần gói silero-vad, vui lòng cài: pip install silero-vad")
+    import numpy as np
+    import torch
+
+    with _SILERO_LOCK:
+        if _SILERO_MODEL is None:
+            _SILERO_MODEL = load_silero_vad()
+        stamps = get_speech_timestamps(torch.from_numpy(np.ascontiguousarray(audio)), _SILERO_MODEL,
+                                       sampling_rate=PCM_SAMPLE_RATE)
+    return [(s["start"], s["end"]) for s in stamps]
+
+
+def detect_speech_regions(audio: "np.ndarray", method: str = "energy") -> List[tuple]:
+    """Trả về các vùng có giọng nói [(start, end)] tính theo sample."""
+    if method == "silero":
+        regions = _silero_speech_regions(audio)
+    else:
+        regions = _energy_speech_regions(audio)
+    return _merge_regions(regions, len(audio))
+
+
+def apply_vad(audio: "np.ndarray", method: str = "energy") -> tuple:
     """
+    Ghép các vùng có giọng nói thành 1 mảng liền.
 
+    Trả về (audio_rút_gọn, speech_map) với speech_map là danh sách
+    (start trên timeline rút gọn, start trên timeline gốc, độ dài) tính theo giây.
+    """
+    import numpy as np
+
+    regions = detect_speech_regions(audio, method)
+    speech_map = []
+    offset = 0
+    for start, end in regions:
+        speech_map.append((offset / PCM_SAMPLE_RATE, start / PCM_SAMPLE_RATE, (end - start) / PCM_SAMPLE_RATE))
+        offset += end - start
+    if not regions:
+        return np.zeros(0, dtype=np.float32), speech_map
+    return np.concatenate([audio[start:end] for start, end in regions]), speech_map
+
+
+def _map_vad_time(t: float, speech_map: List[tuple], is_end: bool = False) -> float:
+    """Đổi thời điểm t trên timeline rút gọn về timeline gốc."""
+    starts = [m[0] for m in speech_map]
+    # Điểm kết thúc nằm đúng ranh giới 2 vùng thuộc về vùng trước
+    k = (bisect.bisect_left(starts, t) if is_end else bisect.bisect_right(starts, t)) - 1
+    compact_start, orig_start, length = speech_map[max(k, 0)]
+    return orig_start + min(max(t - compact_start, 0.0), length)
+
+
+def _remap_segment(seg: dict, speech_map: List[tuple]) -> dict:
+    """Bản sao của segment với timestamp (và word nếu có) trên timeline gốc."""
+    seg = dict(seg, start=_map_vad_time(seg["start"], speech_map),
+               end=_map_vad_time(seg["end"], speech_map, is_end=True))
+    if seg.get("words"):
+        seg["words"] = [dict(w, start=_map_vad_time(w["start"], speech_map),
+                             end=_map_vad_time(w["end"], speech_map, is_end=True)) for w in seg["words"]]
+    return seg
+
+
+def remap_vad_timestamps(result: dict, speech_map: List[tuple]) -> dict:
+    """Map timestamp của segment (và word nếu có) về timeline gốc."""
+    if not speech_map:
+        return result
+    result["segments"] = [_remap_segment(seg, speech_map) for seg in result.get("segments", [])]
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Nhận dạng song song trên CPU: chia audio tại các khoảng lặng, mỗi chunk chạy
+# trong 1 process worker (weights của model dùng chung qua shared memory)
+# ---------------------------------------------------------------------------
+
+_CHUNK_MIN_SECONDS = 60
+_CHUNK_MAX_SECONDS = 600
+_CHUNK_OVERLAP_SECONDS = 2.0  # Chỉ dùng khi buộc phải cắt giữa vùng có giọng nói
+
+_CPU_POOLS: dict = {}
+_CPU_POOLS_LOCK = threading.Lock()
+_WORKER_MODEL = None
+
+
+def plan_audio_chunks(audio: "np.ndarray", workers: int) -> List[tuple]:
+    """
+    Chia audio thành các chunk [(start, end, own_start, own_end)] tính theo sample.
+
+    Điểm cắt ưu tiên giữa các khoảng lặng (theo VAD năng lượng) gần độ dài mục tiêu;
+    nếu không có thì cắt cứng và 2 chunk kề nhau chồng lên nhau _CHUNK_OVERLAP_SECONDS.
+    [own_start, own_end) là phần timeline mà chunk chịu trách nhiệm khi ghép kết quả.
+    """
+    total = len(audio)
+    target = int(min(max(total / PCM_SAMPLE_RATE / (workers * 2), _CHUNK_MIN_SECONDS), _CHUNK_MAX_SECONDS) * PCM_SAMPLE_RATE)
+    regions = detect_speech_regions(audio, "energy")
+    gaps = [(a[1] + b[0]) // 2 for a, b in zip(regions, regions[1:])]
+    overlap = int(_CHUNK_OVERLAP_SECONDS * PCM_SAMPLE_RATE)
+
+    cuts = [(0, False)]  # (vị trí, cắt cứng?)
+    while total - cuts[-1][0] > target * 1.25:
+        want = cuts[-1][0] + target
+        window = [g for g in gaps if abs(g - want) <= target // 4]
+        cuts.append((min(window, key=lambda g: abs(g - want)), False) if window else (want, True))
+    cuts.append((total, False))
+
+    chunks = []
+    for (own_start, hard_start), (own_end, hard_end) in zip(cuts, cuts[1:]):
+        start = max(0, own_start - overlap) if hard_start else own_start
+        end = min(total, own_end + overlap) if hard_end else own_end
+        chunks.append((start, end, own_start, own_end))
+    return chunks
+
+
+def _cpu_worker_init(model, threads: int) -> None:
+    global _WORKER_MODEL
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = model
+
+
+def _cpu_worker_transcribe(index: int, audio: "np.ndarray", kwargs: dict) -> tuple:
+    with decode_stats(_WORKER_MODEL) as stats:
+        result = _WORKER_MODEL.transcribe(audio, **kwargs)
+    return index, result, stats
+
+
+def _get_cpu_pool(model_name: str, model, workers: int):
+    """Process pool giữ lại giữa các item; model được chia sẻ qua torch shared memory."""
+    key = (model_name, workers)
+    with _CPU_POOLS_LOCK:
+        pool = _CPU_POOLS.get(key)
+        if pool is None:
+            import torch.multiprocessing as mp
+            from concurrent.futures import ProcessPoolExecutor
+            model.share_memory()
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                       initializer=_cpu_worker_init, initargs=(model, threads))
+            _CPU_POOLS[key] = pool
+        return pool
+
+
+def shutdown_cpu_pools(model_name: Optional[str] = None) -> None:
+    with _CPU_POOLS_LOCK:
+        for key in list(_CPU_POOLS.keys()):
+            if model_name is None or key[0] == model_name:
+                _CPU_POOLS.pop(key).shutdown(wait=True, cancel_futures=True)
+
+
+def _detect_language(model, audio: "np.ndarray") -> str:
+    """Nhận diện ngôn ngữ 1 lần trên 30s đầu để mọi chunk dùng chung."""
+    import whisper
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+class ChunkStitcher:
+    """
+    Ghép kết quả các chunk (theo thứ tự) về timeline chung, bỏ segment trùng ở
+    vùng chồng lấn; mỗi segment được đưa cho on_segment ngay khi chunk của nó xong.
+    """
+
+    def __init__(self, on_segment=None):
+        self.on_segment = on_segment
+        self.segments: List[dict] = []
+        self.language = ""
+
+    def add(self, chunk: tuple, result: dict) -> None:
+        start, _, own_start, own_end = chunk
+        offset = start / PCM_SAMPLE_RATE
+        if not self.language:
+            self.language = result.get("language", "")
+        for seg in result.get("segments", []):
+            seg = dict(seg, start=seg["start"] + offset, end=seg["end"] + offset)
+            # Vùng chồng lấn: segment thuộc về chunk chứa điểm giữa của nó
+            middle = (seg["start"] + seg["end"]) / 2 * PCM_SAMPLE_RATE
+            if not own_start <= middle < own_end:
+                continue
+            last = self.segments[-1] if self.segments else None
+            if last and seg["text"].strip() == last["text"].strip() and seg["start"] < last["end"]:
+                continue
+            if seg.get("words"):
+                seg["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in seg["words"]]
+            seg["id"] = len(self.segments)
+            self.segments.append(seg)
+            if self.on_segment:
+                self.on_segment(seg)
+
+    def result(self) -> dict:
+        return {
+            "text": "".join(seg["text"] for seg in self.segments),
+            "segments": self.segments,
+            "language": self.language,
+        }
+
+
+def stitch_chunk_results(chunks: List[tuple], results: List[dict]) -> dict:
+    """Ghép kết quả các chunk về timeline chung, bỏ segment trùng ở vùng chồng lấn."""
+    stitcher = ChunkStitcher()
+    for chunk, result in zip(chunks, results):
+        stitcher.add(chunk, result)
+    return stitcher.result()
+
+
+def transcribe_parallel(model_name: str, model, audio: "np.ndarray", kwargs: dict, workers: int,
+                        on_segment=None) -> dict:
+    """
+    Chia audio thành chunk và nhận dạng song song trên `workers` process CPU.
+    Segment được đưa cho on_segment theo đúng thứ tự thời gian khi các chunk liền trước đã xong.
+    """
+    from concurrent.futures import as_completed
+
+    chunks = plan_audio_chunks(audio, workers)
+    kwargs = dict(kwargs, verbose=None)
+    if not kwargs.get("language"):
+        # Model dùng chung với các thread khác (--jobs, pipeline): chạy trong lock như mọi lần gọi model
+        with model_run_lock(model_name, "cpu", "float32"):
+            kwargs["language"] = _detect_language(model, audio)
+        console.print(f"   [cyan]Ngôn ngữ phát hiện:[/cyan] [yellow]{kwargs['language']}[/yellow]")
+    console.print(f"   [cyan]Song song:[/cyan] [green]{len(chunks)} chunks / {workers} process[/green]")
+
+    pool = _get_cpu_pool(model_name, model, workers)
+    results: List[Optional[dict]] = [None] * len(chunks)
+    stats: List[dict] = []
+    stitcher = ChunkStitcher(on_segment)
+    next_index = 0
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(complete_style="blue", finished_style="green"),
+        TextColumn("({task.completed}/{task.total} chunks)"),
+        TimeElapsedColumn(),
+        console=console,
+        disable=_ui_quiet()
+    ) as progress:
+        task = progress.add_task("Đang nhận dạng", total=len(chunks))
+        futures = [pool.submit(_cpu_worker_transcribe, i, audio[start:end], kwargs)
+                   for i, (start, end, _, _) in enumerate(chunks)]
+        try:
+            for future in as_completed(futures):
+                index, result, chunk_stats = future.result()
+                results[index] = result
+                stats.append(chunk_stats)
+                progress.update(task, advance=1)
+                while next_index < len(chunks) and results[next_index] is not None:
+                    stitcher.add(chunks[next_index], results[next_index])
+                    results[next_index] = {}  # Đã ghép, giải phóng
+                    next_index += 1
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    result = stitcher.result()
+    result["decode_stats"] = merge_decode_stats(stats)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Nhận dạng theo cửa sổ với bộ nhớ cố định: PCM được đọc từng block (pipe ffmpeg
+# hoặc file spill), mỗi cửa sổ tự tính mel; chỉ ngôn ngữ, offset và (nếu profile
+# bật condition_on_previous_text) đoạn text cuối được mang sang cửa sổ sau
+# ---------------------------------------------------------------------------
+
+WINDOW_DEFAULT_SECONDS = 120
+# --window-seconds không chỉ định: chỉ chia cửa sổ khi audio dài hơn ngưỡng này
+WINDOW_AUTO_MIN_SECONDS = 3600
+
+
+def effective_window_seconds(window_seconds: Optional[float], audio_seconds: float) -> Optional[float]:
+    """
+    Độ dài cửa sổ thực dùng, None = 1 lần model.transcribe cho cả audio.
+
+    window_seconds None: tự bật cửa sổ WINDOW_DEFAULT_SECONDS khi audio dài hơn
+    WINDOW_AUTO_MIN_SECONDS; 0: luôn tắt; > 0: luôn dùng cửa sổ đó.
+    """
+    if window_seconds is None:
+        return WINDOW_DEFAULT_SECONDS if audio_seconds > WINDOW_AUTO_MIN_SECONDS else None
+    return window_seconds if window_seconds > 0 else None
+# Độ dài tối đa của text cửa sổ trước dùng làm prompt (nhận dạng theo cửa sổ và chế độ live)
+_PROMPT_CONTEXT_CHARS = 200
+
+
+def iter_pcm_blocks(audio: Union[str, "np.ndarray"], block_samples: int):
+    """
+    Đọc PCM float32 16kHz theo block block_samples sample mà không nạp cả file:
+    file audio được decode qua pipe ffmpeg, PCM đã spill (memmap) được đọc thẳng từ file.
+    """
+    import numpy as np
+    if isinstance(audio, str):
+        cmd = ["ffmpeg", "-nostdin", "-v", "error", "-i", audio,
+               "-f", "f32le", "-ac", "1", "-ar", str(PCM_SAMPLE_RATE), "pipe:1"]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                data = process.stdout.read(block_samples * 4)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+        return_code = process.wait()
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, cmd)
+    elif isinstance(audio, np.memmap) and audio.filename and not isinstance(audio.base, np.ndarray):
+        # Không chạm vào memmap: các trang đã đọc sẽ tính vào RSS tới khi unmap
+        with open(audio.filename, "rb") as f:
+            f.seek(audio.offset)
+            remaining = len(audio)
+            while remaining > 0:
+                block = np.fromfile(f, dtype=np.float32, count=min(block_samples, remaining))
+                if not len(block):
+                    break
+                remaining -= len(block)
+                yield block
+    else:
+        for i in range(0, len(audio), block_samples):
+            yield audio[i:i + block_samples]
+
+
+def transcribe_windowed(model_name: str, model, device: str, dtype: str, audio: Union[str, "np.ndarray"],
+                        kwargs: dict, on_segment=None, window_seconds: float = WINDOW_DEFAULT_SECONDS) -> dict:
+    """
+    Nhận dạng tuần tự từng cửa sổ ~window_seconds (cắt ở chỗ yên lặng nhất gần cuối),
+    giữ tối đa ~2 cửa sổ PCM trong bộ nhớ bất kể độ dài audio. Segment được đưa cho
+    on_segment ngay khi cửa sổ chứa nó xong.
+    """
+    import numpy as np
+    window = int(window_seconds * PCM_SAMPLE_RATE)
+    kwargs = dict(kwargs, verbose=None)
+    base_prompt = kwargs.get("initial_prompt")
+    carry_text = kwargs.get("condition_on_previous_text", False)
+
+    stitcher = ChunkStitcher(on_segment)
+    stats: List[dict] = []
+    blocks = iter_pcm_blocks(audio, window)
+    pending = np.zeros(0, dtype=np.float32)
+    exhausted = False
+    offset = 0
+    while True:
+        while len(pending) <= window and not exhausted:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                pending = np.concatenate([pending, block])
+        if not len(pending):
+            break
+        cut = len(pending) if len(pending) <= window else _quiet_cut(pending[:window])
+        piece, pending = pending[:cut], pending[cut:]
+
+        if not kwargs.get("language"):
+            with model_run_lock(model_name, device, dtype):
+                kwargs["language"] = _detect_language(model, piece)
+            console.print(f"   [cyan]Ngôn ngữ phát hiện:[/cyan] [yellow]{kwargs['language']}[/yellow]")
+        with model_run_lock(model_name, device, dtype), decode_stats(model) as window_stats:
+            result = model.transcribe(piece, **kwargs)
+        # Cửa sổ không chồng lấn: mọi segment đều thuộc về cửa sổ của nó
+        stitcher.add((offset, offset + cut, 0, float("inf")), result)
+        stats.append(window_stats)
+        if carry_text:
+            tail = "".join(seg["text"] for seg in result.get("segments", []))[-_PROMPT_CONTEXT_CHARS:].strip()
+            kwargs["initial_prompt"] = tail or base_prompt
+        offset += cut
+    result = stitcher.result()
+    result["decode_stats"] = merge_decode_stats(stats)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Cache kết quả nhận dạng: key = hash PCM + model + ngôn ngữ + task + tham số decode
+# ---------------------------------------------------------------------------
+
+_RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def _get_result_cache_dir() -> str:
+    """Return path to transcription result cache directory in current directory."""
+    return ".whisper_m3u8_transcriber_results"
 
-    
-    # Tạo gradient từ cyan sang magenta
-    lines = logo_text.strip().split('\n')
-    for i, line in enumerate(lines):
-        # Tạo màu gradient từ cyan -> blue -> magenta
-        color_progress = i / (len(lines) - 1)
-        if color_progress < 0.5:
-            color = f"rgb({int(0 + color_progress * 2 * 100)},{int(255 - color_progress * 2 * 100)},{255})"
-        else:
-            progress = (color_progress - 0.5) * 2
-            color = f"rgb({int(100 + progress * 155)},{int(155 - progress * 155)},{255})"
-        logo.append(line + "\n", style=color)
-    
-    console.print(logo)
-    
-    # Subtitle
-    subtitle = Text("WHISPER M3U8 TRANSCRIBER BY PHOHOCCODE", style="bold bright_white")
-    console.print(Panel(subtitle, box=box.DOUBLE, border_style="bright_cyan"))
-    
-    console.print()
 
-def transcribe_audio(audio_path: str, model_name: str = "small", lang: Optional[str] = None, task: str = "transcribe", use_gpu: bool = True) -> dict:
+def set_result_cache_limit(max_mb: int) -> None:
+    """Giới hạn dung lượng cache kết quả (MB). 0 = tắt cache."""
+    global _RESULT_CACHE_MAX_BYTES
+    _RESULT_CACHE_MAX_BYTES = max(0, max_mb) * 1024 * 1024
+
+
+def _hash_audio(audio: Union[str, "np.ndarray"]) -> str:
+    """
+    sha256 của PCM đã decode (mảng float32, hoặc nội dung file WAV).
+
+    PCM đã spill (memmap) được đọc bằng iter_pcm_blocks như khi nhận dạng theo
+    cửa sổ, để việc hash không kéo cả file vào RSS.
+    """
+    import hashlib
+    h = hashlib.sha256()
+    if isinstance(audio, str):
+        h.update(b"file:")
+        with open(audio, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        h.update(b"f32:")
+        for block in iter_pcm_blocks(audio, 1 << 20):
+            h.update(block.tobytes())
+    return h.hexdigest()
+
+
+def result_cache_key(audio: Union[str, "np.ndarray"], model_name: str, lang: Optional[str], task: str,
+                     decode_kwargs: dict, vad: str, cpu_workers: int, window_seconds: Optional[float] = None) -> str:
+    """
+    Key của cache: hash PCM + các tham số ảnh hưởng tới kết quả.
+
+    Device/fp16 không nằm trong key: kết quả CPU và GPU được coi là tương đương,
+    nhờ vậy cache hit không cần import torch hay tải model.
+    """
+    import hashlib
+    params = json.dumps({
+        "model": model_name,
+        "language": lang,
+        "task": task,
+        "decode": decode_kwargs,
+        "vad": vad,
+        "chunked": cpu_workers > 1,
+        "window": window_seconds if cpu_workers <= 1 else None,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(f"{_hash_audio(audio)}|{params}".encode("utf-8")).hexdigest()
+
+
+def _result_cache_path(key: str) -> str:
+    return os.path.join(_get_result_cache_dir(), f"{key}.json.gz")
+
+
+def load_cached_result(key: str) -> Optional[dict]:
+    import gzip
+    path = _result_cache_path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # Cập nhật thời gian dùng gần nhất (LRU)
+        return entry["result"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store_cached_result(key: str, result: dict, meta: dict) -> None:
+    """Ghi kết quả vào cache (ghi file tạm rồi rename), sau đó cắt bớt theo giới hạn dung lượng."""
+    import gzip
+    if _RESULT_CACHE_MAX_BYTES <= 0:
+        return
+    cache_dir = _get_result_cache_dir()
+    path = _result_cache_path(key)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(dict(meta, key=key, created=time.time(), result=result), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+    prune_result_cache(_RESULT_CACHE_MAX_BYTES)
+
+
+def list_result_cache() -> List[dict]:
+    """Các entry trong cache, mới dùng gần nhất trước."""
+    import gzip
+    cache_dir = _get_result_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json.gz"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        result = entry.pop("result", {})
+        entry.update(path=path, size=st.st_size, used_at=st.st_mtime,
+                     segments=len(result.get("segments", [])), detected_language=result.get("language", ""))
+        entries.append(entry)
+    entries.sort(key=lambda e: e["used_at"], reverse=True)
+    return entries
+
+
+def prune_result_cache(max_bytes: int) -> tuple:
+    """Xóa entry dùng lâu nhất đến khi tổng dung lượng <= max_bytes. Trả về (số entry đã xóa, bytes)."""
+    cache_dir = _get_result_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return 0, 0
+    with _RESULT_CACHE_LOCK:
+        files = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = freed = 0
+        for _, size, path in files:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+def display_result_cache() -> None:
+    """In bảng các entry trong cache kết quả."""
+    entries = list_result_cache()
+    if not entries:
+        console.print(Panel("[yellow]Cache kết quả trống[/yellow]",
+                            title="[bold cyan]Result Cache[/bold cyan]", border_style="cyan"))
+        return
+    table = Table(title=f"[bold cyan]Cache kết quả ({_get_result_cache_dir()})[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Key", style="dim")
+    table.add_column("Model", style="cyan")
+    table.add_column("Ngôn ngữ", style="yellow")
+    table.add_column("Profile", style="yellow")
+    table.add_column("Audio (s)", justify="right")
+    table.add_column("Đoạn", justify="right")
+    table.add_column("KB", justify="right")
+    table.add_column("Dùng lần cuối", style="green")
+    for e in entries:
+        table.add_row(e.get("key", "")[:12], e.get("model", ""), e.get("language") or f"auto→{e['detected_language']}",
+                      e.get("profile", ""), f"{e.get('duration', 0):.0f}", str(e["segments"]),
+                      f"{e['size'] / 1024:.0f}",
+                      datetime.datetime.fromtimestamp(e["used_at"]).strftime("%Y-%m-%d %H:%M"))
+    console.print(table)
+    total = sum(e["size"] for e in entries)
+    console.print(f"[dim]{len(entries)} entries, {total / 1024 / 1024:.1f} MB / giới hạn {_RESULT_CACHE_MAX_BYTES // 1024 // 1024} MB[/dim]")
+
+
+# Prompt để ép Whisper chỉ nhận dạng ngôn ngữ được chọn
+_LANGUAGE_PROMPTS = {
+    "zh": "以下是普通话的句子。",  # Prompt tiếng Trung
+    "vi": "Đây là câu tiếng Việt.",
+    "en": "The following is in English.",
+    "ja": "以下は日本語の文章です。",
+    "ko": "다음은 한국어 문장입니다.",
+}
+
+
+def build_transcribe_kwargs(profile: str, task: str, lang: Optional[str], device: str) -> dict:
+    """Tham số cho model.transcribe theo decoding profile và ngôn ngữ."""
+    kwargs = {
+        "task": task,
+        "verbose": None if _ui_quiet() else True,  # Worker pipeline không in từng đoạn
+        "fp16": device == "cuda",  # Sử dụng FP16 nếu có GPU
+        **DECODING_PROFILES[profile],
+        "initial_prompt": None,  # Không dùng prompt để tránh bias sang ngôn ngữ khác
+    }
+    # Nếu chỉ định ngôn ngữ, bắt buộc sử dụng ngôn ngữ đó (auto-detect không dùng prompt)
+    if lang:
+        kwargs["language"] = lang
+        kwargs["initial_prompt"] = _LANGUAGE_PROMPTS.get(lang)
+    return kwargs
+
+
+def transcribe_audio(audio: Union[str, "np.ndarray"], model_name: str = "small", lang: Optional[str] = None, task: str = "transcribe", use_gpu: bool = True,
+                     vad: str = "off", cpu_workers: int = 1, profile: str = "balanced", on_segment=None,
+                     window_seconds: Optional[float] = None) -> dict:
+    """
+    Nhận dạng giọng nói. Nếu có on_segment, mỗi segment (timestamp trên timeline gốc)
+    được đưa cho callback ngay khi chunk chứa nó nhận dạng xong, theo thứ tự thời gian.
+
+    Không chạy song song trên CPU: nhận dạng theo cửa sổ với bộ nhớ cố định khi
+    effective_window_seconds() trả về độ dài cửa sổ (window_seconds > 0, hoặc None
+    và audio dài); ngược lại 1 lần model.transcribe, segment được đưa cho
+    on_segment sau khi xong.
+    """
     console.print("\n[bold blue]Đang nhận dạng giọng nói bằng Whisper...[/bold blue]")
+    speech_map = None
+
+    def emit(seg: dict) -> None:
+        seg = _remap_segment(seg, speech_map) if speech_map else seg
+        if not _ui_quiet():
+            console.print(f"[{_format_timestamp(seg['start'])} --> {_format_timestamp(seg['end'])}] {seg.get('text', '').strip()}",
+                          markup=False, highlight=False)
+        on_segment(seg)
+
     try:
+        # Cache kết quả: hit thì không cần import torch / tải model
+        cache_key = None
+        # WAV 16-bit mono 16kHz = 32000 bytes/giây
+        audio_seconds = os.path.getsize(audio) / 32000 if isinstance(audio, str) else len(audio) / PCM_SAMPLE_RATE
+        window = effective_window_seconds(window_seconds, audio_seconds)
+        if _RESULT_CACHE_MAX_BYTES > 0:
+            with _status("[bold blue]Đang kiểm tra cache kết quả..."):
+                cache_key = result_cache_key(audio, model_name, lang, task, DECODING_PROFILES[profile], vad, cpu_workers, window)
+                cached = load_cached_result(cache_key)
+            if cached is not None:
+                cached.update(decode_stats=None, cached=True)
+                console.print(f"[bold green]✓ Dùng kết quả từ cache[/bold green] [dim]({len(cached.get('segments', []))} đoạn, key {cache_key[:12]})[/dim]")
+                if on_segment:
+                    for seg in cached.get("segments", []):
+                        on_segment(seg)
+                return cached
+        
         # Xác định device
-        device = "cuda" if use_gpu and torch.cuda.is_available() else "cpu"
+        device = resolve_device(use_gpu)
         device_color = "green" if device == "cuda" else "yellow"
         console.print(f"   [bold]Dùng:[/bold] [{device_color}]{device.upper()}[/{device_color}]")
         
-        # Load model với device
-        model = whisper.load_model(model_name, device=device)
-        
-        # Cấu hình transcribe với các tham số tối ưu chống lặp
-        kwargs = {
-            "task": task,
-            "verbose": True,
-            "fp16": device == "cuda",  # Sử dụng FP16 nếu có GPU
-            "condition_on_previous_text": False,  # Tắt để tránh lặp lại context
-            "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),  # Fallback temperatures để giảm lặp
-            "compression_ratio_threshold": 2.4,  # Phát hiện lỗi tốt hơn
-            "logprob_threshold": -1.0,  # Lọc kết quả không chắc chắn
-            "no_speech_threshold": 0.6,  # Tăng ngưỡng để lọc nhạc/noise
-            "best_of": 5,  # Lấy kết quả tốt nhất trong 5 lần decode (giảm lặp)
-            "initial_prompt": None,  # Không dùng prompt để tránh bias sang ngôn ngữ khác
-        }
+        # VAD: bỏ các vùng không có giọng nói trước khi đưa vào model
+        if vad != "off":
+            if isinstance(audio, str):
+                import whisper
+                audio = whisper.load_audio(audio)
+            total = len(audio) / PCM_SAMPLE_RATE
+            with _status(f"[bold blue]Đang lọc vùng có giọng nói (VAD {vad})..."):
+                audio, speech_map = apply_vad(audio, vad)
+            kept = len(audio) / PCM_SAMPLE_RATE
+            console.print(f"   [cyan]VAD:[/cyan] giữ [green]{int(kept)}s / {int(total)}s[/green] "
+                          f"[dim]({len(speech_map)} vùng, bỏ {(1 - kept / total) * 100 if total else 0:.0f}%)[/dim]")
+            if not speech_map:
+                console.print("\n[yellow]Cảnh báo: Không phát hiện giọng nói trong audio![/yellow]")
+                return {"text": "", "segments": [], "language": lang or ""}
+        
+        # Lấy model từ registry (chỉ tải từ đĩa lần đầu)
+        dtype = "float16" if device == "cuda" else "float32"
+        model = get_model(model_name, device, dtype)
         
-        # Nếu chỉ định ngôn ngữ, bắt buộc sử dụng ngôn ngữ đó
+        # Cấu hình transcribe theo decoding profile
+        console.print(f"   [cyan]Profile:[/cyan] [yellow]{profile}[/yellow]")
+        kwargs = build_transcribe_kwargs(profile, task, lang, device)
         if lang:
-            kwargs["language"] = lang
-            # Thêm prompt để ép Whisper chỉ dịch ngôn ngữ được chọn
-            if lang == "zh":
-                kwargs["initial_prompt"] = "以下是普通话的句子。"  # Prompt tiếng Trung
-            elif lang == "vi":
-                kwargs["initial_prompt"] = "Đây là câu tiếng Việt."
-            elif lang == "en":
-                kwargs["initial_prompt"] = "The following is in English."
-            elif lang == "ja":
-                kwargs["initial_prompt"] = "以下は日本語の文章です。"
-            elif lang == "ko":
-                kwargs["initial_prompt"] = "다음은 한국어 문장입니다."
             console.print(f"   [cyan]Ngôn ngữ:[/cyan] [yellow]{lang}[/yellow] [dim](chỉ nhận dạng ngôn ngữ này)[/dim]")
         else:
-            kwargs["initial_prompt"] = None  # Auto-detect không dùng prompt
             console.print(f"   [yellow]Tự động nhận diện ngôn ngữ[/yellow]")
         
-        result = model.transcribe(audio_path, **kwargs)
+        if device == "cpu" and cpu_workers > 1:
+            if isinstance(audio, str):
+                import whisper
+                audio = whisper.load_audio(audio)
+            result = transcribe_parallel(model_name, model, audio, kwargs, cpu_workers, emit if on_segment else None)
+        elif window:
+            # PCM đọc theo block, mel tính theo cửa sổ: RSS không tăng theo độ dài audio
+            console.print(f"   [cyan]Cửa sổ:[/cyan] [yellow]{window:g}s[/yellow]")
+            result = transcribe_windowed(model_name, model, device, dtype, audio, kwargs,
+                                         emit if on_segment else None, window)
+        else:
+            with model_run_lock(model_name, device, dtype), decode_stats(model) as stats:
+                # audio: đường dẫn file (Whisper tự decode) hoặc mảng PCM float32 16kHz
+                result = model.transcribe(audio, **kwargs)
+            result["decode_stats"] = stats
+            if on_segment:
+                for seg in result.get("segments", []):
+                    emit(seg)
+        result["profile"] = profile
+        remap_vad_timestamps(result, speech_map)
         
         # Kiểm tra nếu kết quả có vấn đề
         if result.get("language") == "music" or not result.get("text", "").strip():
@@ -618,30 +2786,262 @@ def transcribe_audio(audio_path: str, model_name: str = "small", lang: Optional[
                 console.print("   [yellow]💡 Gợi ý: Hãy chỉ định rõ ngôn ngữ để cải thiện kết quả[/yellow]")
         else:
             console.print(f"\n[bold green]✓ Nhận dạng hoàn tất[/bold green] [dim]({len(result.get('segments', []))} đoạn)[/dim]")
+        console.print(f"   [dim]Fallback: {format_decode_stats(result['decode_stats'])}[/dim]")
+        
+        if cache_key:
+            store_cached_result(cache_key, result, {"model": model_name, "language": lang, "task": task,
+                                                    "profile": profile, "duration": audio_seconds})
+        return result
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Đã hủy tiến trình nhận dạng giọng nói[/yellow]")
+        sys.exit(0)
+    except Exception as e:
+        console.print(Panel(
+            f"[bold red]LỖI:[/bold red] Không thể nhận dạng giọng nói\n\n"
+            f"[red]Chi tiết:[/red] {e}",
+            title="[bold red]Transcription Error[/bold red]",
+            border_style="red"
+        ))
+        sys.exit(1)
+
+
+def save_subtitles(result: dict, output_vtt: str = "subtitle.vtt") -> None:
+    with _status("[bold yellow]Đang lưu phụ đề..."):
+        vtt_text = result_to_vtt(result)
+        with open(output_vtt, "w", encoding="utf-8") as f:
+            f.write(vtt_text)
+    console.print(f"[bold green]✓ Đã lưu phụ đề:[/bold green] [cyan]{output_vtt}[/cyan]")
+
+
+# ---------------------------------------------------------------------------
+# Ghi phụ đề dạng stream: mỗi cue được ghi và flush ngay khi có segment, file
+# đang ghi là <path>.part và chỉ được rename thành <path> khi hoàn tất
+# ---------------------------------------------------------------------------
+
+SUBTITLE_FORMATS = ["vtt", "srt", "json"]
+
+
+class SubtitleWriter:
+    """Ghi phụ đề từng cue vào <path>.part; close() rename nguyên tử thành path."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.part_path = path + ".part"
+        self.count = 0
+        self._file = open(self.part_path, "w", encoding="utf-8")
+        self._write_header()
+        self._file.flush()
+
+    def _write_header(self) -> None:
+        pass
+
+    def _write_cue(self, seg: dict) -> None:
+        raise NotImplementedError
+
+    def _write_footer(self, result: dict) -> None:
+        pass
+
+    def write(self, seg: dict) -> None:
+        self._write_cue(seg)
+        self.count += 1
+        self._file.flush()
+
+    def close(self, result: dict) -> None:
+        self._write_footer(result)
+        self._file.close()
+        os.replace(self.part_path, self.path)
+
+    def abort(self) -> None:
+        """Dừng giữa chừng: giữ lại file .part (các cue đã ghi vẫn dùng được)."""
+        self._file.close()
+
+
+class VttWriter(SubtitleWriter):
+    def _write_header(self) -> None:
+        self._file.write("WEBVTT\n\n")
+
+    def _write_cue(self, seg: dict) -> None:
+        self._file.write(f"{_format_timestamp(seg.get('start', 0.0))} --> {_format_timestamp(seg.get('end', 0.0))}\n"
+                         f"{seg.get('text', '').strip()}\n\n")
+
+
+class SrtWriter(SubtitleWriter):
+    def _write_cue(self, seg: dict) -> None:
+        start = _format_timestamp(seg.get("start", 0.0)).replace(".", ",")
+        end = _format_timestamp(seg.get("end", 0.0)).replace(".", ",")
+        self._file.write(f"{self.count + 1}\n{start} --> {end}\n{seg.get('text', '').strip()}\n\n")
+
+
+class JsonWriter(SubtitleWriter):
+    """{"segments": [...], "language": ...}; mỗi segment 1 dòng, ghi ngay khi có."""
+
+    def _write_header(self) -> None:
+        self._file.write('{"segments": [\n')
+
+    def _write_cue(self, seg: dict) -> None:
+        cue = {k: seg[k] for k in ("start", "end", "text", "words") if seg.get(k) is not None}
+        cue["text"] = cue.get("text", "").strip()
+        self._file.write(("" if self.count == 0 else ",\n") + json.dumps(cue, ensure_ascii=False))
+
+    def _write_footer(self, result: dict) -> None:
+        self._file.write(f'\n], "language": {json.dumps(result.get("language", ""))}}}\n')
+
+
+SUBTITLE_WRITERS = {"vtt": VttWriter, "srt": SrtWriter, "json": JsonWriter}
+
+
+def subtitle_paths(vtt_path: str, formats: List[str]) -> List[str]:
+    """Đường dẫn file phụ đề cho từng định dạng (đổi đuôi của vtt_path)."""
+    base = os.path.splitext(vtt_path)[0]
+    return [f"{base}.{fmt}" for fmt in formats]
+
+
+def transcribe_to_subtitles(audio: Union[str, "np.ndarray"], vtt_path: str, formats: List[str], **kwargs) -> dict:
+    """Nhận dạng và ghi phụ đề (các định dạng trong formats) song song với quá trình decode."""
+    writers = [SUBTITLE_WRITERS[fmt](path) for fmt, path in zip(formats, subtitle_paths(vtt_path, formats))]
+
+    def on_segment(seg: dict) -> None:
+        for writer in writers:
+            writer.write(seg)
+
+    try:
+        result = transcribe_audio(audio, on_segment=on_segment, **kwargs)
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.close(result)
+        console.print(f"[bold green]✓ Đã lưu phụ đề:[/bold green] [cyan]{writer.path}[/cyan] [dim]({writer.count} cue)[/dim]")
+    return result
+
+
+def _sprite_encode_args(image_format: str) -> List[str]:
+    """Encoder options for the sprite sheet image."""
+    if image_format.lower() == "webp":
+        return ["-quality", "90"]  # WebP quality (0-100)
+    return ["-q:v", "2"]  # JPEG quality (2-31, thấp hơn = tốt hơn)
+
+
+def _sprite_select_filter(interval: int) -> str:
+    """
+    Filter select lấy frame đầu tiên trong mỗi ô lưới [i*interval, (i+1)*interval):
+    bám theo lưới nên không trôi dần (frame rate lẻ như 29.97 fps) và khớp với
+    cue i*interval trong thumbnails VTT cũng như cách seek từng thumbnail.
+    """
+    return f"select='isnan(prev_selected_t)+gt(floor(t/{interval})\\,floor(prev_selected_t/{interval}))'"
+
+
+def _build_sprite_single_pass(video_path: str, duration: float, sprite_path: str, thumb_count: int,
+                              interval: int, thumb_width: int, thumb_height: int,
+                              cols: int, rows: int, image_format: str) -> None:
+    """Decode video một lần, chọn frame theo interval và ghép thẳng vào sprite (không file tạm)."""
+    # select lấy frame đầu tiên của mỗi khoảng `interval` giây,
+    # tile ghép trực tiếp thành lưới cols x rows và xuất đúng 1 ảnh
+    vf = (
+        f"{_sprite_select_filter(interval)},"
+        f"scale={thumb_width}:{thumb_height},"
+        f"tile={cols}x{rows}:margin=0:padding=0"
+    )
+    cmd = [
+        "ffmpeg", "-y",
+        "-an", "-sn", "-dn",
+        "-i", video_path,
+        "-vf", vf,
+        "-fps_mode", "vfr",
+        "-frames:v", "1",
+    ]
+    cmd.extend(_sprite_encode_args(image_format))
+    cmd.extend(["-progress", "pipe:1", "-nostats", sprite_path])
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[bold cyan]{task.description}"),
+            BarColumn(complete_style="cyan", finished_style="green"),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console,
+            disable=_ui_quiet()
+        ) as progress:
+            task = progress.add_task(f"Tạo sprite sheet 1 lượt ({thumb_count} thumbs)", total=100)
+            for line in process.stdout:
+                line = line.strip()
+                if line.startswith("out_time_ms="):
+                    try:
+                        current_time = int(line.split("=")[1]) / 1_000_000
+                        progress.update(task, completed=min(100, current_time / duration * 100))
+                    except ValueError:
+                        pass
+            progress.update(task, completed=100)
+    except KeyboardInterrupt:
+        process.kill()
+        process.wait()
+        if os.path.exists(sprite_path):
+            os.remove(sprite_path)
+        raise
+
+    return_code = process.wait()
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, cmd)
+
+
+def _build_sprite_per_seek(video_path: str, temp_dir: str, temp_thumbs: List[str], timestamps: List[int],
+                           sprite_path: str, interval: int, thumb_width: int, thumb_height: int,
+                           cols: int, rows: int, image_format: str) -> None:
+    """Cách cũ: seek + xuất 1 JPG tạm cho mỗi timestamp, sau đó ghép bằng tile."""
+    os.makedirs(temp_dir, exist_ok=True)
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[bold cyan]{task.description}"),
+        BarColumn(complete_style="cyan", finished_style="green"),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TextColumn("({task.completed}/{task.total})"),
+        TimeElapsedColumn(),
+        console=console,
+        disable=_ui_quiet()
+    ) as progress:
+        task = progress.add_task(f"Tạo thumbnails (mỗi {interval}s)", total=len(timestamps))
         
-        return result
-    except KeyboardInterrupt:
-        console.print("\n[yellow]Đã hủy tiến trình nhận dạng giọng nói[/yellow]")
-        sys.exit(0)
-    except Exception as e:
-        console.print(Panel(
-            f"[bold red]LỖI:[/bold red] Không thể nhận dạng giọng nói\n\n"
-            f"[red]Chi tiết:[/red] {e}",
-            title="[bold red]Transcription Error[/bold red]",
-            border_style="red"
-        ))
-        sys.exit(1)
+        for i, timestamp in enumerate(timestamps):
+            thumb_path = os.path.join(temp_dir, f"thumb{i:04d}.jpg")
+            cmd = [
+                "ffmpeg", "-y",
+                "-ss", str(timestamp),
+                "-i", video_path,
+                "-vframes", "1",
+                "-vf", f"scale={thumb_width}:{thumb_height}",
+                "-q:v", "2",
+                thumb_path
+            ]
+            subprocess.run(cmd, capture_output=True, check=True)
+            temp_thumbs.append(thumb_path)
+            progress.update(task, advance=1)
 
+    # Tile filter xếp các ảnh vào lưới một cách hiệu quả hơn xstack
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", os.path.join(temp_dir, "thumb%04d.jpg"),
+        "-vf", f"tile={cols}x{rows}:margin=0:padding=0",
+    ]
+    cmd.extend(_sprite_encode_args(image_format))
+    cmd.append(sprite_path)
+    
+    with _status(f"[bold cyan]Đang ghép sprite sheet ({cols * thumb_width}x{rows * thumb_height})..."):
+        subprocess.run(cmd, capture_output=True, check=True)
 
-def save_subtitles(result: dict, output_vtt: str = "subtitle.vtt") -> None:
-    with console.status("[bold yellow]Đang lưu phụ đề...", spinner="dots"):
-        vtt_text = result_to_vtt(result)
-        with open(output_vtt, "w", encoding="utf-8") as f:
-            f.write(vtt_text)
-    console.print(f"[bold green]✓ Đã lưu phụ đề:[/bold green] [cyan]{output_vtt}[/cyan]")
+    # Xóa các thumbnails tạm
+    console.print("[dim]Đang xóa thumbnails tạm...[/dim]")
+    for thumb in temp_thumbs:
+        if os.path.exists(thumb):
+            os.remove(thumb)
+    if os.path.exists(temp_dir):
+        os.rmdir(temp_dir)
 
 
-def extract_thumbnails(video_path: str, output_dir: str, interval: int = 5, thumb_width: int = 160, thumb_height: int = 90, cols: int = 10, image_format: str = "webp") -> dict:
+def extract_thumbnails(video_path: str, output_dir: str, interval: int = 5, thumb_width: int = 160, thumb_height: int = 90, cols: int = 10, image_format: str = "webp", mode: str = "single-pass") -> dict:
     """
     Tạo sprite sheet từ video - tất cả thumbnails trong 1 ảnh duy nhất
     
@@ -653,6 +3053,7 @@ def extract_thumbnails(video_path: str, output_dir: str, interval: int = 5, thum
         thumb_height: Chiều cao mỗi thumbnail
         cols: Số cột trong sprite sheet
         image_format: Định dạng ảnh ('webp' hoặc 'jpg')
+        mode: 'single-pass' (decode 1 lần, ghép thẳng vào sprite) hoặc 'seek' (1 lệnh ffmpeg mỗi thumbnail)
     
     Returns:
         Dict chứa thông tin sprite sheet và timestamps
@@ -668,22 +3069,8 @@ def extract_thumbnails(video_path: str, output_dir: str, interval: int = 5, thum
     temp_dir = os.path.join(thumb_dir, "temp")
     
     try:
-        # Lấy độ dài video
-        probe_cmd = [
-            "ffmpeg", "-i", video_path,
-            "-f", "null", "-"
-        ]
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-        
-        # Parse duration từ stderr
-        duration = 0
-        output = result.stderr if result.stderr else ""
-        for line in output.split('\n'):
-            if "Duration:" in line:
-                time_str = line.split("Duration:")[1].split(",")[0].strip()
-                h, m, s = time_str.split(":")
-                duration = int(h) * 3600 + int(m) * 60 + float(s)
-                break
+        # Lấy độ dài video (ffprobe, không decode toàn bộ file)
+        duration = get_media_duration(video_path)
         
         if duration == 0:
             console.print("[yellow]Không thể xác định độ dài video[/yellow]")
@@ -701,77 +3088,20 @@ def extract_thumbnails(video_path: str, output_dir: str, interval: int = 5, thum
         
         console.print(f"[green]Số thumbnails:[/green] [yellow]{thumb_count}[/yellow]")
         
-        # Tạo thư mục temp cho các thumbnail riêng lẻ
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # Sử dụng Rich Progress
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[bold cyan]{task.description}"),
-            BarColumn(complete_style="cyan", finished_style="green"),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            TextColumn("({task.completed}/{task.total})"),
-            TimeElapsedColumn(),
-            console=console
-        ) as progress:
-            task = progress.add_task(f"Tạo thumbnails (mỗi {interval}s)", total=thumb_count)
-            
-            for i, timestamp in enumerate(timestamps):
-                thumb_filename = f"thumb{i:04d}.jpg"
-                thumb_path = os.path.join(temp_dir, thumb_filename)
-
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-ss", str(timestamp),
-                    "-i", video_path,
-                    "-vframes", "1",
-                    "-vf", f"scale={thumb_width}:{thumb_height}",
-                    "-q:v", "2",
-                    thumb_path
-                ]
-
-                subprocess.run(cmd, capture_output=True, check=True)
-                temp_thumbs.append(thumb_path)
-                progress.update(task, advance=1)
-        
-        # Tạo sprite sheet từ các thumbnails
         rows = (thumb_count + cols - 1) // cols  # Làm tròn lên
         sprite_width = cols * thumb_width
         sprite_height = rows * thumb_height
         sprite_filename = f"sprite.{image_format}"
         sprite_path = os.path.join(thumb_dir, sprite_filename)
         
-        # Sử dụng FFmpeg để tạo sprite sheet với tile filter (tối ưu cho video dài)
-        # Tile filter xếp các ảnh vào lưới một cách hiệu quả hơn xstack
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", os.path.join(temp_dir, "thumb%04d.jpg"),
-            "-vf", f"tile={cols}x{rows}:margin=0:padding=0",
-        ]
-        
-        # Tùy chọn encoding tùy theo định dạng
-        if image_format.lower() == "webp":
-            cmd.extend(["-quality", "90"])  # WebP quality (0-100)
+        if mode == "seek":
+            _build_sprite_per_seek(video_path, temp_dir, temp_thumbs, timestamps, sprite_path,
+                                   interval, thumb_width, thumb_height, cols, rows, image_format)
         else:
-            cmd.extend(["-q:v", "2"])  # JPEG quality (2-31, thấp hơn = tốt hơn)
-        
-        cmd.append(sprite_path)
-        
-        # Sử dụng Rich Status cho sprite creation
-        with console.status(f"[bold cyan]Đang ghép sprite sheet ({sprite_width}x{sprite_height})...", spinner="dots"):
-            subprocess.run(cmd, capture_output=True, check=True)
+            _build_sprite_single_pass(video_path, duration, sprite_path, thumb_count,
+                                      interval, thumb_width, thumb_height, cols, rows, image_format)
 
-        console.print(f"[bold green]✓ Đã tạo sprite sheet:[/bold green] [cyan]{sprite_filename}[/cyan]")
-        
-        # Xóa các thumbnails tạm
-        console.print("[dim]Đang xóa thumbnails tạm...[/dim]")
-        for thumb in temp_thumbs:
-            if os.path.exists(thumb):
-                os.remove(thumb)
-        
-        # Xóa thư mục temp
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
+        console.print(f"[bold green]✓ Đã tạo sprite sheet:[/bold green] [cyan]{sprite_filename}[/cyan] [dim]({sprite_width}x{sprite_height})[/dim]")
         
         # Tạo thông tin sprite sheet
         sprite_info = {
@@ -887,184 +3217,922 @@ def create_thumbnail_vtt(sprite_info: dict, output_vtt: str, interval: int = 5,
         lines.append(f"{sprite_url}{xywh}")
         lines.append("")
     
-    with console.status("[bold yellow]Đang lưu file VTT...", spinner="dots"):
+    with _status("[bold yellow]Đang lưu file VTT..."):
         with open(output_vtt, "w", encoding="utf-8") as f:
             f.write("\n".join(lines))
     
     console.print(f"[bold green]✓ Đã tạo file VTT sprite sheet:[/bold green] [cyan]{output_vtt}[/cyan]")
     console.print(f"   [blue]Sprite URL:[/blue] [dim]{sprite_url}[/dim]")
 
-def process_batch_from_json(json_path: str, args) -> None:
-    """Process multiple items from JSON file with checkpoint support."""
+def _item_output_dir(root_path: str, slug: str, folder_name: str) -> str:
+    """Tạo và trả về thư mục {root_path}/{slug}/{folder_name} của 1 item."""
+    output_base = os.path.join(root_path, slug) if root_path else slug
+    group_dir = os.path.join(output_base, folder_name)
+    os.makedirs(group_dir, exist_ok=True)
+    return group_dir
+
+
+# ---------------------------------------------------------------------------
+# Manifest batch: đọc dần {root_path, items: [...]} hoặc JSON Lines (file hoặc
+# stdin), mỗi item được đưa đi xử lý ngay khi parse xong
+# ---------------------------------------------------------------------------
+
+_MANIFEST_CHUNK = 1 << 16
+_MANIFEST_MAX_VALUE = 16 * 1024 * 1024  # 1 item lớn hơn mức này coi như JSON hỏng
+_JSON_DECODER = json.JSONDecoder()
+
+
+class _JsonStream:
+    """Đọc lần lượt các giá trị JSON từ file theo chunk; buffer chỉ giữ phần đang parse."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.f.read(_MANIFEST_CHUNK)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if len(self.buf) > _MANIFEST_MAX_VALUE:
+            raise ValueError(f"JSON không hợp lệ hoặc 1 item lớn hơn {_MANIFEST_MAX_VALUE // 1024 // 1024} MB")
+        return True
+
+    def peek(self) -> str:
+        """Ký tự khác khoảng trắng tiếp theo ("" khi hết dữ liệu)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}', gặp '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        if not self.peek():
+            raise ValueError("JSON không hợp lệ: kết thúc đột ngột")
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"JSON không hợp lệ: {e.msg}") from None
+                self._fill()
+                continue
+            # Số nằm ở cuối buffer có thể chưa đọc hết chữ số
+            if end < len(self.buf) or self.eof or self.buf[self.pos] in '{["':
+                self.pos = end
+                return value
+            self._fill()
+
+
+def iter_manifest(f):
+    """
+    Yield (root_path, item) theo thứ tự trong manifest, không nạp cả file.
+
+    Hỗ trợ {"root_path": ..., "items": [...]} (root_path phải đứng trước items)
+    và JSON Lines: mỗi dòng 1 item; dòng chỉ có "root_path" (không có m3u8_url)
+    đặt root_path cho các item phía sau, item có "root_path" riêng thì ghi đè.
+    """
+    stream = _JsonStream(f)
+    root_path = ""
+    while stream.peek():
+        stream.expect("{")
+        obj = {}
+        has_items = False
+        if stream.peek() == "}":
+            stream.pos += 1
+            continue
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "items":
+                has_items = True
+                items_root = obj.get("root_path", root_path) or ""
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.pos += 1
+                else:
+                    while True:
+                        yield items_root, stream.value()
+                        if stream.peek() == ",":
+                            stream.pos += 1
+                            continue
+                        stream.expect("]")
+                        break
+            else:
+                obj[key] = stream.value()
+                if key == "root_path" and has_items:
+                    raise ValueError("root_path phải đứng trước items trong manifest")
+            if stream.peek() == ",":
+                stream.pos += 1
+                continue
+            stream.expect("}")
+            break
+        if has_items:
+            continue
+        if "m3u8_url" in obj:
+            yield obj.get("root_path", root_path) or "", obj
+        elif "root_path" in obj:
+            root_path = obj["root_path"] or ""
+
+
+def _open_manifest(json_path: str):
+    return sys.stdin if json_path == "-" else open(json_path, "r", encoding="utf-8")
+
+
+def count_manifest_items(json_path: str) -> int:
+    """Đếm số item bằng 1 lượt đọc stream (bộ nhớ không phụ thuộc kích thước manifest)."""
+    with _open_manifest(json_path) as f:
+        return sum(1 for _ in iter_manifest(f))
+
+
+def iter_batch_items(json_path: str, checkpoint_key: str, done: set, end_index: Optional[int], counter: dict):
+    """
+    Yield (index, root_path, item) của các item cần chạy, đọc dần từ manifest.
+
+    Item không hợp lệ (thiếu/sai m3u8_url) được ghi skipped vào checkpoint ngay
+    trong stream (chạy lại cũng không hợp lệ nên tính là đã kết thúc);
+    counter["items"] đếm số item đã đọc. Manifest hỏng giữa chừng
+    thì dừng ở item cuối cùng đọc được.
+    """
+    f = _open_manifest(json_path)
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception as e:
-        console.print(f"[bold red]LỖI:[/bold red] Không thể đọc file JSON: {e}")
-        sys.exit(1)
-    
-    root_path = data.get("root_path", "")
-    items = data.get("items", [])
+        for i, (root_path, item) in enumerate(iter_manifest(f)):
+            if end_index is not None and i >= end_index:
+                break
+            counter["items"] = i + 1
+            if i in done:
+                continue
+            m3u8_url = item.get("m3u8_url", "") if isinstance(item, dict) else ""
+            if not m3u8_url or not validate_url(m3u8_url):
+                console.print(f"\n[bold red]Bỏ qua item #{i+1}:[/bold red] URL không hợp lệ")
+                record_item_stage(checkpoint_key, i, "item", "skipped", error="URL không hợp lệ")
+                continue
+            yield i, root_path, item
+    except (ValueError, OSError) as e:
+        console.print(f"[bold red]LỖI đọc manifest:[/bold red] {e} [yellow](dừng sau item #{counter['items']})[/yellow]")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _report_entry(ctx: dict) -> dict:
+    """Phần của ctx cần cho báo cáo cuối batch (không giữ cả ctx của mọi item)."""
+    return {key: ctx.get(key) for key in ("item_number", "profile", "decode_stats", "metrics")}
+
+
+# ---------------------------------------------------------------------------
+# Dedupe nguồn: các item cùng nguồn (URL + playlist dạng chuẩn) và cùng tùy chọn
+# chỉ chạy download/extract/transcribe 1 lần, kết quả được hardlink (hoặc copy)
+# sang thư mục các item còn lại; index nằm trong checkpoint DB nên có tác dụng
+# cả giữa các lần chạy
+# ---------------------------------------------------------------------------
+
+# Các tùy chọn làm thay đổi file đầu ra của item
+_DEDUPE_OPTIONS = (
+    "language", "model", "output_prefix", "save_video", "save_audio", "save_vtt",
+    "create_thumbnails", "thumbnail_interval", "thumb_width", "thumb_height", "thumb_cols",
+    "thumb_format", "thumb_mode", "cdn_url", "vad", "cpu_workers", "subtitle_formats", "window_seconds",
+)
+# Tham số query của URL ký (token hết hạn theo thời gian), không xác định nội dung
+_SIGNED_URL_PARAMS = {
+    "token", "expires", "signature", "sig", "policy", "key-pair-id", "hdnts", "hdnea",
+    "x-amz-signature", "x-amz-date", "x-amz-expires", "x-amz-credential", "x-amz-security-token",
+    "x-amz-algorithm", "x-amz-signedheaders",
+}
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_m3u8_url(url: str) -> str:
+    """
+    URL dạng chuẩn: scheme/host chữ thường, bỏ port mặc định, fragment và
+    tham số ký URL, sắp xếp query.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+    if "@" in parts.netloc:
+        netloc = parts.netloc.rsplit("@", 1)[0] + "@" + netloc
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in _SIGNED_URL_PARAMS)
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+def canonical_playlist(text: str, base_url: str) -> str:
+    """Playlist dạng chuẩn: mọi URI (dòng segment/variant, thuộc tính URI="...") thành URL tuyệt đối đã chuẩn hóa."""
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            line = re.sub(r'URI="([^"]*)"',
+                          lambda m: f'URI="{normalize_m3u8_url(urljoin(base_url, m.group(1)))}"', line)
+        else:
+            line = normalize_m3u8_url(urljoin(base_url, line))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def source_key(m3u8_url: str) -> str:
+    """Key của nguồn: sha256 của playlist dạng chuẩn (của URL chuẩn hóa nếu không tải được playlist)."""
+    import hashlib
+    try:
+        content = canonical_playlist(_fetch_text(m3u8_url), m3u8_url)
+    except (urllib.error.URLError, OSError, ValueError):
+        content = normalize_m3u8_url(m3u8_url)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def dedupe_key(source: str, args, profile: str) -> str:
+    """Key dedupe = nguồn + các tùy chọn ảnh hưởng tới file đầu ra."""
+    import hashlib
+    options = {name: getattr(args, name, None) for name in _DEDUPE_OPTIONS}
+    options["profile"] = profile
+    params = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(f"{source}|{params}".encode("utf-8")).hexdigest()
+
+
+def lookup_source(key: str) -> Optional[dict]:
+    """Kết quả đã lưu của key ({"output_dir", "artifacts"}), None nếu chưa có hoặc file đã đổi/mất."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK:
+        row = conn.execute("SELECT output_dir, artifacts FROM sources WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    artifacts = json.loads(row["artifacts"] or "[]")
+    if not artifacts or not _artifacts_valid(artifacts):
+        return None
+    return {"output_dir": row["output_dir"], "artifacts": artifacts}
+
+
+def store_source(key: str, output_dir: str, artifact_paths: List[str]) -> dict:
+    """Lưu kết quả của key vào index (kèm fingerprint để kiểm tra khi dùng lại)."""
+    artifacts = [fp for fp in (_file_fingerprint(p) for p in artifact_paths) if fp]
+    output_dir = os.path.abspath(output_dir)
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sources (key, output_dir, artifacts, updated_at) VALUES (?, ?, ?, ?)",
+            (key, output_dir, json.dumps(artifacts, ensure_ascii=False), time.time())
+        )
+    return {"output_dir": output_dir, "artifacts": artifacts}
+
+
+def _dedupe_artifacts(ctx: dict) -> List[str]:
+    """File cần fan-out của item: các file được giữ lại + sprite sheet/thumbnails VTT."""
+    paths = _stage_artifacts(ctx, "item")
+    if ctx["create_thumbnails"] and os.path.exists(ctx["thumbnail_vtt_path"]):
+        paths.append(ctx["thumbnail_vtt_path"])
+        thumb_dir = os.path.join(ctx["output_dir"], "thumbnails")
+        if os.path.isdir(thumb_dir):
+            paths += [os.path.join(thumb_dir, name) for name in sorted(os.listdir(thumb_dir))
+                      if os.path.isfile(os.path.join(thumb_dir, name))]
+    return paths
+
+
+def fan_out_artifacts(source: dict, target_dir: str) -> tuple:
+    """
+    Hardlink (khác filesystem thì copy) các artifact của source sang target_dir,
+    giữ nguyên đường dẫn tương đối. Returns (danh sách file, "hardlink" | "copy").
+    """
+    paths = []
+    method = "hardlink"
+    for art in source["artifacts"]:
+        src = art["path"]
+        dest = os.path.join(target_dir, os.path.relpath(src, source["output_dir"]))
+        paths.append(dest)
+        if os.path.exists(dest):
+            if os.path.samefile(src, dest):
+                continue
+            os.remove(dest)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+            method = "copy"
+    return paths, method
+
+
+class SourceDedupe:
+    """
+    Điều phối dedupe trong 1 batch (an toàn giữa các thread).
+
+    claim() trả về "primary" (item chạy các bước như thường), "follower"
+    (nguồn đang được item khác xử lý, sẽ fan-out khi item đó xong) hoặc
+    "done" (index đã có kết quả hợp lệ, fan-out ngay).
+    """
+
+    def __init__(self, checkpoint_key: str):
+        self.checkpoint_key = checkpoint_key
+        self.lock = threading.Lock()
+        self.in_flight = {}     # key -> [(index, output_dir)] của các follower
+        self.source_keys = {}   # URL chuẩn hóa -> source key (mỗi playlist chỉ tải 1 lần / lượt chạy)
+        self.reused = 0
+
+    def key(self, m3u8_url: str, args, profile: Optional[str]) -> str:
+        url = normalize_m3u8_url(m3u8_url)
+        if url not in self.source_keys:
+            self.source_keys[url] = source_key(m3u8_url)
+        return dedupe_key(self.source_keys[url], args, profile if profile in DECODING_PROFILES else args.profile)
+
+    def claim(self, key: str, index: int, output_dir: str) -> str:
+        with self.lock:
+            if key in self.in_flight:
+                self.in_flight[key].append((index, output_dir))
+                return "follower"
+            source = lookup_source(key)
+            if source is not None and self._fan_out(source, index, output_dir):
+                return "done"
+            self.in_flight[key] = []
+            return "primary"
+
+    def complete(self, key: str, ctx: dict) -> None:
+        """Item primary đã xong: lưu vào index rồi fan-out cho các follower."""
+        source = store_source(key, ctx["output_dir"], _dedupe_artifacts(ctx))
+        with self.lock:
+            followers = self.in_flight.pop(key, [])
+        for index, output_dir in followers:
+            if not self._fan_out(source, index, output_dir):
+                record_item_stage(self.checkpoint_key, index, "item", "failed", error="không fan-out được kết quả nguồn trùng")
+
+    def fail(self, key: str, error: BaseException) -> None:
+        """Item primary lỗi: các follower cũng lỗi (lần chạy sau sẽ thử lại)."""
+        with self.lock:
+            followers = self.in_flight.pop(key, [])
+        for index, _ in followers:
+            record_item_stage(self.checkpoint_key, index, "item", "failed",
+                              error=f"nguồn trùng bị lỗi: {error or type(error).__name__}")
+            console.print(f"[bold red]LỖI item #{index + 1}:[/bold red] nguồn trùng bị lỗi [yellow](đã bỏ qua)[/yellow]")
+
+    def _fan_out(self, source: dict, index: int, output_dir: str) -> bool:
+        try:
+            paths, method = fan_out_artifacts(source, output_dir)
+        except OSError as e:
+            console.print(f"[yellow]Item #{index + 1}: không dùng lại được kết quả nguồn trùng ({e})[/yellow]")
+            return False
+        record_item_stage(self.checkpoint_key, index, "item", "done", paths)
+        self.reused += 1
+        console.print(f"[bold green]✓ Item #{index + 1}: dùng lại kết quả của nguồn trùng[/bold green] "
+                      f"[dim]({method} {len(paths)} file từ {source['output_dir']})[/dim]")
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Lập kế hoạch batch: lấy thời lượng từng item từ #EXTINF của playlist (không
+# tải media), sắp xếp thứ tự chạy và ước lượng ETA từ RTF của các lần chạy trước
+# ---------------------------------------------------------------------------
+
+BATCH_ORDERS = ("manifest", "longest", "shortest")
+_PLAN_WORKERS = 8
+_RTF_HISTORY_ROWS = 200  # Số bản ghi gần nhất của mỗi bước dùng để tính RTF
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def playlist_duration(m3u8_url: str) -> Optional[float]:
+    """Tổng #EXTINF của media playlist (chọn rendition audio nếu là master); None nếu là live hoặc không đọc được."""
+    try:
+        text = _fetch_text(m3u8_url)
+        media_url = m3u8_url
+        if "#EXT-X-STREAM-INF" in text:
+            media_url = select_audio_source(m3u8_url)
+            text = _fetch_text(media_url)
+        playlist = parse_media_playlist(text, media_url)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    if not playlist["endlist"] or not playlist["segments"]:
+        return None
+    return playlist["total_duration"]
+
+
+def plan_batch(batch_items, order: str) -> tuple:
+    """
+    Đọc hết các item cần chạy và lấy song song thời lượng playlist của chúng.
+
+    Returns:
+        (danh sách (index, root_path, item) theo order, {index: giây hoặc None});
+        item không rõ thời lượng luôn xếp cuối khi sắp xếp
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    items = list(batch_items)
+    with _status(f"[bold cyan]Đang lấy thời lượng {len(items)} playlist..."):
+        with ThreadPoolExecutor(max_workers=_PLAN_WORKERS, thread_name_prefix="plan") as pool:
+            lengths = list(pool.map(lambda entry: playlist_duration(entry[2]["m3u8_url"]), items))
+    durations = {entry[0]: length for entry, length in zip(items, lengths)}
+    if order != "manifest":
+        known = [e for e in items if durations[e[0]] is not None]
+        known.sort(key=lambda e: durations[e[0]], reverse=order == "longest")
+        items = known + [e for e in items if durations[e[0]] is None]
+    return items, durations
+
+
+def _history_variant(stage: str, need_video: bool, model: str) -> str:
+    """Nhóm RTF lịch sử: tải/tách từ video khác hẳn chỉ tải audio, nhận dạng phụ thuộc model."""
+    if stage == "transcribe":
+        return model
+    return "video" if need_video else "audio"
+
+
+def record_stage_rtf(stage: str, variant: str, rtf: float) -> None:
+    """Lưu RTF của 1 bước vừa chạy (chỉ giữ _RTF_HISTORY_ROWS bản ghi gần nhất mỗi nhóm)."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK, conn:
+        conn.execute("INSERT INTO stage_history (stage, variant, rtf, updated_at) VALUES (?, ?, ?, ?)",
+                     (stage, variant, rtf, time.time()))
+        conn.execute(
+            "DELETE FROM stage_history WHERE stage = ? AND variant = ? AND rowid NOT IN ("
+            " SELECT rowid FROM stage_history WHERE stage = ? AND variant = ? ORDER BY updated_at DESC LIMIT ?)",
+            (stage, variant, stage, variant, _RTF_HISTORY_ROWS)
+        )
+
+
+def history_rtf(stage: str, variant: str) -> Optional[float]:
+    """Median RTF của bước trong lịch sử, None nếu chưa có."""
+    conn = _checkpoint_db()
+    with _CHECKPOINT_LOCK:
+        rows = conn.execute("SELECT rtf FROM stage_history WHERE stage = ? AND variant = ?",
+                            (stage, variant)).fetchall()
+    return _percentile([row["rtf"] for row in rows], 50) if rows else None
+
+
+def _stage_capacity(args) -> Optional[dict]:
+    """Số item mỗi bước xử lý cùng lúc (None = tuần tự)."""
+    if args.jobs > 1:
+        slots = job_slot_limits(args)
+        return {stage: min(args.jobs, slots[_STAGE_RESOURCES[stage]]) for stage in CHECKPOINT_STAGES}
+    if args.pipeline:
+        return {
+            "download": max(1, args.pipeline_download_workers),
+            "extract": max(1, args.pipeline_extract_workers),
+            "transcribe": max(1, args.pipeline_transcribe_workers),
+        }
+    return None
+
+
+class BatchEta:
+    """
+    ETA của batch từ thời lượng playlist x RTF lịch sử (median theo bước).
+
+    Chạy tuần tự: thời lượng còn lại x tổng RTF các bước. Chạy song song:
+    bước nghẽn nhất (RTF / số item chạy cùng lúc) quyết định, nhưng không nhanh
+    hơn item dài nhất còn lại đi hết các bước. Chưa có lịch sử thì dùng tốc độ
+    thực tế của lượt chạy này sau khi có item xong.
+    """
+
+    def __init__(self, work: dict, args):
+        need_video = args.save_video or args.create_thumbnails or not (args.save_audio or args.save_vtt)
+        self.work = work  # index -> giây audio cần xử lý (None: không rõ)
+        self.done = set()
+        self.started = time.perf_counter()
+        self.rtf = {stage: history_rtf(stage, _history_variant(stage, need_video, args.model))
+                    for stage in CHECKPOINT_STAGES}
+        self.capacity = _stage_capacity(args)
+        self.initial = self.estimate()
+
+    def remaining(self) -> List[float]:
+        return [d for i, d in self.work.items() if d and i not in self.done]
+
+    def estimate(self) -> Optional[float]:
+        remaining = self.remaining()
+        total = sum(remaining)
+        if None in self.rtf.values():
+            finished = sum(d for i, d in self.work.items() if d and i in self.done)
+            return total * (time.perf_counter() - self.started) / finished if finished else None
+        if self.capacity is None:
+            return total * sum(self.rtf.values())
+        bottleneck = max(self.rtf[stage] / self.capacity[stage] for stage in CHECKPOINT_STAGES)
+        return max(total * bottleneck, max(remaining, default=0) * sum(self.rtf.values()))
+
+    def update(self, done: set) -> str:
+        """Cập nhật tập item đã xong (kể cả item dedupe), trả về dòng tiến độ."""
+        self.done = set(done)
+        eta = self.estimate()
+        audio = _format_duration(sum(self.remaining()))
+        return f"Còn {audio} audio, ETA ~{_format_duration(eta)}" if eta is not None else f"Còn {audio} audio"
+
+
+def _process_batch_pipelined(json_path: str, batch_items, end_index: Optional[int], args,
+                             finished: list, dedupe: Optional[SourceDedupe] = None,
+                             durations: Optional[dict] = None, eta: Optional[BatchEta] = None) -> None:
+    """
+    Chạy các item của batch_items qua pipeline (hoặc scheduler --jobs);
+    trạng thái từng bước được ghi vào checkpoint store.
+    """
+    total = end_index or "?"
+
+    def jobs():
+        for i, root_path, item in batch_items:
+            slug = item.get("slug", "")
+            folder_name = item.get("folder_name", slug)
+            try:
+                group_dir = _item_output_dir(root_path, slug, folder_name)
+            except OSError as e:
+                console.print(f"\n[bold red]LỖI xử lý item #{i+1}:[/bold red] {e}")
+                record_item_stage(json_path, i, "item", "failed", error=str(e))
+                continue
+            key = dedupe.key(item["m3u8_url"], args, item.get("profile")) if dedupe else None
+            if key and dedupe.claim(key, i, group_dir) != "primary":
+                continue
+            ctx = plan_item(item["m3u8_url"], group_dir, args, i + 1, end_index or 0, checkpoint=(json_path, i),
+                            profile=item.get("profile"), duration=(durations or {}).get(i))
+            ctx["dedupe_key"] = key
+            yield i, ctx
+
+    def on_done(index: int, ctx: dict) -> None:
+        finished.append(_report_entry(ctx))
+        console.print(f"[bold green]✓ Hoàn thành item #{index + 1}/{total}[/bold green]")
+        if ctx["dedupe_key"]:
+            dedupe.complete(ctx["dedupe_key"], ctx)
+        if eta:
+            console.print(f"[dim]{eta.update(completed_items(json_path))}[/dim]")
+
+    def on_error(index: int, ctx: dict, exc: BaseException) -> None:
+        if ctx["dedupe_key"]:
+            dedupe.fail(ctx["dedupe_key"], exc)
+        detail = f": {exc}" if isinstance(exc, Exception) else ""
+        console.print(f"[bold red]LỖI xử lý item #{index + 1}{detail}[/bold red] [yellow](đã bỏ qua)[/yellow]")
+
+    if args.jobs > 1:
+        run_jobs(jobs(), args, on_done=on_done, on_error=on_error)
+        return
+    console.print(
+        f"[cyan]Pipeline:[/cyan] download x{args.pipeline_download_workers}, "
+        f"extract x{args.pipeline_extract_workers}, transcribe x{args.pipeline_transcribe_workers}, "
+        f"queue {args.pipeline_queue}"
+    )
+    run_pipeline(jobs(), args, on_done=on_done, on_error=on_error)
+
+
+def display_decode_report(contexts: List[dict]) -> None:
+    """Bảng thống kê temperature fallback của các item đã nhận dạng trong lượt chạy."""
+    contexts = [c for c in contexts if c.get("decode_stats")]
+    if not contexts:
+        return
+    table = Table(title="[bold cyan]Decode fallback theo item[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Item", style="cyan", justify="right")
+    table.add_column("Profile", style="yellow")
+    table.add_column("Windows", justify="right")
+    table.add_column("Fallback", style="red", justify="right")
+    table.add_column("Decode (s)", justify="right")
+    table.add_column("Fallback (s)", style="magenta", justify="right")
+    for ctx in sorted(contexts, key=lambda c: c["item_number"]):
+        stats = ctx["decode_stats"]
+        table.add_row(str(ctx["item_number"]), ctx["profile"], str(stats["windows"]),
+                      str(stats["fallback_windows"]), f"{stats['decode_seconds']:.1f}",
+                      f"{stats['fallback_seconds']:.1f}")
+    total = merge_decode_stats([c["decode_stats"] for c in contexts])
+    table.add_row("[bold]Tổng[/bold]", "", str(total["windows"]), str(total["fallback_windows"]),
+                  f"{total['decode_seconds']:.1f}", f"{total['fallback_seconds']:.1f}")
+    console.print(table)
+
+
+def process_batch_from_json(json_path: str, args) -> None:
+    """
+    Process multiple items from a JSON / JSON Lines manifest ("-" = stdin) with checkpoint support.
+
+    Manifest được đọc dần: item được đưa đi xử lý ngay khi parse xong.
+    """
+    from_stdin = json_path == "-"
+    batch_id = getattr(args, "batch_id", None)
+    if from_stdin:
+        # Manifest stdin không có đường dẫn để nhận diện: chỉ resume khi có --batch-id
+        json_abspath = f"<stdin:{batch_id}>" if batch_id else "<stdin>"
+    else:
+        json_abspath = os.path.abspath(json_path)
+    if from_stdin:
+        # stdin dành cho manifest: mọi câu hỏi dùng giá trị mặc định
+        console.stdin_busy = True
+        total = None
+        console.print("\n[bold cyan]Đọc manifest từ stdin[/bold cyan]")
+        if not batch_id and load_checkpoint(json_abspath):
+            # Lần chạy stdin trước có thể là manifest khác: không tự resume
+            clear_checkpoint(json_abspath)
+            console.print("[dim]Bỏ qua checkpoint của lần đọc stdin trước (dùng --batch-id để resume)[/dim]")
+    else:
+        try:
+            with _status("[bold cyan]Đang đếm items trong manifest..."):
+                total = count_manifest_items(json_path)
+        except (ValueError, OSError) as e:
+            console.print(f"[bold red]LỖI:[/bold red] Không thể đọc file JSON: {e}")
+            sys.exit(1)
+        if not total:
+            console.print("[bold red]LỖI:[/bold red] File JSON không có items nào")
+            sys.exit(1)
+        console.print(f"\n[bold cyan]Tìm thấy {total} items trong file JSON[/bold cyan]")
+    total_label = total if total is not None else "?"
     
-    if not items:
-        console.print("[bold red]LỖI:[/bold red] File JSON không có items nào")
-        sys.exit(1)
+    # Check for checkpoint
+    checkpoint = load_checkpoint(json_abspath)
+    done = completed_items(json_abspath) if checkpoint else set()
     
-    console.print(f"\n[bold cyan]Tìm thấy {len(items)} items trong file JSON[/bold cyan]")
+    if checkpoint and total is not None and len(done) >= total:
+        # Checkpoint shows all items were completed
+        console.print("[green]✓ Tất cả items đã được xử lý trước đó[/green]")
+        clear_checkpoint(json_abspath)
+        done = set()
+    elif checkpoint and (done or checkpoint.get("failed")):
+        time_saved = datetime.datetime.fromtimestamp(checkpoint.get("updated_at", 0)).strftime("%Y-%m-%d %H:%M:%S")
+        
+        console.print(Panel(
+            f"[bold yellow]TÌM THẤY CHECKPOINT[/bold yellow]\n\n"
+            f"[cyan]Đã xử lý:[/cyan] [green]{len(done)}/{total_label}[/green] items"
+            + (f" [dim](bỏ qua {checkpoint['skipped']} item không hợp lệ)[/dim]" if checkpoint.get("skipped") else "") + "\n"
+            f"[cyan]Item lỗi (sẽ chạy lại, bỏ qua các bước đã xong):[/cyan] [red]{checkpoint.get('failed', 0)}[/red]\n"
+            f"[cyan]Lần chạy cuối:[/cyan] [dim]{time_saved}[/dim]",
+            border_style="yellow",
+            box=box.ROUNDED
+        ))
+        
+        resume = console.input("[bold green]Tiếp tục từ checkpoint? (y/n, mặc định y):[/bold green] ").strip().lower()
+        if not resume or resume == "y":
+            console.print(f"[green]✓ Tiếp tục, bỏ qua {len(done)} items đã xong[/green]")
+        else:
+            clear_checkpoint(json_abspath)
+            done = set()
+            console.print("[yellow]Đã xóa checkpoint, bắt đầu lại từ đầu[/yellow]")
     
-    # Check for checkpoint
-    checkpoint = load_checkpoint()
-    start_index = 0
-    
-    if checkpoint.get("json_path") == os.path.abspath(json_path):
-        last_index = checkpoint.get("last_index", 0)
-        total = checkpoint.get("total", len(items))
-        timestamp = checkpoint.get("timestamp", 0)
-        
-        if last_index > 0 and last_index < len(items):
-            # Format timestamp
-            import datetime
-            time_saved = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-            
-            console.print(Panel(
-                f"[bold yellow]TÌM THẤY CHECKPOINT[/bold yellow]\n\n"
-                f"[cyan]Đã xử lý:[/cyan] [green]{last_index}/{total}[/green] items\n"
-                f"[cyan]Lần chạy cuối:[/cyan] [dim]{time_saved}[/dim]\n"
-                f"[cyan]Tiếp theo:[/cyan] Item #{last_index + 1}",
-                border_style="yellow",
-                box=box.ROUNDED
-            ))
-            
-            resume = console.input("[bold green]Tiếp tục từ checkpoint? (y/n, mặc định y):[/bold green] ").strip().lower()
-            if not resume or resume == "y":
-                start_index = last_index
-                console.print(f"[green]✓ Tiếp tục từ item #{start_index + 1}[/green]")
-            else:
-                clear_checkpoint()
-                console.print("[yellow]Đã xóa checkpoint, bắt đầu lại từ đầu[/yellow]")
-        elif last_index >= len(items):
-            # Checkpoint shows all items were completed
-            console.print("[green]✓ Tất cả items đã được xử lý trước đó[/green]")
-            clear_checkpoint()
+    register_batch(json_abspath, total or 0)
     
     # Ask user how many items to process
-    end_index = len(items)
-    stop_at = console.input(f"\n[bold cyan]Chạy đến item thứ mấy? (1-{len(items)}, Enter để chạy hết):[/bold cyan] ").strip()
-    if stop_at.isdigit():
-        end_index = min(int(stop_at), len(items))
-        console.print(f"[green]✓ Sẽ chạy từ item #{start_index + 1} đến #{end_index}[/green]")
+    end_index = total
+    if total is not None:
+        stop_at = console.input(f"\n[bold cyan]Chạy đến item thứ mấy? (1-{total}, Enter để chạy hết):[/bold cyan] ").strip()
+        if stop_at.isdigit():
+            end_index = min(int(stop_at), total)
+            console.print(f"[green]✓ Sẽ chạy đến item #{end_index}[/green]")
+    
+    counter = {"items": 0}
+    batch_items = iter_batch_items(json_path, json_abspath, done, end_index, counter)
+    dedupe = None if args.no_dedupe else SourceDedupe(json_abspath)
+    
+    # Lập kế hoạch: thời lượng từ playlist -> thứ tự chạy + ETA
+    durations: dict = {}
+    eta = None
+    plan_info = ""
+    if args.plan or args.order != "manifest":
+        planned, durations = plan_batch(batch_items, args.order)
+        batch_items = iter(planned)
+        # Nguồn trùng chỉ tốn thời gian 1 lần khi dedupe bật
+        work, seen = {}, set()
+        for i, _, item in planned:
+            url = normalize_m3u8_url(item["m3u8_url"])
+            work[i] = 0.0 if dedupe and url in seen else durations[i]
+            seen.add(url)
+        eta = BatchEta(work, args)
+        unknown = sum(1 for d in durations.values() if d is None)
+        plan_info = (
+            f"[yellow]Thời lượng audio:[/yellow] {_format_duration(sum(d for d in durations.values() if d))}"
+            + (f" [dim]({unknown} item không rõ thời lượng)[/dim]" if unknown else "") + "\n"
+            f"[yellow]Thứ tự chạy:[/yellow] {args.order}\n"
+            f"[yellow]ETA:[/yellow] "
+            + (f"~{_format_duration(eta.initial)}" if eta.initial is not None
+               else "[dim]chưa có RTF lịch sử, sẽ ước lượng sau item đầu tiên[/dim]") + "\n"
+        )
     
     # Show processing info
+    pending_count = end_index - sum(1 for i in done if i < end_index) if end_index is not None else "?"
     console.print(Panel(
         f"[bold cyan]BẮT ĐẦU XỬ LÝ BATCH[/bold cyan]\n\n"
-        f"[yellow]Tổng items:[/yellow] {len(items)}\n"
-        f"[yellow]Bắt đầu từ:[/yellow] Item #{start_index + 1}\n"
-        f"[yellow]Kết thúc tại:[/yellow] Item #{end_index}\n"
-        f"[yellow]Số lượng xử lý:[/yellow] {end_index - start_index} items\n\n"
-        f"[dim]Checkpoint sẽ tự động lưu sau mỗi item[/dim]\n"
+        f"[yellow]Tổng items:[/yellow] {total_label}\n"
+        f"[yellow]Đã xong trước đó:[/yellow] {len(done)} items\n"
+        f"[yellow]Kết thúc tại:[/yellow] Item #{end_index or '?'}\n"
+        f"[yellow]Số lượng xử lý:[/yellow] {pending_count} items\n"
+        f"{plan_info}\n"
+        f"[dim]Checkpoint lưu trạng thái từng bước của mỗi item[/dim]\n"
         f"[dim]⚡ Nhấn Ctrl+C để dừng (tiến trình sẽ được lưu)[/dim]",
         border_style="cyan",
         box=box.DOUBLE
     ))
     
-    # Process items
-    for i in range(start_index, end_index):
-        item = items[i]
-        slug = item.get("slug", "")
-        m3u8_url = item.get("m3u8_url", "")
-        folder_name = item.get("folder_name", slug)
-        
-        if not m3u8_url or not validate_url(m3u8_url):
-            console.print(f"\n[bold red]Bỏ qua item #{i+1}:[/bold red] URL không hợp lệ")
-            # Save checkpoint to skip this item next time
-            save_checkpoint(os.path.abspath(json_path), i + 1, len(items))
-            continue
-        
-        console.print("\n")
-        item_info = f"[bold cyan]Đang xử lý item {i+1}/{end_index}[/bold cyan]\n\n"
-        item_info += f"[yellow]Slug:[/yellow] {slug}\n"
-        item_info += f"[yellow]Folder:[/yellow] {folder_name}"
-        console.print(Panel(item_info, box=box.DOUBLE, border_style="bright_cyan", title="[bold bright_white]PROCESSING[/bold bright_white]"))
-        
-        try:
-            # Determine output directory
-            if root_path:
-                output_base = os.path.join(root_path, slug)
-            else:
-                output_base = slug
-            
-            os.makedirs(output_base, exist_ok=True)
-            
-            # Create group directory
-            group_dir = os.path.join(output_base, folder_name)
-            os.makedirs(group_dir, exist_ok=True)
-            
-            # Process this item
-            process_single_item(
-                m3u8_url=m3u8_url,
-                output_dir=group_dir,
-                args=args,
-                item_number=i+1,
-                total_items=end_index
-            )
-            
-            # Save checkpoint after each successful item
-            save_checkpoint(os.path.abspath(json_path), i + 1, len(items))
-            console.print(f"[dim]Đã lưu checkpoint: {i + 1}/{len(items)} items hoàn thành[/dim]")
-            
-        except KeyboardInterrupt:
-            console.print("\n[bold yellow]Đã hủy bởi người dùng[/bold yellow]")
-            save_checkpoint(os.path.abspath(json_path), i, len(items))
-            console.print(f"[green]✓ Đã lưu checkpoint tại item #{i+1}[/green]")
-            console.print(f"[cyan]Lần chạy sau sẽ tiếp tục từ item #{i+1}[/cyan]")
-            sys.exit(0)
-        except Exception as e:
-            console.print(f"\n[bold red]LỖI xử lý item #{i+1}:[/bold red] {e}")
-            # Save checkpoint even on error to skip this item next time
-            save_checkpoint(os.path.abspath(json_path), i + 1, len(items))
-            console.print(f"[yellow]Đã bỏ qua item này, checkpoint đã lưu[/yellow]")
-            # Continue to next item on error
-            continue
+    # Process items (đọc dần từ manifest)
+    finished: List[dict] = []
+    try:
+        if args.pipeline or args.jobs > 1:
+            _process_batch_pipelined(json_abspath, batch_items, end_index, args, finished, dedupe, durations, eta)
+        else:
+            for i, root_path, item in batch_items:
+                slug = item.get("slug", "")
+                folder_name = item.get("folder_name", slug)
+                
+                console.print("\n")
+                item_info = f"[bold cyan]Đang xử lý item {i+1}/{end_index or '?'}[/bold cyan]\n\n"
+                item_info += f"[yellow]Slug:[/yellow] {slug}\n"
+                item_info += f"[yellow]Folder:[/yellow] {folder_name}"
+                console.print(Panel(item_info, box=box.DOUBLE, border_style="bright_cyan", title="[bold bright_white]PROCESSING[/bold bright_white]"))
+                
+                key = None
+                try:
+                    # Determine output directory: {root_path}/{slug}/{folder_name}
+                    group_dir = _item_output_dir(root_path, slug, folder_name)
+                    
+                    # Nguồn trùng đã có kết quả (trong batch này hoặc lần chạy trước): chỉ fan-out
+                    if dedupe:
+                        key = dedupe.key(item["m3u8_url"], args, item.get("profile"))
+                        if dedupe.claim(key, i, group_dir) != "primary":
+                            continue
+                    
+                    # Process this item (trạng thái từng bước được ghi vào checkpoint)
+                    ctx = process_single_item(
+                        m3u8_url=item["m3u8_url"],
+                        output_dir=group_dir,
+                        args=args,
+                        item_number=i+1,
+                        total_items=end_index or 0,
+                        checkpoint=(json_abspath, i),
+                        profile=item.get("profile"),
+                        duration=durations.get(i)
+                    )
+                    finished.append(_report_entry(ctx))
+                    if key:
+                        dedupe.complete(key, ctx)
+                    if eta:
+                        console.print(f"[dim]{eta.update(completed_items(json_abspath))}[/dim]")
+                except Exception as e:
+                    if key:
+                        dedupe.fail(key, e)
+                    console.print(f"\n[bold red]LỖI xử lý item #{i+1}:[/bold red] {e}")
+                    console.print(f"[yellow]Đã bỏ qua item này, lần chạy sau sẽ thử lại các bước chưa xong[/yellow]")
+                    # Continue to next item on error
+                    continue
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]Đã hủy bởi người dùng[/bold yellow]")
+        console.print(f"[green]✓ Checkpoint đã lưu ({len(completed_items(json_abspath))}/{total_label} items hoàn thành)[/green]")
+        console.print("[cyan]Lần chạy sau sẽ tiếp tục các item và bước chưa xong[/cyan]")
+        sys.exit(0)
+    
+    # Giải phóng model sau khi chạy xong batch
+    release_models()
+    display_decode_report(finished)
+    display_metrics_report(finished)
+    if eta:
+        console.print(f"[cyan]Thời gian chạy:[/cyan] {_format_duration(time.perf_counter() - eta.started)}"
+                      + (f" [dim](ETA ban đầu ~{_format_duration(eta.initial)})[/dim]" if eta.initial is not None else ""))
+    
+    done = completed_items(json_abspath)
+    skipped = load_checkpoint(json_abspath).get("skipped") or 0
+    if total is None:
+        total = counter["items"]
+        register_batch(json_abspath, total)
     
     # Clear checkpoint when completed all
-    if end_index >= len(items):
-        clear_checkpoint()
+    if len(done) >= total:
+        clear_checkpoint(json_abspath)
         console.print("\n")
         console.print(Panel(
             "[bold green]HOÀN THÀNH TẤT CẢ ITEMS![/bold green]\n\n"
-            f"[cyan]Tổng số items xử lý:[/cyan] [green]{end_index - start_index}[/green]\n"
-            f"[cyan]Từ item:[/cyan] #{start_index + 1}\n"
-            f"[cyan]Đến item:[/cyan] #{end_index}\n\n"
+            f"[cyan]Tổng số items xử lý:[/cyan] [green]{len(finished)}[/green]\n"
+            f"[cyan]Dùng lại từ nguồn trùng:[/cyan] [green]{dedupe.reused if dedupe else 0}[/green]\n"
+            f"[cyan]Bỏ qua (URL không hợp lệ):[/cyan] [yellow]{skipped}[/yellow]\n"
+            f"[cyan]Tổng số items:[/cyan] {total}\n\n"
             "[green]✓ Checkpoint đã được xóa[/green]\n"
             "[dim]Lần chạy sau sẽ bắt đầu từ đầu[/dim]",
             border_style="green",
             box=box.DOUBLE
         ))
     else:
-        save_checkpoint(os.path.abspath(json_path), end_index, len(items))
         console.print("\n")
         console.print(Panel(
-            f"[bold green]✓ ĐÃ XỬ LÝ ĐẾN ITEM #{end_index}[/bold green]\n\n"
-            f"[cyan]Đã xử lý:[/cyan] [green]{end_index}/{len(items)}[/green] items\n"
-            f"[cyan]Còn lại:[/cyan] [yellow]{len(items) - end_index}[/yellow] items\n"
-            f"[cyan]Item tiếp theo:[/cyan] #{end_index + 1}\n\n"
+            f"[bold green]✓ ĐÃ XỬ LÝ ĐẾN ITEM #{end_index or counter['items']}[/bold green]\n\n"
+            f"[cyan]Đã xong:[/cyan] [green]{len(done)}/{total}[/green] items"
+            + (f" [dim](bỏ qua {skipped} item không hợp lệ)[/dim]" if skipped else "") + "\n"
+            f"[cyan]Còn lại:[/cyan] [yellow]{total - len(done)}[/yellow] items\n\n"
             "[green]✓ Checkpoint đã lưu[/green]\n"
-            f"[cyan]Lần chạy sau sẽ tiếp tục từ item #{end_index + 1}[/cyan]",
+            "[cyan]Lần chạy sau sẽ tiếp tục các item chưa xong[/cyan]",
             border_style="cyan",
             box=box.DOUBLE
         ))
 
 
+# ---------------------------------------------------------------------------
+# Stage planner: từ các output được yêu cầu suy ra đồ thị bước tối thiểu
+# (tải gì, tách gì), các nhánh độc lập trên cùng input chạy song song
+# ---------------------------------------------------------------------------
+
+@dataclass
+class StagePlan:
+    """
+    Các bước cần chạy cho 1 item.
+
+    fetch: "av" (video kèm audio), "video" (chỉ hình, -an), "audio" (chỉ
+    rendition audio, decode thẳng 16kHz) hoặc None (không cần tải gì).
+    """
+    fetch: Optional[str]
+    extract_audio: bool
+    thumbnails: bool
+    transcribe: bool
+
+    @property
+    def need_video(self) -> bool:
+        return self.fetch in ("av", "video")
+
+    def describe(self) -> str:
+        """Đồ thị dạng text, ví dụ: download(av) → [extract audio ∥ thumbnails] → transcribe."""
+        if self.fetch is None:
+            return "(không có bước nào)"
+        nodes = [f"download({self.fetch})"]
+        branches = [name for name, on in (("extract audio", self.extract_audio), ("thumbnails", self.thumbnails)) if on]
+        if branches:
+            nodes.append(f"[{' ∥ '.join(branches)}]" if len(branches) > 1 else branches[0])
+        if self.transcribe:
+            nodes.append("transcribe")
+        return " → ".join(nodes)
+
+
+def plan_stages(save_video: bool, save_audio: bool, transcribe: bool, thumbnails: bool) -> StagePlan:
+    """
+    Đồ thị bước tối thiểu cho các output được yêu cầu.
+
+    Chỉ tải video khi cần lưu video hoặc tạo thumbnails; nếu không cần audio
+    thì tải video không kèm audio. Cần cả video lẫn audio thì tải 1 lần rồi
+    tách audio từ file đã tải (không tải lại qua mạng).
+    """
+    need_audio = save_audio or transcribe
+    if save_video or thumbnails:
+        fetch = "av" if save_video or need_audio else "video"
+        return StagePlan(fetch, extract_audio=need_audio, thumbnails=thumbnails, transcribe=transcribe)
+    if need_audio:
+        return StagePlan("audio", extract_audio=False, thumbnails=False, transcribe=transcribe)
+    return StagePlan(None, extract_audio=False, thumbnails=False, transcribe=False)
+
+
+def run_branches(branches: dict) -> dict:
+    """
+    Chạy song song các nhánh độc lập (callable không tham số), trả về {tên: kết quả}.
+
+    Nhánh đầu chạy ở thread hiện tại (giữ progress bar), các nhánh còn lại chạy
+    ở thread riêng với UI quiet (Rich chỉ cho 1 live display); lỗi của bất kỳ
+    nhánh nào được raise lại sau khi mọi nhánh đã dừng.
+    """
+    names = list(branches)
+    results, errors = {}, {}
+    sink = getattr(_UI_STATE, "sink", None)
 
-def process_single_item(m3u8_url: str, output_dir: str, args, item_number: int = 0, total_items: int = 0) -> None:
-    """Process a single m3u8 item (download, extract, transcribe)."""
-    
+    def run(name: str) -> None:
+        _UI_STATE.quiet = True
+        _UI_STATE.sink = sink
+        try:
+            results[name] = branches[name]()
+        except BaseException as e:
+            errors[name] = e
+
+    threads = [threading.Thread(target=run, args=(name,), daemon=True, name=f"branch-{name}") for name in names[1:]]
+    for t in threads:
+        t.start()
+    try:
+        if names:
+            results[names[0]] = branches[names[0]]()
+    finally:
+        for t in threads:
+            t.join()
+    for name in names[1:]:
+        if name in errors:
+            raise errors[name]
+    return results
+
+
+def plan_item(m3u8_url: str, output_dir: str, args, item_number: int = 0, total_items: int = 0,
+              checkpoint: Optional[tuple] = None, profile: Optional[str] = None,
+              duration: Optional[float] = None) -> dict:
+    """
+    Xác định file cần lưu, đường dẫn và các bước cần chạy cho 1 item.
+
+    duration: thời lượng đã biết từ playlist (lượt lập kế hoạch batch), dùng cho metrics/RTF.
+    """
     # Determine which files to save
     has_save_flags = args.save_video or args.save_audio or args.save_vtt
     if has_save_flags:
         save_video = args.save_video
         save_audio = args.save_audio
         save_vtt = args.save_vtt
+    elif args.create_thumbnails:
+        # Chỉ thumbnails (như lựa chọn 8 ở direct mode): chỉ tải video không kèm audio
+        save_video = False
+        save_audio = False
+        save_vtt = False
     else:
         save_video = True
         save_audio = True
@@ -1073,53 +4141,1203 @@ def process_single_item(m3u8_url: str, output_dir: str, args, item_number: int =
     # Language
     language = args.language or "auto"
     
-    # GPU
-    use_gpu = not args.no_gpu
-    
     # Thumbnails
     create_thumbnails = args.create_thumbnails
     
-    # File paths
-    video_path = os.path.join(output_dir, "video.mp4")
-    audio_path = os.path.join(output_dir, "audio.wav")
-    vtt_path = os.path.join(output_dir, f"{args.output_prefix}_{language}.vtt")
-    thumbnail_vtt_path = os.path.join(output_dir, "thumbnails.vtt")
-    
-    # Process
-    video = download_from_m3u8(m3u8_url, video_path)
+    # Decoding profile: theo item (batch JSON) nếu có, ngược lại theo CLI
+    if profile and profile not in DECODING_PROFILES:
+        console.print(f"[yellow]Item #{item_number}: profile '{profile}' không hợp lệ, dùng '{args.profile}'[/yellow]")
+        profile = None
     
-    need_transcription = save_vtt
-    if need_transcription:
-        audio = extract_audio(video, audio_path)
-        result = transcribe_audio(audio, model_name=args.model, lang=language if language != "auto" else None, use_gpu=use_gpu)
-        
-        if save_vtt:
-            save_subtitles(result, vtt_path)
+    vtt_path = os.path.join(output_dir, f"{args.output_prefix}_{language}.vtt")
+    ctx = {
+        "m3u8_url": m3u8_url,
+        "output_dir": output_dir,
+        "item_number": item_number,
+        "total_items": total_items,
+        "save_video": save_video,
+        "save_audio": save_audio,
+        "save_vtt": save_vtt,
+        "create_thumbnails": create_thumbnails,
+        "language": language,
+        "plan": plan_stages(save_video, save_audio, save_vtt, create_thumbnails),
+        # PCM giữ trong bộ nhớ cho Whisper; WAV chỉ ghi khi được chọn lưu
+        "audio_in_memory": args.audio_handoff == "memory" and save_vtt,
+        "video_path": os.path.join(output_dir, "video.mp4"),
+        "audio_path": os.path.join(output_dir, "audio.wav"),
+        "vtt_path": vtt_path,
+        "subtitle_paths": subtitle_paths(vtt_path, args.subtitle_formats),
+        "thumbnail_vtt_path": os.path.join(output_dir, "thumbnails.vtt"),
+        "video": None,
+        "audio": None,
+        "sprite_info": {},
+        "profile": profile or args.profile,
+        "model": args.model,
+        "decode_stats": None,
+        "checkpoint": checkpoint,
+        "resume_stages": 0,
+        "metrics": None if args.no_metrics else [],
+        "audio_seconds": duration,
+        "started_perf": time.perf_counter(),
+    }
     
-    # Thumbnails
-    sprite_info = {}
-    if create_thumbnails:
-        sprite_info = extract_thumbnails(
-            video_path, output_dir, 
+    # Resume: bỏ qua các bước mà kết quả từ lần chạy trước vẫn còn hợp lệ
+    if checkpoint:
+        ctx["resume_stages"] = _resume_stage_count(*checkpoint)
+        if ctx["resume_stages"]:
+            if os.path.exists(ctx["video_path"]):
+                ctx["video"] = ctx["video_path"]
+            if os.path.exists(ctx["audio_path"]):
+                ctx["audio"] = ctx["audio_path"]
+        # PCM trong bộ nhớ không còn sau lần chạy trước: cần tách/tải lại audio
+        if ctx["resume_stages"] < len(CHECKPOINT_STAGES) and ctx["save_vtt"] and ctx["audio"] is None:
+            ctx["resume_stages"] = 1 if ctx["video"] else 0
+    return ctx
+
+
+def _resume_stage_count(json_path: str, index: int) -> int:
+    """Số bước đầu tiên có thể bỏ qua: tính đến bước muộn nhất đã 'done' và artifacts còn hợp lệ."""
+    state = load_item_state(json_path, index)
+    for k in range(len(CHECKPOINT_STAGES) - 1, -1, -1):
+        row = state.get(CHECKPOINT_STAGES[k])
+        if row and row["status"] == "done" and _artifacts_valid(row["artifacts"]):
+            return k + 1
+    return 0
+
+
+def _stage_artifacts(ctx: dict, stage: str) -> List[str]:
+    """Các file đầu ra của 1 bước (ghi fingerprint vào checkpoint)."""
+    wav = [ctx["audio_path"]] if os.path.exists(ctx["audio_path"]) else []
+    if stage == "download":
+        return [ctx["video"]] if ctx["video"] else wav
+    if stage == "extract":
+        paths = list(wav)
+        if ctx["sprite_info"]:
+            paths += [ctx["sprite_info"]["sprite_path"], ctx["thumbnail_vtt_path"]]
+        return paths
+    if stage == "transcribe":
+        return list(ctx["subtitle_paths"]) if ctx["save_vtt"] else []
+    # item: các file được giữ lại
+    paths = []
+    if ctx["save_video"]:
+        paths.append(ctx["video_path"])
+    if ctx["save_audio"]:
+        paths.append(ctx["audio_path"])
+    if ctx["save_vtt"]:
+        paths.extend(ctx["subtitle_paths"])
+    return [p for p in paths if os.path.exists(p)]
+
+
+# ---------------------------------------------------------------------------
+# Metrics: mỗi bước của item ghi 1 dòng JSON vào <output_dir>/metrics.jsonl
+# (wall/CPU time, bytes vào/ra, peak RSS, real-time factor so với độ dài audio)
+# ---------------------------------------------------------------------------
+
+METRICS_FILENAME = "metrics.jsonl"
+_RSS_SAMPLE_INTERVAL = 0.2
+
+
+def _current_rss() -> Optional[int]:
+    """RSS hiện tại của process (bytes), None nếu không đọc được (không có /proc)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _media_bytes(media) -> int:
+    """Kích thước của file (đường dẫn) hoặc mảng PCM trong bộ nhớ."""
+    if media is None:
+        return 0
+    if isinstance(media, str):
+        return os.path.getsize(media) if os.path.exists(media) else 0
+    return int(media.nbytes)
+
+
+def _audio_seconds(audio) -> Optional[float]:
+    if audio is None:
+        return None
+    if isinstance(audio, str):
+        # WAV 16-bit mono 16kHz = 32000 bytes/giây
+        return os.path.getsize(audio) / 32000 if os.path.exists(audio) else None
+    return len(audio) / PCM_SAMPLE_RATE
+
+
+def _stage_io_bytes(ctx: dict, stage: str, before: bool) -> Optional[int]:
+    """Bytes vào (before=True) hoặc ra của 1 bước; None nếu không đo được (dữ liệu mạng)."""
+    if stage == "download":
+        return None if before else _media_bytes(ctx["video"]) + _media_bytes(ctx["audio"])
+    if stage == "extract":
+        if before:
+            return _media_bytes(ctx["video"])
+        sprite = ctx["sprite_info"]
+        audio = _media_bytes(ctx["audio"]) if ctx["video"] else 0  # Không có video: audio do bước download tạo
+        return audio + (_media_bytes(sprite["sprite_path"]) if sprite else 0)
+    if before:
+        return _media_bytes(ctx["audio"])
+    return sum(_media_bytes(p) for p in ctx["subtitle_paths"])
+
+
+@contextlib.contextmanager
+def stage_metrics(ctx: dict, stage: str):
+    """
+    Đo 1 bước của item và ghi vào ctx["metrics"] + metrics.jsonl.
+
+    CPU time tính cho cả process (kể cả ffmpeg con), nên khi pipeline chạy
+    nhiều bước song song, giá trị gồm cả phần của các bước chạy cùng lúc.
+    """
+    record = {"item": ctx["item_number"], "stage": stage, "status": "done"}
+    bytes_in = _stage_io_bytes(ctx, stage, before=True)
+    peak = {"rss": _current_rss()}
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(_RSS_SAMPLE_INTERVAL):
+            rss = _current_rss()
+            if rss is not None:
+                peak["rss"] = max(peak["rss"] or 0, rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if peak["rss"] is not None:
+        sampler.start()
+    cpu_start = os.times()
+    wall_start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "failed"
+        raise
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu_end = os.times()
+        done.set()
+        if sampler.is_alive():
+            sampler.join()
+            peak["rss"] = max(peak["rss"], _current_rss() or 0)
+        if ctx.get("audio_seconds") is None:
+            ctx["audio_seconds"] = _audio_seconds(ctx["audio"])
+        audio_seconds = ctx.get("audio_seconds")
+        bytes_out = _stage_io_bytes(ctx, stage, before=False)
+        record.update(
+            timestamp=time.time(),
+            wall_s=round(wall, 3),
+            cpu_s=round(sum(cpu_end[:4]) - sum(cpu_start[:4]), 3),
+            bytes_in=bytes_in,
+            bytes_out=bytes_out,
+            throughput_mbps=round(bytes_out / wall / 1024 / 1024, 2) if bytes_out and wall > 0 else None,
+            peak_rss_mb=round(peak["rss"] / 1024 / 1024, 1) if peak["rss"] else None,
+            audio_s=round(audio_seconds, 1) if audio_seconds else None,
+            rtf=round(wall / audio_seconds, 4) if audio_seconds else None,
+        )
+        write_metrics(ctx, record)
+        if record["status"] == "done" and record["rtf"] is not None:
+            record_stage_rtf(stage, _history_variant(stage, ctx["plan"].need_video, ctx["model"]), record["rtf"])
+
+
+def write_metrics(ctx: dict, record: dict) -> None:
+    """Ghi nối 1 bản ghi metrics của item (bỏ qua nếu metrics bị tắt)."""
+    if ctx.get("metrics") is None:
+        return
+    ctx["metrics"].append(record)
+    try:
+        with open(os.path.join(ctx["output_dir"], METRICS_FILENAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        console.print(f"[yellow]Không ghi được metrics: {e}[/yellow]")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Percentile q (0-100) với nội suy tuyến tính."""
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def display_metrics_report(contexts: List[dict]) -> None:
+    """Bảng tổng kết metrics theo bước (p50 / p95 / max) của các item trong lượt chạy."""
+    records = [r for c in contexts for r in (c.get("metrics") or []) if r["status"] == "done"]
+    if not records:
+        return
+
+    def fmt(values: List[float], q: float, digits: int = 1) -> str:
+        values = [v for v in values if v is not None]
+        return f"{_percentile(values, q):.{digits}f}" if values else "-"
+
+    table = Table(title="[bold cyan]Metrics theo bước (p50 / p95 / max)[/bold cyan]", box=box.ROUNDED)
+    table.add_column("Bước", style="cyan")
+    table.add_column("N", justify="right")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("CPU (s)", justify="right")
+    table.add_column("RTF", style="yellow", justify="right")
+    table.add_column("MB/s", justify="right")
+    table.add_column("Peak RSS (MB)", style="magenta", justify="right")
+    for stage in [*CHECKPOINT_STAGES, "item"]:
+        rows = [r for r in records if r["stage"] == stage]
+        if not rows:
+            continue
+        col = {key: [r.get(key) for r in rows] for key in ("wall_s", "cpu_s", "rtf", "throughput_mbps", "peak_rss_mb")}
+        table.add_row(
+            stage, str(len(rows)),
+            *(" / ".join(fmt(col[key], q, 3 if key == "rtf" else 1) for q in (50, 95, 100))
+              for key in ("wall_s", "cpu_s", "rtf", "throughput_mbps")),
+            fmt(col["peak_rss_mb"], 100),
+        )
+    console.print(table)
+
+
+def run_item_stage(ctx: dict, stage: str, fn, args) -> None:
+    """Chạy 1 bước của item (hoặc bỏ qua nếu đã có kết quả) và ghi trạng thái vào checkpoint."""
+    checkpoint = ctx.get("checkpoint")
+    if CHECKPOINT_STAGES.index(stage) < ctx.get("resume_stages", 0):
+        console.print(f"[dim]↷ Item #{ctx['item_number']}: bỏ qua bước {stage} (đã có kết quả hợp lệ)[/dim]")
+        return
+    try:
+        with stage_metrics(ctx, stage):
+            fn(ctx, args)
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        if checkpoint:
+            record_item_stage(*checkpoint, stage, "failed", error=str(e) or type(e).__name__)
+        raise
+    if checkpoint:
+        record_item_stage(*checkpoint, stage, "done", _stage_artifacts(ctx, stage))
+
+
+def finish_item(ctx: dict) -> None:
+    """Dọn dẹp và đánh dấu item hoàn tất trong checkpoint."""
+    stage_finalize(ctx)
+    if ctx.get("checkpoint"):
+        record_item_stage(*ctx["checkpoint"], "item", "done", _stage_artifacts(ctx, "item"))
+    wall = time.perf_counter() - ctx["started_perf"]
+    audio_seconds = ctx.get("audio_seconds")
+    write_metrics(ctx, {
+        "item": ctx["item_number"], "stage": "item", "status": "done", "timestamp": time.time(),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(sum(r["cpu_s"] for r in ctx.get("metrics") or []), 3),
+        "bytes_out": sum(_media_bytes(p) for p in _stage_artifacts(ctx, "item")),
+        "peak_rss_mb": max((r["peak_rss_mb"] for r in ctx.get("metrics") or [] if r.get("peak_rss_mb")), default=None),
+        "audio_s": round(audio_seconds, 1) if audio_seconds else None,
+        "rtf": round(wall / audio_seconds, 4) if audio_seconds else None,
+    })
+
+
+def stage_download(ctx: dict, args) -> None:
+    """Bước mạng: tải video (kèm audio hoặc chỉ hình) hoặc chỉ tải audio, theo plan của item."""
+    resume = not args.no_resume
+    plan = ctx["plan"]
+    if plan.need_video:
+        ctx["video"] = download_from_m3u8(ctx["m3u8_url"], ctx["video_path"], args.downloader,
+                                          args.download_workers, args.segment_retries, resume,
+                                          with_audio=plan.fetch == "av")
+    elif plan.fetch == "audio":
+        ctx["audio"] = download_audio_from_m3u8(ctx["m3u8_url"], ctx["audio_path"], args.downloader,
+                                                args.download_workers, args.segment_retries, resume,
+                                                ctx["audio_in_memory"], ctx["save_audio"])
+
+
+def stage_extract(ctx: dict, args) -> None:
+    """
+    Bước ffmpeg: tách audio và tạo thumbnails từ video (2 nhánh độc lập, chạy
+    song song trên cùng file), sau đó xóa video nếu không cần lưu.
+    """
+    video_path = ctx["video_path"]
+    plan = ctx["plan"]
+    branches = {}
+    if ctx["video"] and plan.extract_audio:
+        branches["audio"] = lambda: extract_audio(ctx["video"], ctx["audio_path"], ctx["audio_in_memory"],
+                                                  ctx["save_audio"])
+    if ctx["video"] and plan.thumbnails:
+        branches["thumbnails"] = lambda: extract_thumbnails(
+            video_path, ctx["output_dir"], 
             args.thumbnail_interval, 
             args.thumb_width, 
             args.thumb_height, 
             args.thumb_cols, 
-            args.thumb_format
+            args.thumb_format,
+            args.thumb_mode
         )
-        if sprite_info:
-            create_thumbnail_vtt(sprite_info, thumbnail_vtt_path, args.thumbnail_interval, args.cdn_url)
+    results = run_branches(branches)
+    if "audio" in results:
+        ctx["audio"] = results["audio"]
+    sprite_info = results.get("thumbnails") or {}
+    if sprite_info:
+        create_thumbnail_vtt(sprite_info, ctx["thumbnail_vtt_path"], args.thumbnail_interval, args.cdn_url)
+    ctx["sprite_info"] = sprite_info
     
-    # Cleanup
-    if not save_video and os.path.exists(video_path):
+    # Video không còn cần cho các bước sau -> xóa sớm để giải phóng đĩa
+    if not ctx["save_video"] and os.path.exists(video_path):
         os.remove(video_path)
         console.print(f"[dim]Đã xóa video[/dim]")
+
+
+def stage_transcribe(ctx: dict, args) -> None:
+    """Bước model: nhận dạng giọng nói và lưu phụ đề."""
+    if ctx["plan"].transcribe and ctx["audio"] is not None:
+        language = ctx["language"]
+        result = transcribe_to_subtitles(ctx["audio"], ctx["vtt_path"], args.subtitle_formats, model_name=args.model,
+                                         lang=language if language != "auto" else None, use_gpu=not args.no_gpu,
+                                         vad=args.vad, cpu_workers=args.cpu_workers, profile=ctx["profile"],
+                                         window_seconds=args.window_seconds)
+        ctx["decode_stats"] = result.get("decode_stats")
+
+
+def stage_finalize(ctx: dict) -> None:
+    """Dọn dẹp các file không được chọn lưu."""
+    ctx["audio"] = None
+    remove_pcm_spill(ctx["audio_path"])
+    if not ctx["save_video"] and os.path.exists(ctx["video_path"]):
+        os.remove(ctx["video_path"])
+        console.print(f"[dim]Đã xóa video[/dim]")
     
-    if not save_audio and os.path.exists(audio_path):
-        os.remove(audio_path)
+    if not ctx["save_audio"] and os.path.exists(ctx["audio_path"]):
+        os.remove(ctx["audio_path"])
         console.print(f"[dim]Đã xóa audio[/dim]")
+
+
+def process_single_item(m3u8_url: str, output_dir: str, args, item_number: int = 0, total_items: int = 0,
+                        checkpoint: Optional[tuple] = None, profile: Optional[str] = None,
+                        duration: Optional[float] = None) -> dict:
+    """Process a single m3u8 item (download, extract, transcribe). Returns the item context."""
+    ctx = plan_item(m3u8_url, output_dir, args, item_number, total_items, checkpoint, profile, duration)
+    run_item_stage(ctx, "download", stage_download, args)
+    run_item_stage(ctx, "extract", stage_extract, args)
+    run_item_stage(ctx, "transcribe", stage_transcribe, args)
+    finish_item(ctx)
     
     console.print(f"\n[bold green]✓ Hoàn thành item #{item_number}/{total_items}[/bold green]")
+    return ctx
+
+
+# ---------------------------------------------------------------------------
+# Pipeline: chạy download / extract / transcribe của các item chồng lên nhau
+# ---------------------------------------------------------------------------
+
+_PIPELINE_STAGES = (
+    ("download", stage_download),
+    ("extract", stage_extract),
+    ("transcribe", stage_transcribe),
+)
+_PIPELINE_DONE = object()
+
+
+def run_pipeline(jobs, args, on_done=None, on_error=None) -> None:
+    """
+    Chạy các item qua pipeline download -> extract -> transcribe.
+
+    Mỗi bước có số worker riêng, giữa các bước là queue giới hạn kích thước
+    (backpressure: bước trước chờ khi bước sau chưa kịp xử lý, nên số item
+    nằm trên đĩa luôn bị chặn trên).
+
+    Args:
+        jobs: iterable các (index, ctx) từ plan_item
+        on_done: callback(index, ctx) khi item hoàn tất
+        on_error: callback(index, ctx, exc) khi 1 bước lỗi (item bị bỏ qua)
+    """
+    worker_counts = {
+        "download": max(1, args.pipeline_download_workers),
+        "extract": max(1, args.pipeline_extract_workers),
+        "transcribe": max(1, args.pipeline_transcribe_workers),
+    }
+    queues = [queue.Queue(maxsize=max(1, args.pipeline_queue)) for _ in _PIPELINE_STAGES]
+    stop = threading.Event()
+    callback_lock = threading.Lock()
+    finished = {name: 0 for name, _ in _PIPELINE_STAGES}
+    finished_lock = threading.Lock()
+
+    def feed():
+        for job in jobs:
+            if stop.is_set():
+                break
+            queues[0].put(job)
+        for _ in range(worker_counts["download"]):
+            queues[0].put(_PIPELINE_DONE)
+
+    def work(stage_index: int):
+        name, fn = _PIPELINE_STAGES[stage_index]
+        in_q = queues[stage_index]
+        out_q = queues[stage_index + 1] if stage_index + 1 < len(queues) else None
+        _UI_STATE.quiet = True
+        while True:
+            job = in_q.get()
+            if job is _PIPELINE_DONE:
+                break
+            if stop.is_set():
+                continue
+            index, ctx = job
+            console.print(f"[dim]item #{index + 1}[/dim] [bold cyan]▶ {name}[/bold cyan]")
+            try:
+                run_item_stage(ctx, name, fn, args)
+            except (Exception, SystemExit) as e:
+                with callback_lock:
+                    if on_error:
+                        on_error(index, ctx, e)
+                continue
+            if out_q is not None:
+                out_q.put(job)
+            else:
+                finish_item(ctx)
+                with callback_lock:
+                    if on_done:
+                        on_done(index, ctx)
+
+        # Worker cuối cùng của bước này báo cho bước sau là đã hết việc
+        with finished_lock:
+            finished[name] += 1
+            last = finished[name] == worker_counts[name]
+        if last and out_q is not None:
+            next_name = _PIPELINE_STAGES[stage_index + 1][0]
+            for _ in range(worker_counts[next_name]):
+                out_q.put(_PIPELINE_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True, name="pipeline-feed")]
+    for stage_index, (name, _) in enumerate(_PIPELINE_STAGES):
+        for n in range(worker_counts[name]):
+            threads.append(threading.Thread(target=work, args=(stage_index,), daemon=True,
+                                            name=f"pipeline-{name}-{n}"))
+    for t in threads:
+        t.start()
+
+    try:
+        # join có timeout để main thread vẫn nhận được Ctrl+C
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Scheduler --jobs: nhiều item chạy cùng lúc, mỗi bước phải giữ 1 slot của loại
+# tài nguyên nó dùng (mạng / ffmpeg / model) nên không bước nào bị chạy quá tải
+# ---------------------------------------------------------------------------
+
+_STAGE_RESOURCES = {"download": "network", "extract": "ffmpeg", "transcribe": "model"}
+_JOBS_RECENT_ROWS = 5  # Số item đã xong vẫn hiện trong live view
+
+
+def job_slot_limits(args) -> dict:
+    """Số slot cho từng loại tài nguyên (0 = tự chọn theo --jobs và số core)."""
+    return {
+        "network": args.net_slots or args.jobs,
+        "ffmpeg": args.ffmpeg_slots or min(args.jobs, max(1, (os.cpu_count() or 1) // 4)),
+        "model": args.model_slots or 1,
+    }
+
+
+class JobsView:
+    """Live view nhiều dòng của scheduler --jobs: mỗi item 1 dòng (bước, trạng thái, thời gian, dòng log cuối)."""
+
+    def __init__(self, jobs: int, slots: dict):
+        self.jobs = jobs
+        self.slots = slots
+        self.rows: "OrderedDict[int, dict]" = OrderedDict()
+        self.note = ""
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def update(self, index: int, **fields) -> None:
+        with self.lock:
+            row = self.rows.setdefault(index, {"stage": "", "state": "chờ", "started": time.time(),
+                                               "stage_started": time.time(), "stages": {}, "message": "",
+                                               "finished": None})
+            if "stage" in fields and fields["stage"] != row["stage"]:
+                row["stage_started"] = time.time()
+            if fields.get("state") == "chạy":
+                row["stage_started"] = time.time()
+            if fields.get("state") in ("xong", "lỗi") and row["finished"] is None:
+                row["finished"] = time.time()
+            row.update(fields)
+
+    def stage_done(self, index: int, stage: str) -> None:
+        with self.lock:
+            row = self.rows[index]
+            row["stages"][stage] = time.time() - row["stage_started"]
+
+    def sink(self, index: Optional[int]):
+        """Hàm nhận output console của thread item: giữ dòng cuối làm trạng thái."""
+        def write(objects) -> None:
+            text = " ".join(o if isinstance(o, str) else "" for o in objects).strip()
+            if not text:
+                return
+            line = text.splitlines()[-1]
+            try:
+                plain = Text.from_markup(line).plain.strip()
+            except Exception:  # Text có dấu [ ] không phải markup
+                plain = line
+            with self.lock:
+                if index is None:
+                    self.note = plain
+                elif index in self.rows:
+                    self.rows[index]["message"] = plain
+        return write
+
+    def __rich__(self):
+        with self.lock:
+            rows = list(self.rows.items())
+            note = self.note
+        active = [r for r in rows if r[1]["finished"] is None]
+        finished = [r for r in rows if r[1]["finished"] is not None]
+        done = sum(1 for _, r in finished if r["state"] == "xong")
+        table = Table(box=box.SIMPLE_HEAD, expand=True,
+                      title=f"[bold cyan]--jobs {self.jobs}[/bold cyan] [dim]slots mạng {self.slots['network']} · "
+                            f"ffmpeg {self.slots['ffmpeg']} · model {self.slots['model']}[/dim]",
+                      caption=f"[green]{done} xong[/green] · [red]{len(finished) - done} lỗi[/red] · "
+                              f"[cyan]{len(active)} đang chạy[/cyan] · {time.time() - self.started:.0f}s"
+                              + (f"\n[dim]{note}[/dim]" if note else ""))
+        table.add_column("Item", style="cyan", justify="right", width=6)
+        table.add_column("Bước", style="yellow", width=10)
+        table.add_column("Trạng thái", width=10)
+        table.add_column("Thời gian", justify="right", width=9)
+        table.add_column("Log", style="dim", overflow="ellipsis", no_wrap=True)
+        styles = {"chờ slot": "magenta", "chạy": "bold blue", "xong": "green", "lỗi": "red"}
+        now = time.time()
+        for index, row in finished[-_JOBS_RECENT_ROWS:] + active:
+            elapsed = (row["finished"] or now) - row["started"]
+            style = styles.get(row["state"], "white")
+            table.add_row(f"#{index + 1}", row["stage"], f"[{style}]{row['state']}[/{style}]",
+                          f"{elapsed:.0f}s", row["message"])
+        return table
+
+    def summary(self) -> Table:
+        """Bảng tổng kết cuối lượt chạy: thời gian từng bước của mỗi item."""
+        table = Table(title="[bold cyan]Kết quả --jobs[/bold cyan]", box=box.ROUNDED)
+        table.add_column("Item", style="cyan", justify="right")
+        table.add_column("Kết quả")
+        for stage, _ in _PIPELINE_STAGES:
+            table.add_column(f"{stage} (s)", justify="right")
+        table.add_column("Tổng (s)", justify="right")
+        table.add_column("Chi tiết", style="dim")
+        with self.lock:
+            rows = sorted(self.rows.items())
+        for index, row in rows:
+            ok = row["state"] == "xong"
+            table.add_row(
+                f"#{index + 1}", "[green]✓[/green]" if ok else "[red]✗[/red]",
+                *(f"{row['stages'][stage]:.1f}" if stage in row["stages"] else "-" for stage, _ in _PIPELINE_STAGES),
+                f"{((row['finished'] or time.time()) - row['started']):.1f}",
+                "" if ok else row["message"],
+            )
+        wall = time.time() - self.started
+        table.caption = f"{len(rows)} item trong {wall:.1f}s"
+        return table
+
+
+def run_jobs(jobs, args, on_done=None, on_error=None) -> None:
+    """
+    Chạy tối đa args.jobs item cùng lúc; mỗi item đi tuần tự qua các bước.
+
+    Trước mỗi bước, item phải giữ 1 slot của loại tài nguyên bước đó dùng
+    (download: mạng, extract: ffmpeg, transcribe: model), nên số ffmpeg/model
+    chạy đồng thời không vượt giới hạn dù có nhiều item. Output của từng item
+    được gom vào live view nhiều dòng; cuối lượt in bảng tổng kết.
+
+    Args:
+        jobs: iterable các (index, ctx) từ plan_item
+        on_done: callback(index, ctx) khi item hoàn tất
+        on_error: callback(index, ctx, exc) khi 1 bước lỗi (item bị bỏ qua)
+    """
+    limits = job_slot_limits(args)
+    slots = {name: threading.BoundedSemaphore(max(1, n)) for name, n in limits.items()}
+    view = JobsView(args.jobs, limits)
+    jobs = iter(jobs)
+    jobs_lock = threading.Lock()
+    callback_lock = threading.Lock()
+    stop = threading.Event()
+
+    def work():
+        _UI_STATE.quiet = True
+        while not stop.is_set():
+            _UI_STATE.sink = view.sink(None)
+            with jobs_lock:
+                job = next(jobs, None)
+            if job is None:
+                break
+            index, ctx = job
+            _UI_STATE.sink = view.sink(index)
+            view.update(index)
+            try:
+                for name, fn in _PIPELINE_STAGES:
+                    if stop.is_set():
+                        return
+                    if CHECKPOINT_STAGES.index(name) < ctx.get("resume_stages", 0):
+                        run_item_stage(ctx, name, fn, args)  # Bỏ qua, không cần slot
+                        continue
+                    view.update(index, stage=name, state="chờ slot")
+                    with slots[_STAGE_RESOURCES[name]]:
+                        view.update(index, state="chạy")
+                        run_item_stage(ctx, name, fn, args)
+                    view.stage_done(index, name)
+                finish_item(ctx)
+            except (Exception, SystemExit) as e:
+                view.update(index, state="lỗi")
+                with callback_lock:
+                    if on_error:
+                        on_error(index, ctx, e)
+                continue
+            view.update(index, stage="", state="xong")
+            with callback_lock:
+                if on_done:
+                    on_done(index, ctx)
+
+    threads = [threading.Thread(target=work, daemon=True, name=f"jobs-{n}") for n in range(args.jobs)]
+    try:
+        with Live(view, console=console, refresh_per_second=4, transient=False):
+            for t in threads:
+                t.start()
+            # join có timeout để main thread vẫn nhận được Ctrl+C
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+    console.print()
+    console.print(view.summary())
+
+
+# ---------------------------------------------------------------------------
+# Live HLS: poll playlist đang tăng, decode segment mới, nhận dạng theo cửa sổ
+# và ghi nối cue vào VTT
+# ---------------------------------------------------------------------------
+
+_LIVE_EDGE_SEGMENTS = 3  # Bắt đầu cách live edge 3 segment (theo khuyến nghị của HLS)
+
+
+class _LivePcmDecoder:
+    """ffmpeg chạy suốt phiên live: nhận segment qua stdin, trả PCM float32 16kHz qua stdout."""
+
+    def __init__(self):
+        cmd = ["ffmpeg", "-v", "error", "-i", "pipe:0"] + _pcm_output_args(["-vn", "-sn", "-dn"])
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self._buf = bytearray()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        while True:
+            data = self.process.stdout.read1(1 << 16)
+            if not data:
+                break
+            with self._lock:
+                self._buf += data
+
+    def write(self, data: bytes) -> None:
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    @property
+    def available(self) -> int:
+        """Số sample đã decode và chưa lấy ra."""
+        with self._lock:
+            return len(self._buf) // 4
+
+    def take(self, samples: int) -> "np.ndarray":
+        import numpy as np
+        with self._lock:
+            n = min(samples, len(self._buf) // 4) * 4
+            data = bytes(self._buf[:n])
+            del self._buf[:n]
+        return np.frombuffer(data, dtype=np.float32)
+
+    def peek(self, samples: int) -> "np.ndarray":
+        import numpy as np
+        with self._lock:
+            n = min(samples, len(self._buf) // 4) * 4
+            return np.frombuffer(bytes(self._buf[:n]), dtype=np.float32)
+
+    def finish(self) -> None:
+        """Đóng stdin và chờ ffmpeg xả hết PCM còn lại."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self._thread.join(timeout=5)
+
+
+def _quiet_cut(audio: "np.ndarray", search_seconds: float = 2.0) -> int:
+    """Vị trí cắt (sample) ở frame 30ms yên lặng nhất trong search_seconds cuối, tránh cắt giữa từ."""
+    import numpy as np
+    search = min(len(audio), int(search_seconds * PCM_SAMPLE_RATE))
+    n_frames = search // _VAD_FRAME_SAMPLES
+    if n_frames < 2:
+        return len(audio)
+    tail = audio[len(audio) - n_frames * _VAD_FRAME_SAMPLES:].reshape(n_frames, _VAD_FRAME_SAMPLES)
+    quietest = int(np.argmin(np.mean(np.square(tail), axis=1)))
+    return len(audio) - (n_frames - quietest) * _VAD_FRAME_SAMPLES + _VAD_FRAME_SAMPLES // 2
+
+
+def transcribe_live(m3u8_url: str, vtt_path: str, model_name: str = "small", lang: Optional[str] = None,
+                    profile: str = "fast", use_gpu: bool = True, window: float = 15.0, retries: int = 3) -> dict:
+    """
+    Nhận dạng 1 luồng HLS live.
+
+    Playlist được poll mỗi nửa target duration; segment mới được đẩy vào 1 ffmpeg
+    decode liên tục. Mỗi khi đủ `window` giây PCM, cửa sổ được nhận dạng (cắt ở
+    chỗ yên lặng nhất gần cuối) với prompt là tối đa _PROMPT_CONTEXT_CHARS ký tự
+    text của cửa sổ trước, rồi cue được ghi nối vào vtt_path ngay lập tức.
+
+    Độ trễ end-to-end của mỗi cửa sổ = thời điểm ghi cue - thời điểm segment
+    chứa cuối cửa sổ xuất hiện trong playlist. Trả về thống kê độ trễ.
+    """
+    media_url = select_audio_source(m3u8_url)
+    device = resolve_device(use_gpu)
+    dtype = "float16" if device == "cuda" else "float32"
+    model = get_model(model_name, device, dtype)
+    kwargs = build_transcribe_kwargs(profile, "transcribe", lang, device)
+    kwargs["verbose"] = None
+    base_prompt = kwargs.get("initial_prompt")
+
+    decoder = _LivePcmDecoder()
+    marks: List[tuple] = []  # (thời điểm kết thúc segment trên timeline, lúc thấy segment)
+    latencies: List[float] = []
+    state = {"offset": 0, "prompt": "", "cues": 0}
+    last_seq = None
+    last_init = None
+    stream_end = 0.0
+    window_samples = int(window * PCM_SAMPLE_RATE)
+
+    vtt = open(vtt_path, "w", encoding="utf-8")
+    vtt.write("WEBVTT\n\n")
+    vtt.flush()
+
+    def run_window(audio: "np.ndarray") -> None:
+        offset = state["offset"] / PCM_SAMPLE_RATE
+        window_end = offset + len(audio) / PCM_SAMPLE_RATE
+        kw = dict(kwargs)
+        if state["prompt"]:
+            kw["initial_prompt"] = state["prompt"]
+        with model_run_lock(model_name, device, dtype):
+            result = model.transcribe(audio, **kw)
+        texts = []
+        for seg in result.get("segments", []):
+            text = seg.get("text", "").strip()
+            if not text:
+                continue
+            start = offset + seg["start"]
+            end = min(offset + seg["end"], window_end)
+            vtt.write(f"{_format_timestamp(start)} --> {_format_timestamp(end)}\n{text}\n\n")
+            texts.append(text)
+            state["cues"] += 1
+        vtt.flush()
+        # Context giới hạn: chỉ mang theo phần cuối text của cửa sổ này
+        state["prompt"] = " ".join(texts)[-_PROMPT_CONTEXT_CHARS:] or (base_prompt or "")
+        state["offset"] += len(audio)
+
+        seen = next((t for end, t in marks if end >= window_end - 1e-3), marks[-1][1] if marks else time.time())
+        latency = time.time() - seen
+        latencies.append(latency)
+        console.print(f"   [cyan]{_format_timestamp(offset)} → {_format_timestamp(window_end)}[/cyan] "
+                      f"[green]+{len(texts)} cues[/green] [dim](độ trễ {latency:.1f}s)[/dim]")
+        for text in texts:
+            console.print(f"     [dim]{text}[/dim]")
+
+    def drain(final: bool = False) -> None:
+        while decoder.available >= window_samples or (final and decoder.available > _VAD_FRAME_SAMPLES):
+            chunk = decoder.peek(window_samples)
+            cut = len(chunk) if final and len(chunk) < window_samples else _quiet_cut(chunk)
+            run_window(decoder.take(cut))
+
+    console.print(Panel(
+        f"[bold green]LIVE[/bold green] [cyan]{media_url}[/cyan]\n\n"
+        f"[dim]Cửa sổ {window:.0f}s, profile {profile}, model {model_name}. Cue được ghi nối vào:[/dim]\n"
+        f"[yellow]{vtt_path}[/yellow]\n\n[dim]Nhấn Ctrl+C để dừng.[/dim]",
+        title="[bold cyan]Live Transcription[/bold cyan]",
+        border_style="cyan"
+    ))
+    try:
+        while True:
+            poll_start = time.time()
+            playlist = parse_media_playlist(_fetch_text(media_url), media_url)
+            segments = playlist["segments"]
+            if last_seq is None and not playlist["endlist"]:
+                segments = segments[-_LIVE_EDGE_SEGMENTS:]
+            new = [s for s in segments if last_seq is None or s.sequence > last_seq]
+            for seg in new:
+                data = fetch_hls_segment(seg, retries)
+                if seg.init_uri and (seg.init_uri, seg.init_byterange) != last_init:
+                    decoder.write(_http_get_with_retry(seg.init_uri, seg.init_byterange, retries=retries))
+                    last_init = (seg.init_uri, seg.init_byterange)
+                decoder.write(data)
+                stream_end += seg.duration
+                marks.append((stream_end, poll_start))
+                last_seq = seg.sequence
+            # Chờ ffmpeg decode kịp phần vừa ghi trước khi quyết định cắt cửa sổ
+            time.sleep(0.2)
+            drain()
+            if playlist["endlist"]:
+                break
+            interval = max(playlist["target_duration"] / 2, 1.0)
+            time.sleep(max(0.0, interval - (time.time() - poll_start)))
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Dừng live, đang xử lý phần audio còn lại...[/yellow]")
+    finally:
+        decoder.finish()
+        drain(final=True)
+        vtt.close()
+
+    stats = {"cues": state["cues"], "windows": len(latencies), "duration": state["offset"] / PCM_SAMPLE_RATE}
+    if latencies:
+        ordered = sorted(latencies)
+        stats.update(latency_p50=ordered[len(ordered) // 2],
+                     latency_p95=ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                     latency_max=ordered[-1])
+        console.print(f"[bold green]✓ Live kết thúc:[/bold green] {stats['cues']} cues, {stats['windows']} cửa sổ, "
+                      f"độ trễ p50 {stats['latency_p50']:.1f}s / p95 {stats['latency_p95']:.1f}s / max {stats['latency_max']:.1f}s")
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Daemon: giữ model trong bộ nhớ, nhận job qua HTTP localhost; CLI làm thin client
+# ---------------------------------------------------------------------------
+
+DAEMON_DEFAULT_PORT = 8765
+DAEMON_TOKEN_HEADER = "X-Daemon-Token"
+
+# Các tùy chọn CLI mà client được gửi kèm job (ghi đè cấu hình của daemon)
+_DAEMON_JOB_OPTIONS = (
+    "language", "model", "output_prefix", "save_video", "save_audio", "save_vtt",
+    "create_thumbnails", "thumbnail_interval", "thumb_width", "thumb_height", "thumb_cols",
+    "thumb_format", "thumb_mode", "cdn_url", "no_gpu", "downloader", "download_workers",
+    "segment_retries", "no_resume", "audio_handoff", "vad", "cpu_workers", "profile",
+    "subtitle_formats", "window_seconds", "no_metrics",
+)
+
+
+def _get_daemon_token_path(port: int) -> str:
+    """Return path to daemon token file in home directory (client và daemon có thể khác cwd)."""
+    return os.path.join(os.path.expanduser("~"), f".whisper_m3u8_transcriber_daemon_{port}.token")
+
+
+def _write_daemon_token(port: int) -> str:
+    """Sinh token ngẫu nhiên cho lần chạy daemon này, ghi vào file chỉ chủ sở hữu đọc được (0600)."""
+    import secrets
+    token = secrets.token_urlsafe(32)
+    path = _get_daemon_token_path(port)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    # File đã tồn tại từ trước giữ mode cũ, đặt lại cho chắc
+    os.chmod(path, 0o600)
+    return token
+
+
+def _read_daemon_token(port: int) -> Optional[str]:
+    try:
+        with open(_get_daemon_token_path(port), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class TranscriptionDaemon:
+    """
+    Hàng đợi job chạy tuần tự trên 1 worker thread (model giữ lại giữa các job
+    qua model registry), kèm HTTP API trên 127.0.0.1:
+
+        GET    /health        -> trạng thái daemon
+        GET    /jobs          -> danh sách job
+        POST   /jobs          -> {"m3u8_url", "output_dir", "options"} -> job
+        GET    /jobs/<id>     -> trạng thái job
+        DELETE /jobs/<id>     -> hủy job đang chờ
+
+    Mọi request phải có Host là 127.0.0.1/localhost đúng cổng (chặn DNS
+    rebinding) và header X-Daemon-Token khớp token trong file 0600 ghi lúc
+    khởi động; POST phải là application/json (trang web không gửi được mà
+    không qua CORS preflight). output_dir phải nằm trong --daemon-root.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.root = os.path.realpath(args.daemon_root or os.getcwd())
+        self.token = ""
+        self.jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue: queue.Queue = queue.Queue()
+        self.started_at = time.time()
+        self._next_id = 1
+
+    def submit(self, payload: dict) -> dict:
+        if not isinstance(payload, dict):
+            raise ValueError("Body phải là JSON object")
+        m3u8_url = payload.get("m3u8_url", "")
+        output_dir = payload.get("output_dir", "")
+        if not validate_url(m3u8_url):
+            raise ValueError("URL m3u8 không hợp lệ")
+        if not output_dir or not os.path.isabs(output_dir):
+            raise ValueError("output_dir phải là đường dẫn tuyệt đối")
+        real_dir = os.path.realpath(output_dir)
+        if os.path.commonpath([self.root, real_dir]) != self.root:
+            raise ValueError(f"output_dir phải nằm trong {self.root}")
+        options = {k: v for k, v in (payload.get("options") or {}).items() if k in _DAEMON_JOB_OPTIONS}
+        prefix = options.get("output_prefix")
+        if prefix is not None and (not isinstance(prefix, str) or prefix in ("", ".", "..")
+                                   or "/" in prefix or "\\" in prefix):
+            raise ValueError("output_prefix không được chứa đường dẫn")
+        with self.lock:
+            job = {
+                "id": str(self._next_id),
+                "status": "queued",
+                "stage": None,
+                "m3u8_url": m3u8_url,
+                "output_dir": output_dir,
+                "options": options,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "outputs": [],
+            }
+            self._next_id += 1
+            self.jobs[job["id"]] = job
+        self.queue.put(job["id"])
+        console.print(f"[cyan]+ Job #{job['id']}[/cyan] [dim]{m3u8_url}[/dim]")
+        return self.snapshot(job["id"])
+
+    def snapshot(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job["status"] == "queued":
+                waiting = [j for j in self.jobs.values() if j["status"] == "queued"]
+                job["queue_position"] = next(i for i, j in enumerate(waiting) if j["id"] == job_id) + 1
+            return job
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] == "queued":
+                job.update(status="cancelled", finished_at=time.time())
+        return self.snapshot(job_id)
+
+    def _job_args(self, options: dict) -> argparse.Namespace:
+        merged = dict(vars(self.args))
+        merged.update(options)
+        return argparse.Namespace(**merged)
+
+    def _update(self, job: dict, **fields) -> None:
+        with self.lock:
+            job.update(fields)
+
+    def _run_job(self, job: dict) -> None:
+        args = self._job_args(job["options"])
+        os.makedirs(job["output_dir"], exist_ok=True)
+        ctx = plan_item(job["m3u8_url"], job["output_dir"], args, int(job["id"]), 0)
+        for name, fn in _PIPELINE_STAGES:
+            self._update(job, stage=name)
+            run_item_stage(ctx, name, fn, args)
+        finish_item(ctx)
+        self._update(job, outputs=_stage_artifacts(ctx, "item"), decode_stats=ctx.get("decode_stats"))
+
+    def worker(self) -> None:
+        while True:
+            job_id = self.queue.get()
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                job.update(status="running", started_at=time.time())
+            console.print(f"\n[bold cyan]▶ Job #{job_id}[/bold cyan] [dim]{job['m3u8_url']}[/dim]")
+            try:
+                self._run_job(job)
+            except (Exception, SystemExit) as e:
+                detail = str(e) if isinstance(e, Exception) else f"exit {e.code}"
+                self._update(job, status="failed", error=detail or type(e).__name__, finished_at=time.time())
+                console.print(f"[bold red]✗ Job #{job_id} lỗi:[/bold red] {detail}")
+                continue
+            self._update(job, status="done", stage=None, finished_at=time.time())
+            console.print(f"[bold green]✓ Job #{job_id} hoàn thành[/bold green]")
+
+    def health(self) -> dict:
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        with _MODEL_CACHE_LOCK:
+            models = [f"{k[0]} ({k[1]})" for k in _MODEL_CACHE.keys()]
+        return {"status": "ok", "pid": os.getpid(), "uptime": time.time() - self.started_at,
+                "jobs": counts, "models": models}
+
+    def make_handler(self):
+        daemon = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _send(self, status: int, body) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _job_id(self) -> Optional[str]:
+                parts = self.path.strip("/").split("/")
+                return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+            def _authorized(self) -> bool:
+                """Kiểm tra Host + token; gửi lỗi và trả False nếu không hợp lệ."""
+                import hmac
+                port = self.server.server_address[1]
+                if self.headers.get("Host", "") not in (f"127.0.0.1:{port}", f"localhost:{port}"):
+                    self._send(403, {"error": "Host không hợp lệ"})
+                    return False
+                token = self.headers.get(DAEMON_TOKEN_HEADER, "")
+                if not hmac.compare_digest(token.encode("utf-8"), daemon.token.encode("utf-8")):
+                    self._send(401, {"error": f"Thiếu hoặc sai {DAEMON_TOKEN_HEADER}"})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path == "/health":
+                    return self._send(200, daemon.health())
+                if self.path == "/jobs":
+                    with daemon.lock:
+                        ids = list(daemon.jobs.keys())
+                    return self._send(200, [daemon.snapshot(i) for i in ids])
+                job = daemon.snapshot(self._job_id() or "")
+                if job is None:
+                    return self._send(404, {"error": "Không tìm thấy job"})
+                self._send(200, job)
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                if self.path != "/jobs":
+                    return self._send(404, {"error": "Không tìm thấy"})
+                content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if content_type != "application/json":
+                    return self._send(415, {"error": "Content-Type phải là application/json"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    self._send(202, daemon.submit(payload))
+                except ValueError as e:
+                    self._send(400, {"error": str(e)})
+
+            def do_DELETE(self):
+                if not self._authorized():
+                    return
+                job = daemon.cancel(self._job_id() or "")
+                if job is None:
+                    return self._send(404, {"error": "Không tìm thấy job"})
+                self._send(200, job)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def serve(self, port: int) -> None:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self.make_handler())
+        self.token = _write_daemon_token(port)
+        threading.Thread(target=self.worker, daemon=True, name="daemon-worker").start()
+        console.print(Panel(
+            f"[bold green]Daemon đang chạy[/bold green] tại [cyan]http://127.0.0.1:{port}[/cyan]\n"
+            f"Thư mục output cho phép: [cyan]{self.root}[/cyan]\n"
+            f"Token: [cyan]{_get_daemon_token_path(port)}[/cyan]\n\n"
+            f"[dim]Model giữ lại giữa các job; CLI với --m3u8 và -d sẽ tự gửi job tới daemon.\n"
+            f"Nhấn Ctrl+C để dừng.[/dim]",
+            title="[bold cyan]Transcription Daemon[/bold cyan]",
+            border_style="cyan"
+        ))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            with contextlib.suppress(OSError):
+                os.remove(_get_daemon_token_path(port))
+            release_models()
+
+
+def _daemon_request(port: int, method: str, path: str, body: Optional[dict] = None,
+                    timeout: float = 5.0) -> tuple:
+    """Gọi API của daemon, trả về (status, json)."""
+    import http.client
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        token = _read_daemon_token(port)
+        if token:
+            headers[DAEMON_TOKEN_HEADER] = token
+        conn.request(method, path, body=data, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read() or b"null")
+    finally:
+        conn.close()
+
+
+def daemon_running(port: int) -> bool:
+    try:
+        status, body = _daemon_request(port, "GET", "/health", timeout=0.5)
+        return status == 200 and isinstance(body, dict) and body.get("status") == "ok"
+    except (OSError, ValueError):
+        return False
+
+
+def submit_to_daemon(port: int, m3u8_url: str, output_dir: str, args) -> bool:
+    """
+    Thin client: gửi job tới daemon rồi theo dõi trạng thái đến khi xong.
+    Trả về False nếu không có daemon đang chạy hoặc daemon từ chối job
+    (CLI tự xử lý như bình thường).
+    """
+    if not daemon_running(port):
+        return False
+    options = {k: getattr(args, k) for k in _DAEMON_JOB_OPTIONS if hasattr(args, k)}
+    status, job = _daemon_request(port, "POST", "/jobs", {
+        "m3u8_url": m3u8_url, "output_dir": os.path.abspath(output_dir), "options": options,
+    })
+    if status != 202:
+        # Bị từ chối (output ngoài --daemon-root, token sai...): tự xử lý trong process này
+        console.print(f"[yellow]Daemon từ chối job:[/yellow] {job.get('error') if isinstance(job, dict) else job}")
+        console.print("[dim]   Tự xử lý trong process này (thêm --no-daemon để bỏ qua daemon)[/dim]")
+        return False
+    console.print(f"[bold green]✓ Đã gửi job #{job['id']} tới daemon[/bold green] [dim](127.0.0.1:{port})[/dim]")
+
+    last = None
+    try:
+        while job["status"] in ("queued", "running"):
+            state = (job["status"], job.get("stage"), job.get("queue_position"))
+            if state != last:
+                if job["status"] == "queued":
+                    console.print(f"   [yellow]Đang chờ[/yellow] [dim](vị trí {job.get('queue_position')})[/dim]")
+                else:
+                    console.print(f"   [cyan]▶ {job.get('stage') or 'bắt đầu'}[/cyan]")
+                last = state
+            time.sleep(1)
+            _, job = _daemon_request(port, "GET", f"/jobs/{job['id']}")
+    except KeyboardInterrupt:
+        _, job = _daemon_request(port, "DELETE", f"/jobs/{job['id']}")
+        if job.get("status") == "cancelled":
+            console.print("\n[yellow]Đã hủy job trong hàng đợi[/yellow]")
+        else:
+            console.print(f"\n[yellow]Job #{job['id']} vẫn tiếp tục chạy trong daemon[/yellow]")
+        sys.exit(0)
+
+    if job["status"] != "done":
+        console.print(Panel(
+            f"[bold red]LỖI:[/bold red] Job #{job['id']} {job['status']}\n\n[red]Chi tiết:[/red] {job.get('error')}",
+            title="[bold red]Daemon Job Error[/bold red]",
+            border_style="red"
+        ))
+        sys.exit(1)
+    table = Table(title=f"[bold green]✓ HOÀN TẤT! (job #{job['id']})[/bold green]", box=box.DOUBLE)
+    table.add_column("File", style="yellow")
+    for path in job.get("outputs", []):
+        table.add_row(path)
+    console.print(table)
+    return True
 
 
 def main() -> None:
@@ -1133,7 +5351,7 @@ def main() -> None:
 def _main() -> None:
     parser = argparse.ArgumentParser(description="Tải video từ m3u8, tách audio và nhận dạng giọng nói bằng Whisper")
     parser.add_argument("--mode", choices=["direct", "batch"], help="Chế độ: 'direct' (nhập link trực tiếp) hoặc 'batch' (xử lý từ file JSON)")
-    parser.add_argument("--json", help="Đường dẫn file JSON (dùng cho mode batch)")
+    parser.add_argument("--json", help="Đường dẫn manifest JSON {root_path, items} hoặc JSON Lines, '-' để đọc từ stdin (dùng cho mode batch)")
     parser.add_argument("--m3u8", help="URL đến playlist m3u8 (nếu bỏ qua, bạn sẽ được nhắc)")
     parser.add_argument("-l", "--language", help="Mã ngôn ngữ để truyền cho Whisper (ví dụ: 'vi', 'en'). Nếu bỏ qua, bạn sẽ được nhắc.")
     parser.add_argument("-m", "--model", default="small", help="Mô hình Whisper để sử dụng (mặc định: small)")
@@ -1149,18 +5367,93 @@ def _main() -> None:
     parser.add_argument("--thumb-height", type=int, default=90, help="Chiều cao mỗi thumbnail (px, mặc định: 90)")
     parser.add_argument("--thumb-cols", type=int, default=10, help="Số cột trong sprite sheet (mặc định: 10)")
     parser.add_argument("--thumb-format", choices=["webp", "jpg"], default="webp", help="Định dạng ảnh sprite sheet (mặc định: webp)")
+    parser.add_argument("--thumb-mode", choices=["single-pass", "seek"], default="single-pass", help="Cách tạo sprite sheet: 'single-pass' (decode 1 lần) hoặc 'seek' (1 ffmpeg mỗi thumbnail) (mặc định: single-pass)")
     parser.add_argument("--cdn-url", help="URL CDN cho sprite sheet (ví dụ: https://cdn.example.com/thumbs/sprite.webp)")
     parser.add_argument("--no-gpu", action="store_true", help="Bắt buộc dùng CPU thay vì GPU")
+    parser.add_argument("--downloader", choices=["native", "ffmpeg"], default="native", help="Cách tải m3u8: 'native' (tải segment song song) hoặc 'ffmpeg' (tuần tự) (mặc định: native)")
+    parser.add_argument("--download-workers", type=int, default=8, help="Số segment tải song song với downloader native (mặc định: 8)")
+    parser.add_argument("--segment-retries", type=int, default=3, help="Số lần thử lại mỗi segment khi lỗi mạng (mặc định: 3)")
+    parser.add_argument("--no-resume", action="store_true", help="Không lưu segment đã tải để tiếp tục khi bị gián đoạn (downloader native)")
+    parser.add_argument("--jobs", type=int, default=1, help="Batch mode: số item xử lý cùng lúc, mỗi bước giữ 1 slot mạng/ffmpeg/model (mặc định: 1 = tuần tự)")
+    parser.add_argument("--net-slots", type=int, default=0, help="Số bước download chạy cùng lúc khi dùng --jobs (mặc định: 0 = bằng --jobs)")
+    parser.add_argument("--ffmpeg-slots", type=int, default=0, help="Số bước ffmpeg (tách audio, thumbnails) chạy cùng lúc khi dùng --jobs (mặc định: 0 = số core / 4)")
+    parser.add_argument("--model-slots", type=int, default=0, help="Số bước nhận dạng chạy cùng lúc khi dùng --jobs (mặc định: 0 = 1)")
+    parser.add_argument("--pipeline", action="store_true", help="Batch mode: chạy download/extract/transcribe của các item chồng lên nhau")
+    parser.add_argument("--pipeline-download-workers", type=int, default=1, help="Số item tải cùng lúc khi dùng --pipeline (mặc định: 1)")
+    parser.add_argument("--pipeline-extract-workers", type=int, default=1, help="Số item tách audio/thumbnails cùng lúc khi dùng --pipeline (mặc định: 1)")
+    parser.add_argument("--pipeline-transcribe-workers", type=int, default=1, help="Số item nhận dạng cùng lúc khi dùng --pipeline (mặc định: 1)")
+    parser.add_argument("--pipeline-queue", type=int, default=1, help="Số item tối đa chờ giữa 2 bước khi dùng --pipeline (mặc định: 1)")
+    parser.add_argument("--subtitle-formats", nargs="+", choices=SUBTITLE_FORMATS, default=["vtt"], help="Định dạng phụ đề được ghi dần trong lúc nhận dạng (file .part, rename khi xong): vtt, srt, json (mặc định: vtt)")
+    parser.add_argument("--audio-handoff", choices=["memory", "file"], default="memory", help="Cách đưa audio cho Whisper: 'memory' (PCM từ 1 lượt decode, WAV chỉ ghi khi --save-audio) hoặc 'file' (ghi WAV rồi Whisper decode lại) (mặc định: memory)")
+    parser.add_argument("--vad", choices=["off", "energy", "silero"], default="off", help="Lọc vùng không có giọng nói trước khi nhận dạng: 'energy' (theo năng lượng, bỏ im lặng) hoặc 'silero' (model CPU, bỏ cả nhạc, cần pip install silero-vad) (mặc định: off)")
+    parser.add_argument("--cpu-workers", type=int, default=1, help="Khi chạy trên CPU: chia audio tại khoảng lặng và nhận dạng song song trên N process (mặc định: 1 = tắt)")
+    parser.add_argument("--window-seconds", type=float, default=None, help=f"Nhận dạng tuần tự theo cửa sổ N giây: PCM được đọc theo block và mel tính theo cửa sổ nên bộ nhớ không tăng theo độ dài audio; 0 = tắt (mặc định: tự dùng cửa sổ {WINDOW_DEFAULT_SECONDS}s khi audio dài hơn {WINDOW_AUTO_MIN_SECONDS // 3600} giờ)")
+    parser.add_argument("--profile", choices=list(DECODING_PROFILES), default="balanced", help="Decoding profile: 'fast' (greedy, không fallback), 'balanced' (fallback temperature, best_of 5), 'accurate' (thêm beam search); item trong JSON có thể ghi đè bằng khóa \"profile\" (mặc định: balanced)")
+    parser.add_argument("--result-cache-mb", type=int, default=1024, help="Giới hạn dung lượng (MB) cache kết quả nhận dạng, 0 = tắt cache (mặc định: 1024)")
+    parser.add_argument("--result-cache", choices=["list", "prune", "clear"], help="Quản lý cache kết quả rồi thoát: 'list' (xem), 'prune' (cắt về --result-cache-mb), 'clear' (xóa hết)")
+    parser.add_argument("--live", action="store_true", help="Nhận dạng luồng HLS live (cần --m3u8): poll playlist, ghi nối cue vào VTT khi đang phát")
+    parser.add_argument("--live-window", type=float, default=15.0, help="Độ dài mỗi cửa sổ nhận dạng ở chế độ live (giây, mặc định: 15)")
+    parser.add_argument("--serve", action="store_true", help="Chạy daemon giữ model trong bộ nhớ và nhận job qua HTTP 127.0.0.1 (xem --daemon-port)")
+    parser.add_argument("--daemon-port", type=int, default=DAEMON_DEFAULT_PORT, help=f"Cổng của daemon (mặc định: {DAEMON_DEFAULT_PORT})")
+    parser.add_argument("--daemon-root", help="Daemon chỉ ghi output vào thư mục con của thư mục này (mặc định: thư mục hiện tại khi chạy --serve)")
+    parser.add_argument("--plan", action="store_true", help="Batch mode: trước khi chạy, lấy thời lượng mỗi item từ #EXTINF của playlist (không tải media) để in tổng thời lượng và ETA theo RTF của các lần chạy trước")
+    parser.add_argument("--order", choices=BATCH_ORDERS, default="manifest", help="Batch mode: thứ tự chạy item: 'manifest' (theo file), 'longest' (dài trước, xếp việc song song đều hơn) hoặc 'shortest' (ngắn trước, có kết quả sớm); khác 'manifest' thì tự bật --plan (mặc định: manifest)")
+    parser.add_argument("--batch-id", help="Batch mode với --json -: tên checkpoint cho manifest đọc từ stdin; chạy lại với cùng --batch-id để resume (không có thì không resume)")
+    parser.add_argument("--no-dedupe", action="store_true", help="Batch mode: không gộp các item cùng nguồn (URL + playlist dạng chuẩn); mặc định nguồn trùng chỉ xử lý 1 lần, kết quả được hardlink/copy sang thư mục các item khác, kể cả giữa các lần chạy")
+    parser.add_argument("--no-metrics", action="store_true", help=f"Không ghi metrics từng bước (wall/CPU time, bytes, peak RSS, RTF) vào {METRICS_FILENAME} trong thư mục item")
+    parser.add_argument("--no-daemon", action="store_true", help="Không gửi job tới daemon đang chạy, tự xử lý trong process này")
+    parser.add_argument("--model-cache-mb", type=int, default=4096, help="Giới hạn bộ nhớ (MB) cho các model Whisper giữ lại giữa các item, 0 = không giới hạn (mặc định: 4096)")
     args = parser.parse_args()
+    set_model_cache_limit(args.model_cache_mb)
+    set_result_cache_limit(args.result_cache_mb)
+    
+    if args.result_cache:
+        if args.result_cache == "list":
+            display_result_cache()
+        else:
+            limit = 0 if args.result_cache == "clear" else args.result_cache_mb * 1024 * 1024
+            removed, freed = prune_result_cache(limit)
+            console.print(f"[bold green]✓ Đã xóa {removed} entries[/bold green] [dim]({freed / 1024 / 1024:.1f} MB)[/dim]")
+        return
+    
+    # Live HLS: ghi VTT tăng dần cho đến khi playlist kết thúc hoặc Ctrl+C
+    if args.live:
+        if not args.m3u8 or not validate_url(args.m3u8):
+            console.print("[bold red]LỖI:[/bold red] --live cần --m3u8 là URL hợp lệ")
+            sys.exit(1)
+        check_ffmpeg()
+        output_dir = args.output_dir or os.getcwd()
+        if args.group_name:
+            output_dir = os.path.join(output_dir, args.group_name)
+        os.makedirs(output_dir, exist_ok=True)
+        vtt_path = os.path.join(output_dir, f"{args.output_prefix}_{args.language or 'auto'}.vtt")
+        transcribe_live(args.m3u8, vtt_path, args.model, args.language, args.profile, not args.no_gpu,
+                        args.live_window, args.segment_retries)
+        return
+    
+    # Daemon: giữ model giữa các job
+    if args.serve:
+        check_ffmpeg()
+        TranscriptionDaemon(args).serve(args.daemon_port)
+        return
+    
+    # Thin client: đủ tham số không cần hỏi và có daemon đang chạy -> gửi job cho daemon
+    if not args.no_daemon and args.m3u8 and args.output_dir and args.mode in (None, "direct"):
+        output_dir = os.path.join(args.output_dir, args.group_name) if args.group_name else args.output_dir
+        if submit_to_daemon(args.daemon_port, args.m3u8, output_dir, args):
+            return
 
     # Kiểm tra FFmpeg
     check_ffmpeg()
     
-    # Kiểm tra GPU
+    # GPU được kiểm tra khi bắt đầu nhận dạng (tránh import torch khi không cần)
     use_gpu = not args.no_gpu
-    check_gpu()
     
     # Select mode if not provided
+    if args.json == "-":
+        # stdin là manifest: không đọc câu trả lời từ stdin, mọi câu hỏi dùng mặc định
+        console.stdin_busy = True
+        args.mode = args.mode or "batch"
     mode = args.mode
     if not mode:
         while True:            
@@ -1187,8 +5480,8 @@ def _main() -> None:
                 break
             elif choice == "3":
                 # Manage checkpoint
-                checkpoint = load_checkpoint()
-                if not checkpoint or not checkpoint.get("json_path"):
+                checkpoints = list_checkpoints()
+                if not checkpoints:
                     console.print(Panel(
                         "[yellow]Không tìm thấy checkpoint nào[/yellow]\n\n"
                         "[dim]Checkpoint sẽ được tạo tự động khi bạn chạy batch mode[/dim]",
@@ -1196,25 +5489,25 @@ def _main() -> None:
                         border_style="cyan"
                     ))
                 else:
-                    import datetime
-                    json_path_saved = checkpoint.get("json_path", "")
-                    last_index = checkpoint.get("last_index", 0)
-                    total = checkpoint.get("total", 0)
-                    timestamp = checkpoint.get("timestamp", 0)
-                    time_saved = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+                    table = Table(title="[bold green]CHECKPOINT HIỆN TẠI[/bold green]", box=box.ROUNDED)
+                    table.add_column("#", style="yellow", justify="center")
+                    table.add_column("File JSON", style="dim")
+                    table.add_column("Hoàn thành", style="green", justify="center")
+                    table.add_column("Bỏ qua", style="yellow", justify="center")
+                    table.add_column("Lỗi", style="red", justify="center")
+                    table.add_column("Lần lưu cuối", style="yellow")
+                    for n, cp in enumerate(checkpoints, start=1):
+                        time_saved = datetime.datetime.fromtimestamp(cp["updated_at"]).strftime("%Y-%m-%d %H:%M:%S")
+                        table.add_row(str(n), cp["json_path"], f"{cp['done'] or 0}/{cp['total']}", str(cp["skipped"] or 0),
+                                      str(cp["failed"] or 0), time_saved)
+                    console.print(table)
                     
-                    console.print(Panel(
-                        f"[bold green]CHECKPOINT HIỆN TẠI[/bold green]\n\n"
-                        f"[cyan]File JSON:[/cyan] [dim]{json_path_saved}[/dim]\n"
-                        f"[cyan]Tiến độ:[/cyan] [green]{last_index}/{total}[/green] items đã xử lý\n"
-                        f"[cyan]Lần lưu cuối:[/cyan] [yellow]{time_saved}[/yellow]\n"
-                        f"[cyan]Item tiếp theo:[/cyan] #{last_index + 1}",
-                        border_style="green"
-                    ))
-                    
-                    clear_choice = console.input("\n[bold yellow]Bạn có muốn xóa checkpoint này? (y/n):[/bold yellow] ").strip().lower()
-                    if clear_choice == "y":
+                    clear_choice = console.input(f"\n[bold yellow]Nhập # để xóa 1 checkpoint, 'a' để xóa tất cả, Enter để giữ nguyên:[/bold yellow] ").strip().lower()
+                    if clear_choice == "a":
                         clear_checkpoint()
+                        console.print("[green]✓ Đã xóa tất cả checkpoint[/green]")
+                    elif clear_choice.isdigit() and 1 <= int(clear_choice) <= len(checkpoints):
+                        clear_checkpoint(checkpoints[int(clear_choice) - 1]["json_path"])
                         console.print("[green]✓ Đã xóa checkpoint[/green]")
                     else:
                         console.print("[cyan]Checkpoint được giữ nguyên[/cyan]")
@@ -1239,7 +5532,7 @@ def _main() -> None:
             if not json_path:
                 json_path = console.input("\n[bold cyan]Nhập đường dẫn file JSON:[/bold cyan] ").strip()
             
-            if json_path and os.path.exists(json_path):
+            if json_path == "-" or (json_path and os.path.exists(json_path)):
                 break
             else:
                 console.print("[bold red]LỖI:[/bold red] File JSON không tồn tại! Vui lòng kiểm tra lại đường dẫn.")
@@ -1325,7 +5618,7 @@ def _main() -> None:
         
         # --- Ask language for transcription (if needed) ---
         language = args.language
-        need_transcription = args.save_vtt or (not args.save_video and not args.save_audio)
+        need_transcription = args.save_vtt or not (args.save_video or args.save_audio or args.create_thumbnails)
         
         if not language and need_transcription:
             table = Table(title="[bold cyan]CHỌN NGÔN NGỮ NHẬN DẠNG[/bold cyan]", box=box.DOUBLE_EDGE, show_lines=False)
@@ -1581,6 +5874,7 @@ def _main() -> None:
     # --- Tùy chọn chọn file cần lưu ---
     # Kiểm tra xem người dùng đã truyền CLI flags không
     has_save_flags = args.save_video or args.save_audio or args.save_vtt
+    only_thumbnails = False
     
     if has_save_flags:
         # Nếu có CLI flags, sử dụng chúng
@@ -1754,10 +6048,14 @@ def _main() -> None:
             if cdn_url:
                 console.print(f"[green]Sử dụng CDN URL:[/green] [cyan]{cdn_url}[/cyan]")
 
+    # Đồ thị bước tối thiểu cho các output được chọn (chỉ nhận dạng khi có phụ đề để lưu)
+    plan = plan_stages(save_video, save_audio, save_vtt, create_thumbnails)
+
     console.print(Panel(
         "[bold green]BẮT ĐẦU XỬ LÝ[/bold green]\n\n"
+        f"[blue]Các bước:[/blue] [yellow]{plan.describe()}[/yellow]\n\n"
         "[blue]Lưu ý:[/blue]\n"
-        "   • Video và Audio sẽ được tải về để xử lý\n"
+        "   • Chỉ tải video khi cần lưu video hoặc tạo thumbnails (không kèm audio nếu không cần), ngược lại chỉ tải audio\n"
         "   • Các file không được chọn sẽ tự động xóa sau khi hoàn tất",
         title="[bold cyan]Processing Started[/bold cyan]",
         border_style="cyan"
@@ -1769,26 +6067,37 @@ def _main() -> None:
     vtt_path = os.path.join(base_dir, f"{args.output_prefix}_{language or 'auto'}.vtt")
     thumbnail_vtt_path = os.path.join(base_dir, "thumbnails.vtt")
 
-    # Xử lý
-    video = download_from_m3u8(m3u8_link, video_path)
+    # Xử lý theo plan: tải -> [tách audio ∥ thumbnails] -> nhận dạng
+    audio = None
+    in_memory = args.audio_handoff == "memory" and plan.transcribe
+    branches = {}
+    if plan.need_video:
+        video = download_from_m3u8(m3u8_link, video_path, args.downloader, args.download_workers, args.segment_retries, not args.no_resume,
+                                   with_audio=plan.fetch == "av")
+        if plan.extract_audio:
+            branches["audio"] = lambda: extract_audio(video, audio_path, in_memory, save_audio)
+        if plan.thumbnails:
+            branches["thumbnails"] = lambda: extract_thumbnails(video_path, base_dir, thumbnail_interval, thumb_width, thumb_height,
+                                                                thumb_cols, thumb_format, args.thumb_mode)
+    elif plan.fetch == "audio":
+        audio = download_audio_from_m3u8(m3u8_link, audio_path, args.downloader, args.download_workers, args.segment_retries, not args.no_resume,
+                                         in_memory, save_audio)
+    results = run_branches(branches)
+    audio = results.get("audio", audio)
     
-    # Chỉ xử lý audio và transcription nếu cần
-    if need_transcription and not only_thumbnails:
-        audio = extract_audio(video, audio_path)
-        result = transcribe_audio(audio, model_name=args.model, lang=language, use_gpu=use_gpu)
-        
-        # Lưu các file theo lựa chọn của người dùng
-        if save_vtt:
-            save_subtitles(result, vtt_path)
-    else:
-        result = None
+    # Tạo VTT cho sprite sheet thumbnails nếu được yêu cầu
+    sprite_info = results.get("thumbnails") or {}
+    if sprite_info:
+        create_thumbnail_vtt(sprite_info, thumbnail_vtt_path, thumbnail_interval, cdn_url)
+    
+    # Chỉ transcription nếu cần; phụ đề được ghi dần trong lúc nhận dạng
+    if plan.transcribe and audio is not None:
+        transcribe_to_subtitles(audio, vtt_path, args.subtitle_formats, model_name=args.model, lang=language,
+                                use_gpu=use_gpu, vad=args.vad, cpu_workers=args.cpu_workers, profile=args.profile,
+                                window_seconds=args.window_seconds)
     
-    # Tạo sprite sheet thumbnails nếu được yêu cầu
-    sprite_info = {}
-    if create_thumbnails:
-        sprite_info = extract_thumbnails(video_path, base_dir, thumbnail_interval, thumb_width, thumb_height, thumb_cols, thumb_format)
-        if sprite_info:
-            create_thumbnail_vtt(sprite_info, thumbnail_vtt_path, thumbnail_interval, cdn_url)
+    audio = None
+    remove_pcm_spill(audio_path)
     
     # Dọn dẹp các file không cần thiết
     if (not save_video and os.path.exists(video_path)) or (not save_audio and os.path.exists(audio_path)):
@@ -1812,8 +6121,10 @@ def _main() -> None:
         table.add_row("Video", "video.mp4", "✓")
     if save_audio and os.path.exists(audio_path):
         table.add_row("Audio", "audio.wav", "✓")
-    if save_vtt and os.path.exists(vtt_path):
-        table.add_row("Phụ đề", os.path.basename(vtt_path), "✓")
+    if save_vtt:
+        for path in subtitle_paths(vtt_path, args.subtitle_formats):
+            if os.path.exists(path):
+                table.add_row("Phụ đề", os.path.basename(path), "✓")
     if sprite_info and os.path.exists(thumbnail_vtt_path):
         sprite_file = sprite_info.get("sprite_filename", "sprite.jpg")
         thumb_count = sprite_info.get("total_thumbs", 0)